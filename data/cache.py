@@ -0,0 +1,145 @@
+'''cache
+
+Process-wide LRU cache of decoded symbol arrays.
+
+Entries are {name: array} dicts read from one file for one symbol, keyed by
+(file path, mtime, symbol, what was read), so a rewritten file is never
+served stale.  The cache holds at most max_bytes of arrays and evicts the
+least recently used entries first.  With a spill directory, evicted entries
+go to .npy files there (up to spill_bytes) and are reloaded from disk
+instead of being decoded again.'''
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_CACHE_BYTES = 1 << 30
+DEFAULT_SPILL_BYTES = 8 << 30
+
+
+def entry_bytes(value):
+    return sum(array.nbytes for array in value.values())
+
+
+class ArrayCache:
+    '''LRU cache of {name: array} entries within a byte budget.'''
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, spill_dir=None,
+                 spill_bytes=DEFAULT_SPILL_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_bytes = spill_bytes
+        self.entries = OrderedDict()    # key -> value, least recently used first
+        self.spilled = OrderedDict()    # key -> (file stem, names, bytes)
+        self.bytes = 0
+        self.counters = dict.fromkeys(('hits', 'misses', 'evictions', 'spills', 'spill_hits'), 0)
+        self.lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, bytes=self.bytes, entries=len(self.entries),
+                        spilled=len(self.spilled))
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.spilled):
+                self._drop_spill(key)
+            self.entries.clear()
+            self.bytes = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return value
+            if key in self.spilled:
+                value = self._load_spill(key)
+                self.counters['spill_hits'] += 1
+                self._insert(key, value)
+                return value
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, key, value):
+        for array in value.values():
+            array.flags.writeable = False   # shared by every caller
+        with self.lock:
+            if key not in self.entries:
+                self._insert(key, value)
+        return value
+
+    @staticmethod
+    def file_key(path, symbol, what, mtime_ns=None):
+        '''Key of what (a tuple naming the arrays) of symbol in the file at
+        path, as of mtime_ns (by default its current mtime).'''
+        if mtime_ns is None:
+            mtime_ns = os.stat(path).st_mtime_ns
+        return (path, mtime_ns, symbol, tuple(what))
+
+    def fetch(self, path, symbol, what, load):
+        '''Cached result of load() for what (a tuple naming the arrays) of
+        symbol in the file at path, loading it on a miss.'''
+        key = self.file_key(path, symbol, what)
+        value = self.get(key)
+        if value is None:
+            value = load()
+            if self.max_bytes:
+                self.put(key, value)
+        return value
+
+    def _insert(self, key, value):
+        size = entry_bytes(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            old_key, old = self.entries.popitem(last=False)
+            self.bytes -= entry_bytes(old)
+            self.counters['evictions'] += 1
+            if self.spill_dir:
+                self._spill(old_key, old)
+
+    def _spill_file(self, stem, name):
+        return os.path.join(self.spill_dir, f'{stem}.{name}.npy')
+
+    def _spill(self, key, value):
+        if key in self.spilled:
+            return
+        stem = hashlib.sha1(repr(key).encode()).hexdigest()
+        for name, array in value.items():
+            np.save(self._spill_file(stem, name), array)
+        self.spilled[key] = (stem, tuple(value), entry_bytes(value))
+        self.counters['spills'] += 1
+        while sum(size for _, _, size in self.spilled.values()) > self.spill_bytes:
+            self._drop_spill(next(iter(self.spilled)))
+
+    def _load_spill(self, key):
+        stem, names, _ = self.spilled[key]
+        self.spilled.move_to_end(key)
+        return {name: np.load(self._spill_file(stem, name), mmap_mode='r') for name in names}
+
+    def _drop_spill(self, key):
+        stem, names, _ = self.spilled.pop(key)
+        for name in names:
+            try:
+                os.remove(self._spill_file(stem, name))
+            except FileNotFoundError:
+                pass
+
+
+CACHE = ArrayCache()
+
+
+def configure_cache(max_bytes=DEFAULT_CACHE_BYTES, spill_dir=None, spill_bytes=DEFAULT_SPILL_BYTES):
+    '''Replace the process-wide cache; max_bytes=0 turns caching off.'''
+    global CACHE
+    CACHE = ArrayCache(max_bytes, spill_dir, spill_bytes)
+    return CACHE
@@ -0,0 +1,198 @@
+'''catalog
+
+Per-directory catalog of the day files in an HDF5 archive.
+
+Each archive directory holds one small catalog.h5 with a /days/{file name}
+table per day file: one row per symbol with its trade count, first and last
+timestamp and bytes stored.  Loaders consult it to open only the files and
+groups that hold a symbol in the requested range, and screens read the
+universe from it instead of from some day file.'''
+
+import os
+from glob import glob
+
+import h5py
+import numpy as np
+
+from utils.hdf5_handler import TRADE_COLUMNS, trade_rows
+
+CATALOG_NAME = 'catalog.h5'
+ENTRY_DTYPE = np.dtype([
+    ('symbol', 'S16'),
+    ('rows', 'i8'),
+    ('min_ts', 'i8'),
+    ('max_ts', 'i8'),
+    ('bytes', 'i8'),
+])
+
+# {catalog path: ((mtime_ns, size), {file name: table or None}, [all read])}
+_tables = {}
+
+
+def catalog_path(directory):
+    return os.path.join(directory, CATALOG_NAME)
+
+
+def describe_day_file(h5filepath):
+    '''Catalog entries of one day file, sorted by symbol.'''
+    with h5py.File(h5filepath, 'r') as h5f:
+        trades = h5f.get('trades', {})
+        entries = np.zeros(len(trades), dtype=ENTRY_DTYPE)
+        for i, symbol in enumerate(sorted(trades)):
+            node = trades[symbol]
+            rows = trade_rows(h5f, f'/trades/{symbol}')
+            if isinstance(node, h5py.Dataset):
+                ts, stored = node.fields('ts'), node.id.get_storage_size()
+            else:
+                ts = node['ts']
+                stored = sum(node[name].id.get_storage_size() for name in TRADE_COLUMNS)
+            entries[i] = (symbol.encode(), rows,
+                          ts[0] if rows else 0, ts[rows - 1] if rows else 0, stored)
+    return entries
+
+
+def update_catalog(h5filepath, entries=None):
+    '''Record (or refresh) one day file in its directory's catalog.
+
+    Not safe against concurrent writers: bulk ingest updates the catalog
+    from the parent process only.'''
+    if entries is None:
+        entries = describe_day_file(h5filepath)
+    stat = os.stat(h5filepath)
+    directory, name = os.path.split(os.path.abspath(h5filepath))
+    with h5py.File(catalog_path(directory), 'a') as catalog:
+        path = f'/days/{name}'
+        if path in catalog:
+            del catalog[path]
+        table = catalog.create_dataset(path, data=entries)
+        table.attrs.update({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+
+
+def remove_from_catalog(directory, names):
+    '''Drop the tables of day files (by file name) from a directory's
+    catalog, e.g. once compaction has deleted them.'''
+    path = catalog_path(directory)
+    if not os.path.isfile(path):
+        return
+    with h5py.File(path, 'a') as catalog:
+        for name in names:
+            if f'days/{name}' in catalog:
+                del catalog[f'days/{name}']
+
+
+def build_catalog(directory, pattern='*.h5'):
+    '''Catalog every day file in directory that is new or changed since it
+    was last catalogued. Returns the number of files (re)catalogued.'''
+    known = load_catalog(directory, check=True) or {}
+    updated = 0
+    for h5filepath in sorted(glob(os.path.join(directory, pattern))):
+        name = os.path.basename(h5filepath)
+        if name == CATALOG_NAME or name in known:
+            continue
+        try:
+            entries = describe_day_file(h5filepath)
+        except OSError as e:
+            print(f'skip {h5filepath}: {e}')
+            continue
+        update_catalog(h5filepath, entries)
+        updated += 1
+    return updated
+
+
+def _catalog_tables(directory, names):
+    '''{file name: (entries, size, mtime_ns)} of names (None for all) in a
+    directory's catalog, or None without one. Tables are kept once read,
+    until the catalog changes, so a file's table is read at most once.'''
+    path = catalog_path(directory)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _tables.get(path)
+    if cached is None or cached[0] != version:
+        cached = _tables[path] = (version, {}, [False])
+    _, tables, complete = cached
+    missing = [] if complete[0] else None if names is None \
+        else [name for name in names if name not in tables]
+    if missing is None or missing:
+        with h5py.File(path, 'r') as catalog:
+            days = catalog.get('days', {})
+            for name in days if missing is None else missing:
+                table = days.get(name)
+                tables[name] = None if table is None else \
+                    (table[:], table.attrs['size'], table.attrs['mtime_ns'])
+        complete[0] = complete[0] or missing is None
+    wanted = tables if names is None else {name: tables.get(name) for name in names}
+    return {name: day for name, day in wanted.items() if day is not None}
+
+
+def load_catalog(directory, check=False, names=None):
+    '''{file name: entries} of a directory's catalog, or None without one.
+
+    With names only the tables of those files are read and returned. With
+    check, files changed or removed since they were catalogued are left
+    out.'''
+    days = _catalog_tables(directory, names)
+    if days is None:
+        return None
+    if check:
+        def current(name, size, mtime_ns):
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except FileNotFoundError:
+                return False
+            return stat.st_size == size and stat.st_mtime_ns == mtime_ns
+        days = {name: day for name, day in days.items() if current(name, *day[1:])}
+    return {name: entries for name, (entries, _, _) in days.items()}
+
+
+def date_catalog(dates, file_path_template):
+    '''Catalog entries of just the day files of dates, {} without a
+    catalog.'''
+    return load_catalog(os.path.dirname(file_path_template.format('')),
+                        names=[os.path.basename(file_path_template.format(date))
+                               for date in dates]) or {}
+
+
+def lookup(entries, symbol):
+    '''The catalog entry of symbol in one day's entries, or None.'''
+    key = symbol.encode()
+    i = np.searchsorted(entries['symbol'], key)
+    return entries[i] if i < len(entries) and entries['symbol'][i] == key else None
+
+
+def day_files(symbol, dates, file_path_template, start_ts=None, end_ts=None, catalog=None):
+    '''Day files among dates that hold trades of symbol, with start_ts <=
+    ts < end_ts when given.
+
+    Dates in the catalog are decided from it without touching their files;
+    any others fall back to an existence check.'''
+    if catalog is None:
+        catalog = date_catalog(dates, file_path_template)
+    paths = []
+    for date in dates:
+        path = file_path_template.format(date)
+        entries = catalog.get(os.path.basename(path))
+        if entries is None:
+            if os.path.isfile(path):
+                paths.append(path)
+            continue
+        entry = lookup(entries, symbol)
+        if entry is None or entry['rows'] == 0:
+            continue
+        if start_ts is not None and entry['max_ts'] < start_ts:
+            continue
+        if end_ts is not None and entry['min_ts'] >= end_ts:
+            continue
+        paths.append(path)
+    return paths
+
+
+def universe(catalog, names=None):
+    '''Sorted symbols traded in the given catalogued files (default all).'''
+    symbols = set()
+    for name in catalog if names is None else names:
+        if name in catalog:
+            symbols.update(catalog[name]['symbol'][catalog[name]['rows'] > 0].tolist())
+    return sorted(s.decode() for s in symbols)
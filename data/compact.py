@@ -0,0 +1,269 @@
+'''compact
+
+Symbol-major compaction of daily HDF5 files into monthly (or longer) stores.
+
+A store holds every symbol's trades for all of its days in one set of column
+datasets, written symbol after symbol, so a multi-month load of one symbol
+is a single open and a few large reads instead of one per day.  Each symbol
+group carries a day table with the row offset, row count and first/last ts
+of every day, which keeps single-day reads cheap.  Stores live next to the
+day files in compacted/{YYYYMM}.h5; loaders use them for the days they
+cover and fall back to the day files for the rest.'''
+
+import os
+import time
+from glob import glob
+
+import h5py
+import numpy as np
+
+from data.catalog import date_catalog, day_files, remove_from_catalog
+from utils.hdf5_handler import (FORMAT_VERSION, LIBVER, PRICE_SCALE_ATTR, TRADE_COLUMNS,
+                                TradeWriter, build_day_bars, has_ticks, read_trades, row_range,
+                                trade_columns)
+from utils.ohlc import as_prices, bar_starts, stored_hours
+
+STORE_DIR = 'compacted'
+DAY_TABLE = 'days'
+DAY_DTYPE = np.dtype([
+    ('date', 'S8'),
+    ('first', 'i8'),
+    ('rows', 'i8'),
+    ('min_ts', 'i8'),
+    ('max_ts', 'i8'),
+])
+
+# {directory: (mtime_ns, {date: store path})}
+_covered = {}
+
+
+def period_key(date, months=1):
+    '''YYYYMM of the first month of the period of months holding date.'''
+    year, month = int(date[:4]), int(date[4:6])
+    return f'{year}{(month - 1) // months * months + 1:02d}'
+
+
+def store_dir(file_path_template):
+    return os.path.join(os.path.dirname(file_path_template.format('')), STORE_DIR)
+
+
+def store_path(file_path_template, key):
+    return os.path.join(store_dir(file_path_template), f'{key}.h5')
+
+
+def compact(file_path_template, dates, key, remove=False, ticks=None):
+    '''Merge the day files of dates into the store key.
+
+    Day files are read once each, in date order, into a scratch file; the
+    store is then copied out of it symbol by symbol so each symbol's chunks
+    sit together on disk. The store holds prices in ticks, or as floats
+    without ticks; by default as the first day file does, with the days
+    that differ converted. With remove the day files are deleted
+    afterwards, and dropped from the catalog. Returns the store path.'''
+    sources = [(date, file_path_template.format(date)) for date in sorted(dates)]
+    sources = [(date, path) for date, path in sources if os.path.isfile(path)]
+    path = store_path(file_path_template, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    scratch = path + '.tmp'
+    if ticks is None:
+        ticks = False
+        if sources:
+            with h5py.File(sources[0][1], 'r') as day:
+                ticks = has_ticks(day)
+    record_dtype = np.dtype(list(trade_columns(ticks).items()))
+
+    tables = {}
+    with h5py.File(scratch, 'w', libver=LIBVER) as out:
+        with TradeWriter(out, ticks=ticks) as writer:
+            for date, day_path in sources:
+                with h5py.File(day_path, 'r') as day:
+                    for symbol in day.get('trades', {}):
+                        columns = read_trades(day, symbol)
+                        columns['price'] = as_prices(columns['price'], ticks)
+                        trades = np.empty(len(columns['ts']), dtype=record_dtype)
+                        for name in TRADE_COLUMNS:
+                            trades[name] = columns[name]
+                        if len(trades) == 0:
+                            continue
+                        table = tables.setdefault(symbol, [])
+                        first = table[-1][1] + table[-1][2] if table else 0
+                        table.append((date, first, len(trades), trades['ts'][0], trades['ts'][-1]))
+                        writer.append(f'/trades/{symbol}', trades)
+        for symbol, table in tables.items():
+            out[f'/trades/{symbol}'].create_dataset(DAY_TABLE, data=np.array(table, dtype=DAY_DTYPE))
+        build_day_bars(out)
+
+    with h5py.File(scratch, 'r') as src, h5py.File(path + '.new', 'w', libver=LIBVER) as dst:
+        dst.attrs['format_version'] = FORMAT_VERSION
+        if ticks:
+            dst.attrs[PRICE_SCALE_ATTR] = src.attrs[PRICE_SCALE_ATTR]
+        dst.attrs['dates'] = np.array([date for date, _ in sources], dtype='S8')
+        for symbol in sorted(tables):
+            src.copy(src[f'trades/{symbol}'], dst, f'trades/{symbol}')
+            for interval in src.get('bars', {}):
+                src.copy(src[f'bars/{interval}/{symbol}'], dst, f'bars/{interval}/{symbol}')
+    os.replace(path + '.new', path)
+    os.remove(scratch)
+
+    if remove:
+        for _, day_path in sources:
+            os.remove(day_path)
+        remove_from_catalog(os.path.dirname(file_path_template.format('')),
+                            [os.path.basename(day_path) for _, day_path in sources])
+    return path
+
+
+def period_end(key, months=1):
+    '''YYYYMMDD of the first day after the period of months starting at
+    month key.'''
+    month = int(key[:4]) * 12 + int(key[4:6]) - 1 + months
+    return f'{month // 12}{month % 12 + 1:02d}01'
+
+
+def compact_archive(file_path_template, months=1, remove=False, pattern='????????', ticks=None,
+                    today=None):
+    '''Compact every finished period of day files that has no store yet.
+
+    A store is written once, so a period still running on today (YYYYMMDD,
+    default the current date) is left as day files until it is over.'''
+    today = today or time.strftime('%Y%m%d')
+    directory = os.path.dirname(file_path_template.format(''))
+    dates = sorted(os.path.basename(p)[:8]
+                   for p in glob(file_path_template.format(pattern)))
+    periods = {}
+    for date in dates:
+        periods.setdefault(period_key(date, months), []).append(date)
+    done = []
+    for key, period_dates in periods.items():
+        if period_end(key, months) > today:
+            print(f'skip {key} of {directory}: the period is not over')
+        elif not os.path.isfile(store_path(file_path_template, key)):
+            print(f'compacting {len(period_dates)} days of {directory} into {key}')
+            done.append(compact(file_path_template, period_dates, key, remove, ticks))
+    return done
+
+
+def compacted_dates(file_path_template):
+    '''{date: store path} of every date held by a store, cached until the
+    store directory changes.'''
+    directory = store_dir(file_path_template)
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _covered.get(directory)
+    if cached is None or cached[0] != mtime:
+        covered = {}
+        for path in sorted(glob(os.path.join(directory, '*.h5'))):
+            with h5py.File(path, 'r') as store:
+                covered.update((date.decode(), path) for date in store.attrs['dates'])
+        _covered[directory] = cached = (mtime, covered)
+    return cached[1]
+
+
+def symbol_sources(symbol, dates, file_path_template, start_ts=None, end_ts=None, catalog=None):
+    '''Where to read symbol for dates, in date order: (path, None) for a day
+    file, or (path, [dates]) for the dates of a store.'''
+    covered = compacted_dates(file_path_template)
+    if catalog is None:
+        catalog = date_catalog(dates, file_path_template)
+    sources = []
+    for date in dates:
+        path = covered.get(date)
+        if path is None:
+            sources.extend((day, None) for day in day_files(symbol, [date], file_path_template,
+                                                            start_ts, end_ts, catalog))
+        elif sources and sources[-1][0] == path:
+            sources[-1][1].append(date)
+        else:
+            sources.append((path, [date]))
+    return sources
+
+
+def archive_sources(dates, file_path_template):
+    '''Every file to read for dates, in date order, as symbol_sources gives
+    them: (path, None) for a day file, (path, [dates]) for a store.'''
+    covered = compacted_dates(file_path_template)
+    sources = []
+    for date in dates:
+        path = covered.get(date)
+        if path is None:
+            path = file_path_template.format(date)
+            if os.path.isfile(path):
+                sources.append((path, None))
+        elif sources and sources[-1][0] == path:
+            sources[-1][1].append(date)
+        else:
+            sources.append((path, [date]))
+    return sources
+
+
+def select_runs(table, dates, start_ts=None, end_ts=None):
+    '''Rows of a day table for dates, merged into runs of adjacent days.'''
+    keep = np.isin(table['date'], np.array(dates, dtype='S8'))
+    if start_ts is not None:
+        keep &= table['max_ts'] >= start_ts
+    if end_ts is not None:
+        keep &= table['min_ts'] < end_ts
+    table = table[keep]
+    if len(table) == 0:
+        return table
+    # a day starts a new run unless it follows straight on from the previous
+    starts = np.flatnonzero(np.r_[True, table['first'][1:] != table['first'][:-1] + table['rows'][:-1]])
+    ends = np.r_[starts[1:], len(table)] - 1
+    runs = table[starts].copy()
+    runs['rows'] = table['first'][ends] + table['rows'][ends] - table['first'][starts]
+    runs['max_ts'] = table['max_ts'][ends]
+    return runs
+
+
+def day_runs(h5f, symbol, dates, start_ts=None, end_ts=None):
+    '''Day table rows of symbol for dates in an open store, merged into
+    runs of adjacent days.'''
+    group = h5f.get(f'trades/{symbol}')
+    if group is None:
+        return np.empty(0, dtype=DAY_DTYPE)
+    return select_runs(group[DAY_TABLE][:], dates, start_ts, end_ts)
+
+
+def clip_runs(runs, lo=0, hi=np.iinfo(np.int64).max):
+    '''(first, stop) row slices of runs, clipped to rows lo..hi.'''
+    slices = []
+    for run in runs:
+        first = max(int(run['first']), lo)
+        stop = min(int(run['first'] + run['rows']), hi)
+        if first < stop:
+            slices.append((first, stop))
+    return slices
+
+
+def store_slices(h5f, symbol, dates, start_ts=None, end_ts=None):
+    '''(first, stop) row slices of symbol's trades on dates in an open
+    store, only those with start_ts <= ts < end_ts when given.'''
+    runs = day_runs(h5f, symbol, dates, start_ts, end_ts)
+    if len(runs) and (start_ts is not None or end_ts is not None):
+        return clip_runs(runs, *row_range(h5f, symbol, start_ts, end_ts))
+    return clip_runs(runs)
+
+
+def read_store_trades(h5f, symbol, dates, columns=tuple(TRADE_COLUMNS), start_ts=None, end_ts=None):
+    '''{column: array} of symbol's trades on dates from an open store, only
+    those with start_ts <= ts < end_ts when given.'''
+    slices = store_slices(h5f, symbol, dates, start_ts, end_ts)
+    return {name: np.concatenate([h5f[f'trades/{symbol}/{name}'][first:stop]
+                                  for first, stop in slices])
+            if slices else np.empty(0, dtype=trade_columns(has_ticks(h5f))[name]) for name in columns}
+
+
+def read_store_bars(h5f, symbol, dates, interval):
+    '''Bars of symbol on dates from an open store, or None without bars.'''
+    dataset = h5f.get(f'bars/{interval}/{symbol}')
+    if dataset is None:
+        return None
+    bars = dataset[:]
+    runs = day_runs(h5f, symbol, dates)
+    firsts = bar_starts(runs['min_ts'], interval, stored_hours(interval))
+    keep = np.zeros(len(bars), dtype=bool)
+    for first, run in zip(firsts, runs):
+        keep |= (bars['ts'] >= first) & (bars['ts'] <= run['max_ts'])
+    return bars[keep]
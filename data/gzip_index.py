@@ -0,0 +1,386 @@
+'''gzip_index
+
+Seekable access into .pcap.gz captures.
+
+A one-time pass over a capture records decompression checkpoints at deflate
+block boundaries (the zran technique): the compressed bit position, the
+uncompressed offset and the 32 KiB window preceding it, together with the
+IEX-TP send_time and first_msg_seq_no of the first packet after the
+checkpoint.  The index lives in a small HDF5 sidecar next to the capture.
+
+Building needs Z_BLOCK from the system zlib, reached through ctypes.  Reading
+only needs the zlib module: the compressed stream is re-aligned to the
+checkpoint bit and the window is handed over as the inflate dictionary.'''
+
+import ctypes
+import ctypes.util
+import os
+import zlib
+
+import h5py
+import numpy as np
+
+from data.pcap_io import (DEFAULT_BLOCK_SIZE, RECORD_HEADER_LEN, READ_SIZE,
+                          inflate_chunks, clip_chunks, iter_inflated_blocks,
+                          iter_packet_blocks, read_pcap_header, scan_records)
+from data.tops import TP_HEADER_DTYPE, gather, locate_segments
+
+INDEX_SUFFIX = '.idx.h5'
+DEFAULT_SPACING = 16 << 20  # uncompressed bytes between checkpoints
+WINDOW_SIZE = 32768
+OUT_SIZE = 4 * READ_SIZE
+TRACK_SIZE = 8 << 20
+
+Z_OK = 0
+Z_STREAM_END = 1
+Z_BLOCK = 5
+
+POINT_DTYPE = np.dtype([
+    ('in_offset', 'i8'),        # compressed byte holding the first unread bit
+    ('bits', 'u1'),             # unread bits left in the byte before in_offset
+    ('out_offset', 'i8'),       # uncompressed offset of the checkpoint
+    ('record_offset', 'i8'),    # first IEX packet record at or after out_offset
+    ('send_time', 'i8'),
+    ('first_msg_seq_no', 'i8'),
+])
+
+MEMBER_DTYPE = np.dtype([
+    ('in_offset', 'i8'),
+    ('out_offset', 'i8'),
+])
+
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [
+        ('next_in', ctypes.c_void_p),
+        ('avail_in', ctypes.c_uint),
+        ('total_in', ctypes.c_ulong),
+        ('next_out', ctypes.c_void_p),
+        ('avail_out', ctypes.c_uint),
+        ('total_out', ctypes.c_ulong),
+        ('msg', ctypes.c_char_p),
+        ('state', ctypes.c_void_p),
+        ('zalloc', ctypes.c_void_p),
+        ('zfree', ctypes.c_void_p),
+        ('opaque', ctypes.c_void_p),
+        ('data_type', ctypes.c_int),
+        ('adler', ctypes.c_ulong),
+        ('reserved', ctypes.c_ulong),
+    ]
+
+
+def _load_libz():
+    name = ctypes.util.find_library('z')
+    if name is None:
+        raise RuntimeError('Building a gzip index needs the system zlib (libz)')
+    libz = ctypes.CDLL(name)
+    libz.zlibVersion.restype = ctypes.c_char_p
+    return libz
+
+
+def index_path(filepath):
+    return filepath + INDEX_SUFFIX
+
+
+def build_index(filepath, spacing=DEFAULT_SPACING):
+    '''Scan a .pcap.gz once and write its checkpoint sidecar.
+
+    Returns the index as load_index would.'''
+    libz = _load_libz()
+    strm = _ZStream()
+    ret = libz.inflateInit2_(ctypes.byref(strm), 16 + zlib.MAX_WBITS,
+                             libz.zlibVersion(), ctypes.sizeof(strm))
+    if ret != Z_OK:
+        raise RuntimeError(f'inflateInit2 failed ({ret})')
+
+    in_buf = ctypes.create_string_buffer(READ_SIZE)
+    out_buf = ctypes.create_string_buffer(OUT_SIZE)
+    out_addr = ctypes.addressof(out_buf)
+    strm.next_out = out_addr
+    strm.avail_out = OUT_SIZE
+
+    candidates = []     # (in_offset, bits, out_offset, window) awaiting a packet
+    points = []
+    windows = []
+    members = [(0, 0)]
+    total_out = 0       # uncompressed bytes handed to track()
+    tail = b''          # last WINDOW_SIZE bytes of the current member
+    read_total = 0
+
+    pending = bytearray()
+    pending_base = 0
+    pcap_format = None
+
+    def track(final=False):
+        '''Resolve candidates against the packet records decoded so far.'''
+        nonlocal pending_base, pcap_format
+        if not pending or (len(pending) < TRACK_SIZE and not final):
+            return
+        pos = 0
+        if pcap_format is None:
+            pcap_format, pos = read_pcap_header(pending)
+        offsets, lengths, end = scan_records(pending, pcap_format, pos)
+        u8 = np.frombuffer(pending, dtype=np.uint8)
+        tp, _ = locate_segments(u8, offsets, lengths)
+        header = gather(u8, tp, TP_HEADER_DTYPE)
+        del u8
+
+        record = np.searchsorted(offsets, tp, side='right') - 1
+        starts = pending_base + offsets[record] - RECORD_HEADER_LEN[pcap_format[0]]
+        while candidates and len(starts) and candidates[0][2] <= starts[-1]:
+            in_offset, bits, out_offset, window = candidates.pop(0)
+            i = np.searchsorted(starts, out_offset)
+            points.append((in_offset, bits, out_offset, starts[i],
+                           header['send_time'][i], header['first_msg_seq_no'][i]))
+            windows.append(window)
+
+        del pending[:end]
+        pending_base += end
+
+    def flush():
+        nonlocal total_out, tail
+        produced = OUT_SIZE - strm.avail_out
+        if produced:
+            data = ctypes.string_at(out_addr, produced)
+            tail = (tail + data[-WINDOW_SIZE:])[-WINDOW_SIZE:]
+            pending.extend(data)
+            total_out += produced
+            track()
+        strm.next_out = out_addr
+        strm.avail_out = OUT_SIZE
+
+    try:
+        with open(filepath, 'rb') as fh:
+            while True:
+                if strm.avail_in == 0:
+                    n = fh.readinto(in_buf)
+                    if n == 0:
+                        break
+                    read_total += n
+                    strm.next_in = ctypes.addressof(in_buf)
+                    strm.avail_in = n
+
+                ret = libz.inflate(ctypes.byref(strm), Z_BLOCK)
+                in_offset = read_total - strm.avail_in
+                if ret == Z_STREAM_END:
+                    flush()
+                    members.append((in_offset, total_out))
+                    tail = b''
+                    libz.inflateReset(ctypes.byref(strm))
+                    continue
+                if ret != Z_OK:
+                    if members[-1][1] == total_out and len(members) > 1:
+                        break   # trailing padding after the last member
+                    raise ValueError(f'{filepath}: inflate failed ({ret})')
+
+                produced = OUT_SIZE - strm.avail_out
+                out_offset = total_out + produced
+                last = candidates[-1][2] if candidates else (points[-1][2] if points else 0)
+                at_block_end = strm.data_type & 128 and not strm.data_type & 64
+                if at_block_end and out_offset - last >= spacing:
+                    recent = ctypes.string_at(out_addr + max(0, produced - WINDOW_SIZE),
+                                              min(produced, WINDOW_SIZE))
+                    # tail is reset per member, so the window never reaches
+                    # back into the previous one
+                    window = (tail + recent)[-WINDOW_SIZE:]
+                    candidates.append((in_offset, strm.data_type & 7, out_offset, window))
+
+                if strm.avail_out == 0:
+                    flush()
+            flush()
+            track(final=True)
+    finally:
+        libz.inflateEnd(ctypes.byref(strm))
+
+    if members[-1][1] == total_out:
+        members.pop()   # reset after the final member, nothing followed
+
+    point_array = np.array(points, dtype=POINT_DTYPE)
+    stat = os.stat(filepath)
+    with h5py.File(index_path(filepath), 'w') as h5f:
+        h5f.create_dataset('points', data=point_array)
+        h5f.create_dataset('members', data=np.array(members, dtype=MEMBER_DTYPE))
+        vlen = h5py.vlen_dtype(np.uint8)
+        h5f.create_dataset('windows', (len(windows),), dtype=vlen)
+        for i, window in enumerate(windows):
+            h5f['windows'][i] = np.frombuffer(window, dtype=np.uint8)
+        h5f.attrs['pcap_kind'] = pcap_format[0] if pcap_format else ''
+        h5f.attrs['pcap_endian'] = pcap_format[1] if pcap_format else ''
+        h5f.attrs['capture_size'] = stat.st_size
+        h5f.attrs['capture_mtime_ns'] = stat.st_mtime_ns
+        h5f.attrs['uncompressed_size'] = total_out
+
+    return load_index(filepath, build=False)
+
+
+def _describes(h5f, stat):
+    '''Whether an open sidecar was built from a capture of this stat.'''
+    return (h5f.attrs['capture_size'] == stat.st_size
+            and h5f.attrs['capture_mtime_ns'] == stat.st_mtime_ns)
+
+
+def has_current_index(filepath):
+    '''Whether the capture has a sidecar built from its current contents.'''
+    path = index_path(filepath)
+    if not os.path.isfile(path):
+        return False
+    with h5py.File(path, 'r') as h5f:
+        return _describes(h5f, os.stat(filepath))
+
+
+def load_index(filepath, build=True):
+    '''Read the checkpoint sidecar of a capture, (re)building it if needed.
+
+    Returns a dict with the points and members arrays, the pcap format and
+    the sidecar path; windows are read from the sidecar on demand.'''
+    path = index_path(filepath)
+    stat = os.stat(filepath)
+    if os.path.isfile(path):
+        with h5py.File(path, 'r') as h5f:
+            if _describes(h5f, stat):
+                return {
+                    'path': path,
+                    'points': h5f['points'][:],
+                    'members': h5f['members'][:],
+                    'pcap_format': (str(h5f.attrs['pcap_kind']), str(h5f.attrs['pcap_endian'])),
+                    'uncompressed_size': int(h5f.attrs['uncompressed_size']),
+                }
+    if not build:
+        raise FileNotFoundError(f'No current gzip index for {filepath}')
+    return build_index(filepath)
+
+
+def _shift_chunks(fh, shift):
+    '''Compressed bytes re-aligned so that bit `shift` becomes bit 0.'''
+    held = b''
+    while True:
+        data = fh.read(READ_SIZE)
+        if not shift:
+            if not data:
+                return
+            yield data
+            continue
+        if not data:
+            if held:
+                yield bytes([held[0] >> shift])
+            return
+        raw = np.frombuffer(held + data, dtype=np.uint8).astype(np.uint16)
+        yield (((raw[:-1] >> shift) | (raw[1:] << (8 - shift))) & 0xFF).astype(np.uint8).tobytes()
+        held = data[-1:]
+
+
+def _inflate_from(fh, index, point):
+    '''Decompressed chunks from a checkpoint to the end of the capture.'''
+    entry = index['points'][point]
+    bitpos = int(entry['in_offset']) * 8 - int(entry['bits'])
+    with h5py.File(index['path'], 'r') as h5f:
+        window = h5f['windows'][point].tobytes()
+
+    fh.seek(bitpos // 8)
+    if window:
+        inflate = zlib.decompressobj(-zlib.MAX_WBITS, zdict=window)
+    else:
+        inflate = zlib.decompressobj(-zlib.MAX_WBITS)
+    for data in _shift_chunks(fh, bitpos % 8):
+        while data and not inflate.eof:
+            out = inflate.decompress(data, 4 * READ_SIZE)
+            if out:
+                yield out
+            data = inflate.unconsumed_tail
+        if inflate.eof:
+            break
+    else:
+        tail = inflate.flush()
+        if tail:
+            yield tail
+
+    # the raw stream ends with its member; carry on from the next one
+    members = index['members']
+    later = members[members['in_offset'] > entry['in_offset']]
+    if len(later):
+        fh.seek(int(later['in_offset'][0]))
+        yield from inflate_chunks(fh)
+
+
+def iter_segment_blocks(filepath, index, start=None, stop=None,
+                        block_size=DEFAULT_BLOCK_SIZE):
+    '''Packet blocks (as iter_packet_blocks) for the records that begin at
+    checkpoint number start (None for the capture start) and end before the
+    uncompressed offset stop (None for the capture end).'''
+    fh = open(filepath, 'rb')
+    try:
+        if start is None:
+            chunks = clip_chunks(inflate_chunks(fh), limit=stop)
+            yield from iter_inflated_blocks(chunks, block_size)
+            return
+        entry = index['points'][start]
+        skip = int(entry['record_offset'] - entry['out_offset'])
+        limit = None if stop is None else int(stop - entry['record_offset'])
+        chunks = clip_chunks(_inflate_from(fh, index, start), skip, limit)
+        yield from iter_inflated_blocks(chunks, block_size, index['pcap_format'],
+                                        base=int(entry['record_offset']))
+    finally:
+        fh.close()
+
+
+def iter_blocks_from(filepath, offset, block_size=DEFAULT_BLOCK_SIZE):
+    '''Packet blocks from the record boundary at uncompressed offset onward,
+    decompressing from the nearest checkpoint before it rather than from
+    the start of the capture.'''
+    index = load_index(filepath, build=False)
+    points = index['points']
+    point = np.searchsorted(points['out_offset'], offset, side='right') - 1
+    if point < 0:
+        yield from iter_packet_blocks(filepath, block_size, start=offset)
+        return
+    with open(filepath, 'rb') as fh:
+        skip = int(offset - points['out_offset'][point])
+        chunks = clip_chunks(_inflate_from(fh, index, int(point)), skip)
+        yield from iter_inflated_blocks(chunks, block_size, index['pcap_format'],
+                                        base=offset)
+
+
+def split_segments(index, parts):
+    '''Cut a capture into up to `parts` (start, stop) segments of similar
+    compressed size for iter_segment_blocks; together they cover every
+    record exactly once.'''
+    points = index['points']
+    if parts <= 1 or len(points) == 0:
+        return [(None, None)]
+    total = points['in_offset'][-1]
+    cuts = np.searchsorted(points['in_offset'], total * np.arange(1, parts) / parts)
+    cuts = np.unique(np.minimum(cuts, len(points) - 1))
+    starts = [None] + [int(c) for c in cuts]
+    stops = [int(points['record_offset'][c]) for c in cuts] + [None]
+    return list(zip(starts, stops))
+
+
+def iter_range_blocks(filepath, start_time=None, end_time=None,
+                      start_seq=None, end_seq=None, block_size=DEFAULT_BLOCK_SIZE):
+    '''Packet blocks covering a send_time and/or sequence number range.
+
+    Decompression starts at the last checkpoint before the range and stops
+    at the first one past it, so the blocks may hold packets just outside
+    the range; callers trim by timestamp or sequence number.'''
+    if not filepath.endswith('gz'):
+        yield from iter_packet_blocks(filepath, block_size)
+        return
+    index = load_index(filepath)
+    points = index['points']
+
+    start = -1
+    if start_time is not None:
+        start = max(start, np.searchsorted(points['send_time'], start_time, side='left') - 1)
+    if start_seq is not None:
+        start = max(start, np.searchsorted(points['first_msg_seq_no'], start_seq, side='right') - 1)
+
+    stop = len(points)
+    if end_time is not None:
+        stop = min(stop, np.searchsorted(points['send_time'], end_time, side='right'))
+    if end_seq is not None:
+        stop = min(stop, np.searchsorted(points['first_msg_seq_no'], end_seq, side='right'))
+
+    yield from iter_segment_blocks(filepath, index,
+                                   None if start < 0 else int(start),
+                                   None if stop >= len(points) else int(points['record_offset'][stop]),
+                                   block_size)
@@ -0,0 +1,247 @@
+'''ingest
+
+Bulk pcap(.gz) -> HDF5 ingest, one day file per capture, fanned out over a
+process pool.'''
+
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from glob import glob
+
+import h5py
+import numpy as np
+
+from data.catalog import update_catalog
+from data.gzip_index import has_current_index, iter_blocks_from
+from data.pcap_io import DEFAULT_BLOCK_SIZE, iter_packet_blocks
+from data.tops import decode_block
+from utils.hdf5_handler import (LIBVER, TradeWriter, build_day_bars, build_ts_indexes,
+                                has_ticks, rechunk_all_trades, split_by_symbol, truncate_trades)
+
+DEFAULT_H5_TEMPLATE = '/srv/b/h5/{}.h5'
+CAPTURE_PATTERNS = ('*.pcap', '*.pcap.gz', '*.pcapng', '*.pcapng.gz')
+
+# Set on the root group once a day file holds the whole capture
+COMPLETE_ATTR = 'ingest_complete'
+
+# Until then the root group carries the last durable checkpoint: the capture
+# offset and sequence number ingest has flushed up to, and /ingest/rows the
+# row count of every symbol's trades at that point.
+CHECKPOINT_ATTRS = ('checkpoint_offset', 'checkpoint_seq', 'checkpoint_trades')
+ROWS_PATH = '/ingest/rows'
+ROWS_DTYPE = np.dtype([('symbol', 'S16'), ('rows', 'i8')])
+
+date_in_name = re.compile(r'(?<!\d)(20\d{6})(?!\d)')
+
+
+def capture_date(filepath):
+    '''YYYYMMDD trading date of a capture, taken from its file name.'''
+    match = date_in_name.search(os.path.basename(filepath))
+    if match is None:
+        raise ValueError(f'No YYYYMMDD date in capture name {filepath}')
+    return match.group(1)
+
+
+def find_captures(source):
+    '''Captures in a directory, or matching a glob pattern, sorted by name.'''
+    if os.path.isdir(source):
+        paths = [p for pattern in CAPTURE_PATTERNS
+                 for p in glob(os.path.join(source, pattern))]
+    else:
+        paths = glob(source)
+    return sorted(set(paths))
+
+
+def is_complete(h5filepath):
+    '''True when a previous ingest finished writing h5filepath.'''
+    if not os.path.isfile(h5filepath):
+        return False
+    try:
+        with h5py.File(h5filepath, 'r') as h5f:
+            return bool(h5f.attrs.get(COMPLETE_ATTR, False))
+    except OSError:
+        return False    # truncated by a crash mid-write
+
+
+def capture_id(pcap_filepath):
+    '''Ties a checkpoint to the capture it was taken from.'''
+    return f'{os.path.basename(pcap_filepath)}:{os.path.getsize(pcap_filepath)}'
+
+
+def read_checkpoint(h5filepath, pcap_filepath):
+    '''Resume state of an unfinished day file, or None to start over.'''
+    if not os.path.isfile(h5filepath):
+        return None
+    try:
+        with h5py.File(h5filepath, 'r') as h5f:
+            attrs = h5f.attrs
+            if attrs.get('source') != capture_id(pcap_filepath) or 'checkpoint_offset' not in attrs:
+                return None
+            return {
+                'offset': int(attrs['checkpoint_offset']),
+                'seq': int(attrs['checkpoint_seq']),
+                'trades': int(attrs['checkpoint_trades']),
+                'missing': int(attrs.get('missing_messages', 0)),
+                'ticks': has_ticks(h5f),
+                'rows': {row['symbol'].decode(): int(row['rows']) for row in h5f[ROWS_PATH][:]},
+            }
+    except (OSError, KeyError):
+        return None     # truncated by a crash mid-write
+
+
+def rollback(h5f, rows):
+    '''Drop rows written after the checkpoint.'''
+    if 'trades' not in h5f:
+        return
+    for symbol in list(h5f['trades']):
+        if symbol not in rows:
+            del h5f['trades'][symbol]
+        else:
+            truncate_trades(h5f, f'/trades/{symbol}', rows[symbol])
+
+
+def write_checkpoint(h5f, rows, offset, seq, trades, missing):
+    table = np.array(list(rows.items()), dtype=ROWS_DTYPE)
+    if ROWS_PATH in h5f:
+        h5f[ROWS_PATH].resize(len(table), axis=0)
+        h5f[ROWS_PATH][...] = table
+    else:
+        h5f.create_dataset(ROWS_PATH, data=table, maxshape=(None,), chunks=True)
+    h5f.attrs.update({
+        'checkpoint_offset': offset,
+        'checkpoint_seq': seq,
+        'checkpoint_trades': trades,
+        'missing_messages': missing,
+    })
+
+
+def find_gaps(first_seq, msg_count, expected):
+    '''Sequence gaps between consecutive IEX-TP segments.
+
+    expected is the sequence number due next (None when unknown). Returns
+    (gaps, expected) with gaps an (n, 2) array of (expected, received).'''
+    if len(first_seq) == 0:
+        return np.empty((0, 2), dtype=np.int64), expected
+    due = np.empty_like(first_seq)
+    due[0] = first_seq[0] if expected is None else expected
+    due[1:] = first_seq[:-1] + msg_count[:-1]
+    gap = first_seq > due
+    return np.column_stack([due[gap], first_seq[gap]]), int(first_seq[-1] + msg_count[-1])
+
+
+def iter_capture_blocks(pcap_filepath, offset, block_size):
+    # a stale sidecar (the capture was replaced) is ignored, not an error
+    if offset and pcap_filepath.endswith('gz') and has_current_index(pcap_filepath):
+        return iter_blocks_from(pcap_filepath, offset, block_size)
+    return iter_packet_blocks(pcap_filepath, block_size, start=offset)
+
+
+def ingest_capture(pcap_filepath, h5filepath, block_size=DEFAULT_BLOCK_SIZE,
+                   symbols=None, ticks=False):
+    '''Decode one capture into its day file, optionally keeping only the
+    given symbols. With ticks the file is fixed-point: prices stay the
+    wire's int64 ticks from decode through storage and bars.
+
+    After every block the file is flushed and a checkpoint recorded, so a
+    rerun after a crash resumes from the last checkpoint instead of starting
+    over, unless the file was begun with the other kind of price. Sequence
+    gaps are reported as they are found. Once the capture is done the OHLCV
+    bar pyramid is built from the stored trades.
+
+    Returns (pcap_filepath, trades written, seconds, missing messages).'''
+    started = time.monotonic()
+    checkpoint = read_checkpoint(h5filepath, pcap_filepath)
+    if checkpoint and checkpoint['ticks'] != ticks:
+        print(f'restart {pcap_filepath}: {h5filepath} was begun with '
+              f'{"ticks" if checkpoint["ticks"] else "float prices"}')
+        checkpoint = None
+
+    with h5py.File(h5filepath, 'a' if checkpoint else 'w', libver=LIBVER) as h5f:
+        if checkpoint:
+            rollback(h5f, checkpoint['rows'])
+            rows, written, missing = checkpoint['rows'], checkpoint['trades'], checkpoint['missing']
+            offset, last_seq = checkpoint['offset'], checkpoint['seq']
+            # no sequence seen yet (only empty blocks before the crash)
+            expected = last_seq + 1 if last_seq >= 0 else None
+            print(f'resume {pcap_filepath} at offset {offset}, seq {last_seq}')
+        else:
+            h5f.attrs['source'] = capture_id(pcap_filepath)
+            rows, written, missing = {}, 0, 0
+            offset, last_seq, expected = 0, -1, None
+
+        writer = TradeWriter(h5f, ticks=ticks)
+        for view, offsets, lengths, base in iter_capture_blocks(pcap_filepath, offset, block_size):
+            trades, first_seq, msg_count = decode_block(view, offsets, lengths, symbols, ticks)
+            trades = trades[trades['seq'] > last_seq]
+
+            gaps, expected = find_gaps(first_seq, msg_count, expected)
+            for due, received in gaps:
+                print(f'{pcap_filepath}: sequence gap, expected {due} got {received}')
+                missing += int(received - due)
+
+            for symbol, chunk in split_by_symbol(trades):
+                writer.append(f'/trades/{symbol}', chunk)
+                rows[symbol] = rows.get(symbol, 0) + len(chunk)
+            writer.flush()
+            written += len(trades)
+            if expected is not None:
+                last_seq = expected - 1
+
+            # data must be on disk before the checkpoint that covers it
+            h5f.flush()
+            write_checkpoint(h5f, rows, base + len(view), last_seq, written, missing)
+            h5f.flush()
+
+        writer.close()
+        rechunk_all_trades(h5f)   # symbols untouched since a resume
+        build_ts_indexes(h5f)
+        build_day_bars(h5f)
+        for name in CHECKPOINT_ATTRS:
+            h5f.attrs.pop(name, None)
+        if 'ingest' in h5f:
+            del h5f['ingest']
+        h5f.attrs['missing_messages'] = missing
+        h5f.attrs[COMPLETE_ATTR] = True
+
+    return pcap_filepath, written, time.monotonic() - started, missing
+
+
+def bulk_ingest(source, h5_template=DEFAULT_H5_TEMPLATE, workers=None,
+                block_size=DEFAULT_BLOCK_SIZE, symbols=None, ticks=False):
+    '''Ingest every capture in source (a directory or glob) in parallel,
+    into day files with float prices, or fixed-point ones with ticks.
+
+    Days whose output is already complete are skipped. workers defaults to
+    the number of CPUs. Each finished day is added to the catalog of its
+    directory. Returns {pcap_filepath: error} for failed captures.'''
+    jobs = []
+    for pcap_filepath in find_captures(source):
+        h5filepath = h5_template.format(capture_date(pcap_filepath))
+        if is_complete(h5filepath):
+            print(f'skip {pcap_filepath}: {h5filepath} is complete')
+        else:
+            jobs.append((pcap_filepath, h5filepath))
+
+    print(f'Starting bulk_ingest of {len(jobs)} captures: {datetime.now()}')
+    failed = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(ingest_capture, pcap_filepath, h5filepath, block_size, symbols, ticks):
+                   (pcap_filepath, h5filepath) for pcap_filepath, h5filepath in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            pcap_filepath, h5filepath = futures[future]
+            try:
+                _, written, seconds, missing = future.result()
+            except Exception as e:
+                failed[pcap_filepath] = e
+                print(f'[{done}/{len(jobs)}] FAILED {pcap_filepath}: {e}')
+                continue
+            # only this process writes the catalog
+            update_catalog(h5filepath)
+            print(f'[{done}/{len(jobs)}] {pcap_filepath}: {written} trades '
+                  f'in {seconds:.1f}s ({written / max(seconds, 1e-9):,.0f}/s), '
+                  f'{missing} messages missing')
+
+    print(f'Finished bulk_ingest: {datetime.now()}')
+    return failed
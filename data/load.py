@@ -0,0 +1,268 @@
+'''load
+
+Bulk loaders for a symbol's trades over a run of days.
+
+Loading happens in two passes over the sources of a request: the first sizes
+every row slice from dataset shapes (and ts indexes for a time range), the
+second reads each slice with read_direct straight into its place in arrays
+allocated once for the whole result.  Both passes fan out over a thread
+pool, one task per file.  With the process-wide cache on (the default) the
+slices and the rows go through it, the rows in aligned blocks of
+CACHE_BLOCK_ROWS per column, so repeated and overlapping requests are
+assembled from memory and a range or single-day read still reads little
+more than its rows.'''
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+import pandas as pd
+
+import data.cache
+from data.catalog import date_catalog
+from data.compact import (archive_sources, read_store_bars, read_store_trades, store_slices,
+                          symbol_sources)
+from utils.hdf5_handler import (TS_INDEX_STRIDE, read_bars, read_trades, row_range, trade_columns,
+                                trade_rows)
+from utils.ohlc import as_bars, as_prices, ohlcv_bars, roll_up, stored_hours
+
+DEFAULT_WORKERS = 8
+
+# Rows per cached block of a column: a multiple of every chunk size below
+# it, so a block read decompresses no chunk it does not need, and small
+# enough that a range read reads little beyond its rows.
+CACHE_BLOCK_ROWS = TS_INDEX_STRIDE
+
+
+def date_strings(start_date, end_date):
+    '''YYYYMMDD strings of every day from start_date to end_date inclusive,
+    given as YYYYMMDD or YYYY-MM-DD.'''
+    start, end = (np.datetime64(f'{d[:4]}-{d[4:6]}-{d[6:]}' if '-' not in d else d, 'D')
+                  for d in (start_date, end_date))
+    days = np.arange(start, end + 1).astype(str)
+    return [day.replace('-', '') for day in days]
+
+
+def _slices(path, store_days, symbol, start_ts, end_ts):
+    try:
+        h5f = h5py.File(path, 'r')
+    except OSError as e:
+        print(f'skip {path}: {e}')     # e.g. a day file still being written
+        return []
+    with h5f:
+        if f'trades/{symbol}' not in h5f:
+            return []
+        if store_days is not None:
+            return store_slices(h5f, symbol, store_days, start_ts, end_ts)
+        if start_ts is None and end_ts is None:
+            first, stop = 0, trade_rows(h5f, f'/trades/{symbol}')
+        else:
+            first, stop = row_range(h5f, symbol, start_ts, end_ts)
+        return [(first, stop)] if stop > first else []
+
+
+def _read_into(path, symbol, slices, offset, out):
+    with h5py.File(path, 'r') as h5f:
+        node = h5f[f'trades/{symbol}']
+        for first, stop in slices:
+            dest = np.s_[offset:offset + stop - first]
+            for name, column in out.items():
+                if isinstance(node, h5py.Dataset):    # format 1
+                    values = node.fields(name)[first:stop]
+                elif node[name].dtype == column.dtype:
+                    node[name].read_direct(column, np.s_[first:stop], dest)
+                    continue
+                else:   # prices of the other kind
+                    values = node[name][first:stop]
+                column[dest] = as_prices(values, column.dtype.kind == 'i') \
+                    if name == 'price' else values
+            offset += stop - first
+
+
+def _cached_slices(path, store_days, symbol, start_ts, end_ts, cache):
+    '''(first, stop) row slices of a source, as _slices finds them, kept in
+    cache so a repeated request skips the index reads.'''
+    what = ('slices', start_ts, end_ts, *(store_days or ()))
+    try:
+        entry = cache.fetch(path, symbol, what, lambda: {'slices': np.array(
+            _slices(path, store_days, symbol, start_ts, end_ts), dtype=np.int64).reshape(-1, 2)})
+    except OSError as e:
+        print(f'skip {path}: {e}')
+        return []
+    return [(int(first), int(stop)) for first, stop in entry['slices']]
+
+
+def _read_cached(path, symbol, slices, offset, out, cache):
+    '''_read_into through cache, which holds each column of a file's rows
+    in CACHE_BLOCK_ROWS blocks, so overlapping requests share them. Blocks
+    a slice covers whole are read straight into out and cached from there;
+    those it covers in part are read whole, at most two per slice.'''
+    mtime_ns = os.stat(path).st_mtime_ns
+    h5f = node = rows = None
+    try:
+        for first, stop in slices:
+            for block in range(first // CACHE_BLOCK_ROWS, -(-stop // CACHE_BLOCK_ROWS)):
+                start = block * CACHE_BLOCK_ROWS
+                lo, hi = max(first, start), min(stop, start + CACHE_BLOCK_ROWS)
+                dest = np.s_[offset + lo - first:offset + hi - first]
+                for name, column in out.items():
+                    key = cache.file_key(path, symbol, ('block', block, name), mtime_ns)
+                    entry = cache.get(key)
+                    if entry is None:
+                        if h5f is None:
+                            h5f = h5py.File(path, 'r')
+                            node = h5f[f'trades/{symbol}']
+                            rows = trade_rows(h5f, f'/trades/{symbol}')
+                        end = min(start + CACHE_BLOCK_ROWS, rows)
+                        if isinstance(node, h5py.Dataset):    # format 1
+                            values = node.fields(name)[start:end]
+                        elif (lo, hi) == (start, end) and node[name].dtype == column.dtype:
+                            node[name].read_direct(column, np.s_[lo:hi], dest)
+                            cache.put(key, {name: column[dest].copy()})
+                            continue
+                        else:
+                            values = node[name][start:end]
+                        entry = cache.put(key, {name: values})
+                    values = entry[name][lo - start:hi - start]
+                    column[dest] = as_prices(values, column.dtype.kind == 'i') \
+                        if name == 'price' else values
+            offset += stop - first
+    finally:
+        if h5f is not None:
+            h5f.close()
+
+
+def load_trades(symbol, dates, file_path_template, columns=('ts', 'price'),
+                start_ts=None, end_ts=None, catalog=None, workers=DEFAULT_WORKERS,
+                cache=None, ticks=False):
+    '''{column: array} of symbol's trades on dates, in time order, only those
+    with start_ts <= ts < end_ts (ns) when given. Prices are int64 ticks
+    with ticks, else floats, converted only from files holding the other
+    kind.
+
+    Compacted stores serve the days they cover and the catalog, when given
+    or present, rules out day files without the symbol. The row slices of
+    each file and the rows read go through cache (default the process-wide
+    data.cache.CACHE) unless it is disabled; either way rows are read with
+    read_direct into arrays allocated once for the result.'''
+    cache = data.cache.CACHE if cache is None else cache
+    sources = symbol_sources(symbol, dates, file_path_template, start_ts, end_ts, catalog)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources)))) as pool:
+        if cache.max_bytes:
+            slices = list(pool.map(lambda source: _cached_slices(
+                *source, symbol, start_ts, end_ts, cache), sources))
+        else:
+            slices = list(pool.map(lambda source: _slices(*source, symbol, start_ts, end_ts),
+                                   sources))
+
+        sizes = [sum(stop - first for first, stop in s) for s in slices]
+        offsets = np.r_[0, np.cumsum(sizes)].astype(np.int64)
+        out = {name: np.empty(offsets[-1], dtype=trade_columns(ticks)[name]) for name in columns}
+
+        reads = [pool.submit(_read_cached, path, symbol, s, int(offset), out, cache)
+                 if cache.max_bytes else pool.submit(_read_into, path, symbol, s, int(offset), out)
+                 for (path, _), s, offset in zip(sources, slices, offsets) if s]
+        for read in reads:
+            read.result()
+    return out
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources)))) as pool:
+        slices = list(pool.map(lambda source: _slices(*source, symbol, start_ts, end_ts), sources))
+
+        sizes = [sum(stop - first for first, stop in s) for s in slices]
+        offsets = np.r_[0, np.cumsum(sizes)].astype(np.int64)
+        out = {name: np.empty(offsets[-1], dtype=trade_columns(ticks)[name]) for name in columns}
+
+        reads = [pool.submit(_read_into, path, symbol, s, int(offset), out)
+                 for (path, _), s, offset in zip(sources, slices, offsets) if s]
+        for read in reads:
+            read.result()
+    return out
+
+
+def file_bars(h5f, symbol, store_days, interval, hours='regular', ticks=False):
+    '''Bars of symbol in an open day file or store (for store_days), built
+    from its trades when the file has none stored. They are buckets of the
+    hours ('regular' or 'extended') sessions, rolled up from the stored
+    1min bars unless stored that way, or with hours None the stored bars
+    as they are (see utils.ohlc.stored_hours). Prices are ticks (TICK_BAR_DTYPE) with ticks, else
+    floats.'''
+    if hours is not None and hours != stored_hours(interval):
+        return roll_up(file_bars(h5f, symbol, store_days, '1min', None, ticks), interval, hours)
+    bars = read_bars(h5f, symbol, interval) if store_days is None \
+        else read_store_bars(h5f, symbol, store_days, interval)
+    if bars is None:
+        columns = ('ts', 'price', 'size')
+        trades = read_trades(h5f, symbol, columns) if store_days is None \
+            else read_store_trades(h5f, symbol, store_days, columns)
+        bars = ohlcv_bars(trades['ts'], trades['price'], trades['size'], interval,
+                          stored_hours(interval))
+    return as_bars(bars, ticks)
+
+
+def universe_bars(symbols, dates, file_path_template, interval='5min', catalog=None,
+                  hours='regular', ticks=False, cache=None):
+    '''{symbol: bars} of every symbol with bars on dates, in time order.
+
+    File-major: each day file or store is opened once and every requested
+    symbol read from it, instead of opening every file once per symbol.
+    Day files in the catalog are only asked for the symbols it lists. Each
+    file's bars of a symbol go through cache (default the process-wide
+    data.cache.CACHE, shared with ta.load_bars), so a repeated screen in the
+    same process opens no file. Prices are ticks with ticks, else floats
+    (see file_bars).'''
+    cache = data.cache.CACHE if cache is None else cache
+    if catalog is None:
+        catalog = date_catalog(dates, file_path_template)
+    wanted = np.array(sorted(symbols), dtype='S16')
+    pieces = {}
+    for path, store_days in archive_sources(dates, file_path_template):
+        entries = catalog.get(os.path.basename(path)) if store_days is None else None
+        if entries is None:
+            present = wanted
+        else:
+            present = entries['symbol'][entries['rows'] > 0]
+            present = present[np.isin(present, wanted)]
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError as e:
+            print(f'skip {path}: {e}')
+            continue
+        what = ('bars', interval, hours, ticks, *(store_days or ()))
+        found, missing = {}, []
+        for key in present:
+            entry = cache.get(cache.file_key(path, key.decode(), what, mtime_ns)) \
+                if cache.max_bytes else None
+            if entry is None:
+                missing.append(key.decode())
+            elif entry:     # {} for a file without the symbol
+                found[key.decode()] = entry['bars']
+        if missing:
+            try:
+                h5f = h5py.File(path, 'r')
+            except OSError as e:
+                print(f'skip {path}: {e}')
+                continue
+            with h5f:
+                trades = h5f.get('trades', {})
+                for symbol in missing:
+                    entry = {'bars': file_bars(h5f, symbol, store_days, interval, hours, ticks)} \
+                        if symbol in trades else {}
+                    if cache.max_bytes:
+                        cache.put(cache.file_key(path, symbol, what, mtime_ns), entry)
+                    if entry:
+                        found[symbol] = entry['bars']
+        for symbol in sorted(found):
+            if len(found[symbol]):
+                pieces.setdefault(symbol, []).append(found[symbol])
+    return {symbol: np.concatenate(bars) if len(bars) > 1 else bars[0]
+            for symbol, bars in pieces.items()}
+
+
+def trades_frame(columns, index=None):
+    '''DataFrame over loaded columns without copying them; ts becomes
+    datetime64[ns] (a view), or the index when index='ts'.'''
+    data = {name: column.view('M8[ns]') if name == 'ts' and index != 'ts' else column
+            for name, column in columns.items() if name != index}
+    return pd.DataFrame(data, index=None if index is None else columns[index], copy=False)
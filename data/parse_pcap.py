@@ -8,6 +8,9 @@ import struct
 import gzip
 import pandas as pd
 import h5py
+import numpy as np
+
+from data.tops import PRICE_SCALE, TRADE_DTYPE, iter_trade_batches
 
 extract = struct.unpack_from
 
@@ -80,8 +83,9 @@ def save_to_hdf5(trade_reports, hdf5_file):
             })
         print(f"Data saved to {hdf5_file}")
 
-def parse_iex_pcap(filepath):
-    '''pasrse trades from iex pcap file'''
+def parse_iex_pcap(filepath, ticks=False):
+    '''pasrse trades from iex pcap file, with ticks keeping price as the
+    wire's int64 ticks'''
 
     with open(filepath, 'rb') as f:
         pcap = dpkt.pcap.Reader(f)
@@ -118,11 +122,19 @@ def parse_iex_pcap(filepath):
                         "timestamp_trade": timestamp_trade,
                         "symbol": symbol,
                         "size": size,
-                        "price": price / 10000,  # Adjust for decimal placement
+                        "price": price if ticks else price / PRICE_SCALE,
                         "trade_id": trade_id
                     }
                     yield trade_report
 
+def parse_iex_trades(filepath):
+    '''decode every trade report in an iex pcap(.gz) file, one block at a time
+
+    Returns a structured array (see data.tops.TRADE_DTYPE) instead of a dict
+    per trade.'''
+    batches = list(iter_trade_batches(filepath))
+    return np.concatenate(batches) if batches else np.empty(0, dtype=TRADE_DTYPE)
+
 def parse_pcap_file_with_custom_header(file_path, header_offset=0):
     '''another function'''
     with open(file_path, 'rb') as f:
@@ -0,0 +1,293 @@
+'''pcap_io
+
+Block input layer for pcap / pcapng captures.
+
+Uncompressed captures are memory-mapped and handed out as memoryview
+windows of the mapping.  Gzipped captures are inflated in large fixed-size
+blocks into one reusable buffer.  Either way the caller receives, per block,
+a memoryview plus the offsets of the complete packet records inside it, and
+the record that straddles a block boundary is carried into the next block.'''
+
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from itertools import chain
+
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 64 << 20
+READ_SIZE = 1 << 20
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+MAX_CAPLEN = 0x40000    # anything larger is a corrupt record header
+CAPTURE_SPAN = 7 * 86400    # seconds record timestamps may stray from the first
+
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('pcap', '<'),     # microsecond timestamps
+    b'\x4d\x3c\xb2\xa1': ('pcap', '<'),     # nanosecond timestamps
+    b'\xa1\xb2\xc3\xd4': ('pcap', '>'),
+    b'\xa1\xb2\x3c\x4d': ('pcap', '>'),
+}
+PCAPNG_SHB = b'\x0a\x0d\x0d\x0a'
+PCAPNG_EPB = 6
+
+# bytes from the start of a record to its packet data
+RECORD_HEADER_LEN = {'pcap': 16, 'pcapng': 28}
+
+
+def read_pcap_header(buf):
+    '''Identify a pcap or pcapng capture.
+
+    Returns ((kind, endian), pos) where pos is the offset of the first
+    packet record.'''
+    magic = bytes(buf[:4])
+    if magic in PCAP_MAGIC:
+        return PCAP_MAGIC[magic], 24
+    if magic == PCAPNG_SHB:
+        endian = '<' if bytes(buf[8:12]) == b'\x4d\x3c\x2b\x1a' else '>'
+        block_len = struct.unpack_from(endian + 'I', buf, 4)[0]
+        return ('pcapng', endian), block_len
+    raise ValueError(f'Not a pcap or pcapng capture (magic {magic.hex()})')
+
+
+def _pcap_candidates(buf, endian, pos, ts0):
+    '''Offsets at or after pos where buf could hold a pcap record header.
+
+    A candidate has a timestamp within CAPTURE_SPAN of ts0, a sub-second
+    part below 10**9 and a caplen within MAX_CAPLEN and no larger than the
+    original length.  Byte-wide passes over buf pick the offsets whose
+    timestamp top byte and caplen top byte are plausible, and only those
+    headers are checked in full, so the result is a superset of the real
+    record starts (plus the odd payload that happens to look like one).
+    Returns (starts, caplens) sorted by offset.'''
+    header = RECORD_HEADER_LEN['pcap']
+    lo, hi = max(ts0 - CAPTURE_SPAN, 0), min(ts0 + CAPTURE_SPAN, 0xffffffff)
+    data = np.frombuffer(buf, dtype=np.uint8, offset=pos)
+    ts_top, caplen_top = (3, 11) if endian == '<' else (0, 8)
+    top_bytes = data[ts_top:len(data) - header + ts_top + 1]
+    plausible = top_bytes == lo >> 24
+    if hi >> 24 != lo >> 24:
+        plausible |= top_bytes == hi >> 24
+    hits = np.flatnonzero(plausible)
+    hits = hits[data[hits + caplen_top] == 0]
+
+    # one unaligned record header per byte offset, gathered only at the hits
+    fields = np.dtype([(name, endian + 'u4') for name in ('ts', 'frac', 'caplen', 'origlen')])
+    headers = np.ndarray((len(data) - header + 1,), dtype=fields, buffer=data, strides=(1,))[hits]
+    ts, caplen = headers['ts'], headers['caplen']
+    keep = (ts >= lo) & (ts <= hi) & (headers['frac'] < 1000000000)
+    keep &= (caplen <= MAX_CAPLEN) & (caplen <= headers['origlen'])
+    return pos + hits[keep], caplen[keep].astype(np.int64)
+
+
+def _scan_pcap(buf, endian, pos):
+    '''Vectorized record walk for classic pcap, see scan_records.
+
+    The candidate headers are chained by next = start + 16 + caplen; runs
+    where each candidate's next is the following candidate are accepted
+    whole, and only the breaks in the chain (false candidates inside a
+    payload, records the candidate test missed) are stepped in Python.'''
+    header = RECORD_HEADER_LEN['pcap']
+    size = len(buf)
+    empty = np.empty(0, np.int64)
+    if pos + header > size:
+        return empty, empty, pos
+
+    caplen_at = struct.Struct(endian + 'I').unpack_from
+    starts, caplens = _pcap_candidates(buf, endian, pos, caplen_at(buf, pos)[0])
+    nexts = starts + header + caplens
+    breaks = np.flatnonzero(nexts[:-1] != starts[1:])
+    runs = []
+    i = np.searchsorted(starts, pos)
+    while True:
+        if i < len(starts) and starts[i] == pos:
+            b = np.searchsorted(breaks, i)
+            last = breaks[b] if b < len(breaks) else len(starts) - 1
+            runs.append((starts[i:last + 1], caplens[i:last + 1]))
+            pos = int(nexts[last])
+        else:
+            if pos + header > size:
+                break
+            caplen = caplen_at(buf, pos + 8)[0]
+            if caplen > MAX_CAPLEN:
+                raise ValueError(f'Corrupt pcap record at offset {pos}')
+            runs.append((np.array([pos], np.int64), np.array([caplen], np.int64)))
+            pos += header + caplen
+        i = np.searchsorted(starts, pos)
+
+    if not runs:
+        return empty, empty, pos
+    starts = np.concatenate([r[0] for r in runs])
+    lengths = np.concatenate([r[1] for r in runs])
+    # record ends only grow along the chain, so the complete ones are a prefix
+    complete = np.searchsorted(starts + header + lengths, size, side='right')
+    if complete < len(starts):
+        pos = int(starts[complete])
+    return starts[:complete] + header, lengths[:complete], pos
+
+
+def scan_records(buf, pcap_format, pos=0):
+    '''Locate the packet data of every complete record in buf.
+
+    Returns (offsets, lengths, end): int64 arrays with the offset and
+    captured length of each packet, and the offset of the first incomplete
+    record so a streaming caller can carry the tail into the next block.'''
+    kind, endian = pcap_format
+    if kind == 'pcap':
+        return _scan_pcap(buf, endian, pos)
+
+    offsets = array('q')
+    lengths = array('q')
+    size = len(buf)
+    block_at = struct.Struct(endian + 'II').unpack_from
+    caplen_at = struct.Struct(endian + 'I').unpack_from
+    while pos + 12 <= size:
+        block_type, block_len = block_at(buf, pos)
+        if block_len < 12 or block_len > MAX_CAPLEN + 64:
+            raise ValueError(f'Corrupt pcapng block at offset {pos}')
+        if pos + block_len > size:
+            break
+        if block_type == PCAPNG_EPB:
+            offsets.append(pos + RECORD_HEADER_LEN['pcapng'])
+            lengths.append(caplen_at(buf, pos + 20)[0])
+        pos += block_len
+
+    return (np.frombuffer(offsets, dtype=np.int64),
+            np.frombuffer(lengths, dtype=np.int64),
+            pos)
+
+
+def iter_packet_blocks(filepath, block_size=DEFAULT_BLOCK_SIZE, start=0):
+    '''Yield (view, offsets, lengths, base) for successive blocks of a capture.
+
+    view is a memoryview holding exactly a run of whole packet records,
+    offsets/lengths locate the packet data inside view and base is the
+    offset of view[0] in the uncompressed capture, so base + len(view) is
+    where the next block starts.  A non-zero start resumes at that record
+    boundary.  The view is only valid until the next block is requested;
+    anything that must outlive it has to be copied out.'''
+    if block_size < 2 * MAX_CAPLEN:
+        raise ValueError(f'block_size must be at least {2 * MAX_CAPLEN} bytes')
+    if filepath.endswith('gz'):
+        return _iter_gzip_blocks(filepath, block_size, start)
+    return _iter_mapped_blocks(filepath, block_size, start)
+
+
+def _iter_mapped_blocks(filepath, block_size, start=0):
+    with open(filepath, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if hasattr(mm, 'madvise'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mm)
+    try:
+        pcap_format, pos = read_pcap_header(view)
+        pos = max(pos, start)
+        while pos < len(view):
+            window = view[pos:pos + block_size]
+            offsets, lengths, end = scan_records(window, pcap_format)
+            if end == 0:
+                break   # truncated final record
+            yield window[:end], offsets, lengths, pos
+            pos += end
+    finally:
+        try:
+            view.release()
+            mm.close()
+        except BufferError:
+            pass    # caller still holds a window; the mapping goes with it
+
+
+def inflate_chunks(fh):
+    '''Decompressed chunks of a (possibly multi-member) gzip stream.'''
+    inflate = zlib.decompressobj(GZIP_WBITS)
+    while True:
+        data = fh.read(READ_SIZE)
+        if not data:
+            tail = inflate.flush()
+            if tail:
+                yield tail
+            return
+        while data:
+            out = inflate.decompress(data, 4 * READ_SIZE)
+            if out:
+                yield out
+            if inflate.eof:
+                data = inflate.unused_data
+                inflate = zlib.decompressobj(GZIP_WBITS)
+            else:
+                data = inflate.unconsumed_tail
+
+
+def clip_chunks(chunks, skip=0, limit=None):
+    '''Drop the first skip bytes of a chunk stream and stop after limit more.'''
+    for chunk in chunks:
+        if skip:
+            dropped = min(skip, len(chunk))
+            chunk = chunk[dropped:]
+            skip -= dropped
+        if limit is not None:
+            chunk = chunk[:limit]
+            limit -= len(chunk)
+        if chunk:
+            yield chunk
+        if limit == 0:
+            return
+
+
+def _iter_gzip_blocks(filepath, block_size, start=0):
+    with open(filepath, 'rb') as fh:
+        chunks = inflate_chunks(fh)
+        if not start:
+            yield from iter_inflated_blocks(chunks, block_size)
+            return
+        # the header is needed to frame records, then inflate up to start
+        first = next(chunks, b'')
+        pcap_format, _ = read_pcap_header(first)
+        chunks = clip_chunks(chain([first], chunks), skip=start)
+        yield from iter_inflated_blocks(chunks, block_size, pcap_format, base=start)
+
+
+def iter_inflated_blocks(chunks, block_size, pcap_format=None, base=0):
+    '''Assemble decompressed chunks into blocks of whole packet records.
+
+    chunks must start at the capture header, or at a record boundary when
+    pcap_format is given; base is the capture offset of the first byte.'''
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    start = 0   # first unscanned byte in buf
+    filled = 0  # valid bytes in buf
+
+    def scan():
+        nonlocal pcap_format, start
+        if pcap_format is None:
+            pcap_format, start = read_pcap_header(view)
+        offsets, lengths, end = scan_records(view[start:filled], pcap_format)
+        return view[start:start + end], offsets, lengths, start + end
+
+    for chunk in chunks:
+        chunk = memoryview(chunk)
+        while chunk:
+            n = min(len(chunk), block_size - filled)
+            view[filled:filled + n] = chunk[:n]
+            filled += n
+            chunk = chunk[n:]
+            if filled < block_size:
+                continue
+
+            window, offsets, lengths, consumed = scan()
+            yield window, offsets, lengths, base + start
+
+            # carry the straddling record to the front of the buffer
+            buf[:filled - consumed] = buf[consumed:filled]
+            base += consumed
+            filled -= consumed
+            start = 0
+
+    if filled:
+        window, offsets, lengths, _ = scan()
+        yield window, offsets, lengths, base + start
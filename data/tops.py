@@ -0,0 +1,389 @@
+'''tops
+
+Vectorized decoder for IEX-TP / TOPS 1.6 captures, covering the full TOPS
+message set with type and symbol filters applied before any field is read.
+
+Packets are located with one pass over the pcap record headers, after which
+every header and message field is gathered for all packets at once through
+NumPy fancy indexing.  No Python object is created per message.'''
+
+import numpy as np
+
+from data.pcap_io import (DEFAULT_BLOCK_SIZE, iter_packet_blocks,
+                          read_pcap_header, scan_records)
+from utils.ohlc import PRICE_SCALE     # wire prices carry four implied decimals
+
+ETH_HEADER_LEN = 14
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+IPPROTO_UDP = 17
+UDP_HEADER_LEN = 8
+TP_HEADER_LEN = 40
+MSG_LEN_PREFIX = 2
+
+# IEX-TP segment header, little endian
+TP_HEADER_DTYPE = np.dtype([
+    ('version', 'u1'),
+    ('reserved', 'u1'),
+    ('msg_protocol_id', '<u2'),
+    ('channel_id', '<u4'),
+    ('session_id', '<u4'),
+    ('payload_len', '<u2'),
+    ('msg_count', '<u2'),
+    ('stream_offset', '<i8'),
+    ('first_msg_seq_no', '<i8'),
+    ('send_time', '<i8'),
+])
+
+# TOPS 1.6 message bodies exactly as they appear on the wire.  Every message
+# but the system event carries its symbol at SYMBOL_OFFSET.
+SYMBOL_OFFSET = 10
+
+SYSTEM_EVENT_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('system_event', 'S1'),
+    ('timestamp', '<i8'),
+])
+
+SECURITY_DIRECTORY_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('flags', 'u1'),
+    ('timestamp', '<i8'),
+    ('symbol', 'S8'),
+    ('round_lot_size', '<u4'),
+    ('adjusted_poc_price', '<i8'),
+    ('luld_tier', 'u1'),
+])
+
+TRADING_STATUS_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('trading_status', 'S1'),
+    ('timestamp', '<i8'),
+    ('symbol', 'S8'),
+    ('reason', 'S4'),
+])
+
+RETAIL_LIQUIDITY_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('indicator', 'S1'),
+    ('timestamp', '<i8'),
+    ('symbol', 'S8'),
+])
+
+OPERATIONAL_HALT_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('halt_status', 'S1'),
+    ('timestamp', '<i8'),
+    ('symbol', 'S8'),
+])
+
+SHORT_SALE_PRICE_TEST_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('status', 'u1'),
+    ('timestamp', '<i8'),
+    ('symbol', 'S8'),
+    ('detail', 'S1'),
+])
+
+QUOTE_UPDATE_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('flags', 'u1'),
+    ('timestamp', '<i8'),
+    ('symbol', 'S8'),
+    ('bid_size', '<u4'),
+    ('bid_price', '<i8'),
+    ('ask_price', '<i8'),
+    ('ask_size', '<u4'),
+])
+
+TRADE_WIRE_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('flags', 'u1'),
+    ('timestamp', '<i8'),
+    ('symbol', 'S8'),
+    ('size', '<u4'),
+    ('price', '<i8'),
+    ('trade_id', '<i8'),
+])
+
+OFFICIAL_PRICE_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('price_type', 'S1'),
+    ('timestamp', '<i8'),
+    ('symbol', 'S8'),
+    ('official_price', '<i8'),
+])
+
+AUCTION_INFORMATION_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('auction_type', 'S1'),
+    ('timestamp', '<i8'),
+    ('symbol', 'S8'),
+    ('paired_shares', '<u4'),
+    ('reference_price', '<i8'),
+    ('indicative_clearing_price', '<i8'),
+    ('imbalance_shares', '<u4'),
+    ('imbalance_side', 'S1'),
+    ('extension_number', 'u1'),
+    ('scheduled_auction_time', '<u4'),
+    ('auction_book_clearing_price', '<i8'),
+    ('collar_reference_price', '<i8'),
+    ('lower_auction_collar', '<i8'),
+    ('upper_auction_collar', '<i8'),
+])
+
+TRADE_REPORT = ord('T')
+
+# int64 wire fields holding prices with four implied decimals
+PRICE_FIELDS = {
+    'adjusted_poc_price', 'bid_price', 'ask_price', 'price', 'official_price',
+    'reference_price', 'indicative_clearing_price', 'auction_book_clearing_price',
+    'collar_reference_price', 'lower_auction_collar', 'upper_auction_collar',
+}
+
+# name -> (type byte, wire dtype)
+MESSAGE_TYPES = {
+    'system_event': (ord('S'), SYSTEM_EVENT_DTYPE),
+    'security_directory': (ord('D'), SECURITY_DIRECTORY_DTYPE),
+    'trading_status': (ord('H'), TRADING_STATUS_DTYPE),
+    'retail_liquidity': (ord('I'), RETAIL_LIQUIDITY_DTYPE),
+    'operational_halt': (ord('O'), OPERATIONAL_HALT_DTYPE),
+    'short_sale_price_test': (ord('P'), SHORT_SALE_PRICE_TEST_DTYPE),
+    'quote_update': (ord('Q'), QUOTE_UPDATE_DTYPE),
+    'trade_report': (TRADE_REPORT, TRADE_WIRE_DTYPE),
+    'official_price': (ord('X'), OFFICIAL_PRICE_DTYPE),
+    'trade_break': (ord('B'), TRADE_WIRE_DTYPE),
+    'auction_information': (ord('A'), AUCTION_INFORMATION_DTYPE),
+}
+
+# Decoded trades handed to the rest of the pipeline
+TRADE_DTYPE = np.dtype([
+    ('ts', 'i8'),
+    ('symbol', 'S8'),
+    ('size', 'i4'),
+    ('price', 'f8'),
+    ('trade_id', 'i8'),
+    ('flags', 'u1'),
+    ('seq', 'i8'),
+])
+
+# The same with price left in the wire's int64 ticks (see utils.ohlc)
+TICK_TRADE_DTYPE = np.dtype([(name, 'i8' if name == 'price' else dtype)
+                             for name, dtype in TRADE_DTYPE.descr])
+
+
+def gather(u8, offsets, dtype):
+    '''Read one dtype value at each of offsets from a uint8 buffer view.'''
+    dtype = np.dtype(dtype)
+    index = offsets[:, None] + np.arange(dtype.itemsize)
+    return u8[index].view(dtype).ravel()
+
+
+def locate_segments(u8, offsets, lengths):
+    '''Find the IEX-TP segment inside each Ethernet/IPv4/UDP frame.
+
+    Returns (tp_offsets, tp_ends) for the frames that carry a complete
+    IEX-TP header; everything else is dropped.'''
+    min_len = ETH_HEADER_LEN + 20 + UDP_HEADER_LEN + TP_HEADER_LEN
+    keep = lengths >= min_len
+    eth, end = offsets[keep], offsets[keep] + lengths[keep]
+
+    ethertype = gather(u8, eth + 12, '>u2')
+    vlan = ethertype == ETHERTYPE_VLAN
+    ethertype = np.where(vlan, gather(u8, eth + 16, '>u2'), ethertype)
+    ip = eth + ETH_HEADER_LEN + np.where(vlan, 4, 0)
+
+    ihl = (u8[ip] & 0x0F).astype(np.int64) * 4
+    keep = (ethertype == ETHERTYPE_IPV4) & (u8[ip + 9] == IPPROTO_UDP)
+    tp = ip + ihl + UDP_HEADER_LEN
+    keep &= tp + TP_HEADER_LEN <= end
+    return tp[keep], end[keep]
+
+
+def decode_segments(u8, tp_offsets, tp_ends):
+    '''Walk the length-prefixed messages of every segment in lockstep.
+
+    The k-th message of every packet is located in one vectorized step, so
+    the Python loop runs once per message slot rather than once per message.
+    Returns (offsets, lengths, seq) of each message body in stream order.'''
+    header = gather(u8, tp_offsets, TP_HEADER_DTYPE)
+    start = tp_offsets + TP_HEADER_LEN
+    stop = np.minimum(start + header['payload_len'].astype(np.int64), tp_ends)
+    count = header['msg_count'].astype(np.int64)
+    first_seq = header['first_msg_seq_no']
+
+    pos = start.copy()
+    live = np.flatnonzero(count > 0)
+    found_offsets, found_lengths, found_seq = [], [], []
+    slot = 0
+    while live.size:
+        at = pos[live]
+        ok = at + MSG_LEN_PREFIX <= stop[live]
+        live, at = live[ok], at[ok]
+        length = gather(u8, at, '<u2').astype(np.int64)
+        ok = at + MSG_LEN_PREFIX + length <= stop[live]
+        live, at, length = live[ok], at[ok], length[ok]
+
+        found_offsets.append(at + MSG_LEN_PREFIX)
+        found_lengths.append(length)
+        found_seq.append(first_seq[live] + slot)
+
+        pos[live] = at + MSG_LEN_PREFIX + length
+        slot += 1
+        live = live[count[live] > slot]
+
+    if not found_offsets:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    offsets = np.concatenate(found_offsets)
+    order = np.argsort(offsets, kind='stable')
+    return (offsets[order],
+            np.concatenate(found_lengths)[order],
+            np.concatenate(found_seq)[order])
+
+
+def unpack_messages(u8, offsets, wire_dtype):
+    '''Copy fixed-size message bodies into a structured array view.
+
+    Symbols are space padded on the wire; the padding is turned into NULs so
+    the S8 field compares equal to the bare symbol.'''
+    index = offsets[:, None] + np.arange(wire_dtype.itemsize)
+    rows = u8[index]
+    if 'symbol' in wire_dtype.names:
+        start = wire_dtype.fields['symbol'][1]
+        symbol = rows[:, start:start + 8]
+        symbol[symbol == 0x20] = 0
+    return rows.view(wire_dtype).ravel()
+
+
+def symbol_keys(symbols):
+    '''Sorted uint64 view of symbols as space padded 8-byte wire fields.'''
+    padded = [s.encode() if isinstance(s, str) else bytes(s) for s in symbols]
+    keys = np.array([p.ljust(8) for p in padded], dtype='S8').view('<u8')
+    return np.unique(keys)
+
+
+def select_messages(u8, offsets, lengths, types=None, symbols=None):
+    '''Filter message bodies on the type byte and the raw symbol field.
+
+    types is an iterable of MESSAGE_TYPES names (None for all) and symbols
+    an iterable of symbols (None for all).  Only the type byte and, for the
+    survivors, the symbol field read as one uint64 are touched.  Returns
+    {name: offsets} for every requested type.'''
+    names = list(MESSAGE_TYPES) if types is None else list(types)
+    unknown = set(names) - set(MESSAGE_TYPES)
+    if unknown:
+        raise ValueError(f'Unknown TOPS message types {sorted(unknown)}')
+
+    # per type byte: the minimum body length, or "never" when not wanted
+    min_len = np.full(256, np.iinfo(np.int64).max, dtype=np.int64)
+    for name in names:
+        code, dtype = MESSAGE_TYPES[name]
+        min_len[code] = dtype.itemsize
+    mtype = u8[offsets]
+    keep = lengths >= min_len[mtype]
+    offsets, mtype = offsets[keep], mtype[keep]
+
+    if symbols is not None:
+        wanted = symbol_keys(symbols)
+        has_symbol = mtype != MESSAGE_TYPES['system_event'][0]
+        keys = gather(u8, offsets[has_symbol] + SYMBOL_OFFSET, '<u8')
+        keep = ~has_symbol
+        keep[has_symbol] = np.isin(keys, wanted)
+        offsets, mtype = offsets[keep], mtype[keep]
+
+    return {name: offsets[mtype == MESSAGE_TYPES[name][0]] for name in names}
+
+
+def columns_from_wire(wire, ticks=False):
+    '''Contiguous columns of a wire view; prices become floats unless
+    ticks.'''
+    columns = {}
+    for name in wire.dtype.names[1:]:
+        if name in PRICE_FIELDS and not ticks:
+            columns[name] = wire[name] / PRICE_SCALE
+        else:
+            columns[name] = np.ascontiguousarray(wire[name])
+    return columns
+
+
+def decode_messages(buf, offsets, lengths, types=None, symbols=None, ticks=False):
+    '''Decode TOPS messages of the packets located by scan_records.
+
+    Returns {name: {column: array}} with one columnar batch per requested
+    message type; every batch also carries the message sequence number as
+    'seq'. With ticks prices stay int64 ticks.'''
+    u8 = np.frombuffer(buf, dtype=np.uint8)
+    tp_offsets, tp_ends = locate_segments(u8, offsets, lengths)
+    msg_offsets, msg_lengths, msg_seq = decode_segments(u8, tp_offsets, tp_ends)
+    selected = select_messages(u8, msg_offsets, msg_lengths, types, symbols)
+
+    batches = {}
+    for name, found in selected.items():
+        columns = columns_from_wire(unpack_messages(u8, found, MESSAGE_TYPES[name][1]), ticks)
+        columns['seq'] = msg_seq[np.searchsorted(msg_offsets, found)]
+        batches[name] = columns
+    return batches
+
+
+def iter_message_batches(filepath, types=None, symbols=None,
+                         block_size=DEFAULT_BLOCK_SIZE, ticks=False):
+    '''Decode a pcap(.gz) file block by block into per-type batches.'''
+    for view, offsets, lengths, _ in iter_packet_blocks(filepath, block_size):
+        yield decode_messages(view, offsets, lengths, types, symbols, ticks)
+
+
+def trades_from_messages(u8, offsets, lengths, seq, symbols=None, ticks=False):
+    '''Decode the Trade Report messages among the given message bodies,
+    as TICK_TRADE_DTYPE with ticks, skipping the per-trade division.'''
+    found = select_messages(u8, offsets, lengths, ['trade_report'], symbols)['trade_report']
+    wire = unpack_messages(u8, found, TRADE_WIRE_DTYPE)
+
+    trades = np.empty(wire.shape[0], dtype=TICK_TRADE_DTYPE if ticks else TRADE_DTYPE)
+    trades['ts'] = wire['timestamp']
+    trades['symbol'] = wire['symbol']
+    trades['size'] = wire['size']
+    trades['price'] = wire['price'] if ticks else wire['price'] / PRICE_SCALE
+    trades['trade_id'] = wire['trade_id']
+    trades['flags'] = wire['flags']
+    trades['seq'] = seq[np.searchsorted(offsets, found)]
+    return trades
+
+
+def decode_block(buf, offsets, lengths, symbols=None, ticks=False):
+    '''Decode the trades of a packet block along with the sequence framing
+    of its segments.
+
+    Returns (trades, first_msg_seq_no, msg_count), the last two holding one
+    entry per IEX-TP segment so callers can check for sequence gaps.'''
+    u8 = np.frombuffer(buf, dtype=np.uint8)
+    tp_offsets, tp_ends = locate_segments(u8, offsets, lengths)
+    msg_offsets, msg_lengths, msg_seq = decode_segments(u8, tp_offsets, tp_ends)
+    trades = trades_from_messages(u8, msg_offsets, msg_lengths, msg_seq, symbols, ticks)
+    header = gather(u8, tp_offsets, TP_HEADER_DTYPE)
+    return trades, header['first_msg_seq_no'], header['msg_count'].astype(np.int64)
+
+
+def decode_packets(buf, offsets, lengths, symbols=None, ticks=False):
+    '''Decode the trades carried by the packets located by scan_records.'''
+    return decode_block(buf, offsets, lengths, symbols, ticks)[0]
+
+
+def decode_trades(buf, symbols=None, ticks=False):
+    '''Decode every Trade Report in a complete in-memory capture.
+
+    Returns a TRADE_DTYPE (with ticks, TICK_TRADE_DTYPE) structured array
+    in stream order.'''
+    pcap_format, pos = read_pcap_header(buf)
+    offsets, lengths, _ = scan_records(buf, pcap_format, pos)
+    return decode_packets(buf, offsets, lengths, symbols, ticks)
+
+
+def iter_trade_batches(filepath, block_size=DEFAULT_BLOCK_SIZE, symbols=None, ticks=False):
+    '''Decode a pcap(.gz) file block by block.
+
+    Yields one TRADE_DTYPE (with ticks, TICK_TRADE_DTYPE) array per input
+    block; see data.pcap_io.iter_packet_blocks for how blocks are
+    produced.'''
+    for view, offsets, lengths, _ in iter_packet_blocks(filepath, block_size):
+        yield decode_packets(view, offsets, lengths, symbols, ticks)
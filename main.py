@@ -1,4 +1,10 @@
+from glob import glob
+
 from data.parse_data import get_parser, iter_trades, get_df
+from data.catalog import build_catalog
+from data.compact import compact_archive
+from data.ingest import bulk_ingest
+from data.gzip_index import build_index
 from models.macd_analysis import calculate_macd
 from utils.chart_display import display_macd_chart
 from utils.zoom_control import adjust_zoom
@@ -7,6 +13,9 @@ from utils.hdf5_handler import (get_single_date,
                                 get_daterange,
                                 save_df_to_hdf5,
                                 trades_to_hdf5,
+                                convert_to_columnar,
+                                index_day_file,
+                                rebuild_bars,
                                 write_trades_to_dataset,
                                 show_h5py_hdf5,
                                 show_pd_hdf5)
@@ -17,7 +26,37 @@ def main():
     # Handle save command
     if args.save_to_hdf5:
         trades = iter_trades(get_parser(args.pcap_filepath))
-        trades_to_hdf5(trades, args.h5_filepath, batch_size=args.batch_size)
+        buffer_bytes = args.buffer_mb << 20 if args.buffer_mb else None
+        trades_to_hdf5(trades, args.h5_filepath, buffer_bytes=buffer_bytes)
+
+    elif args.bulk_ingest:
+        symbols = args.symbols.split(',') if args.symbols else None
+        bulk_ingest(args.bulk_ingest, args.h5_template, workers=args.workers, symbols=symbols,
+                    ticks=args.ticks)
+
+    elif args.build_gzip_index:
+        index = build_index(args.pcap_filepath)
+        print(f"{index['path']}: {len(index['points'])} checkpoints")
+
+    elif args.convert_h5:
+        convert_to_columnar(args.h5_filepath, args.convert_h5)
+
+    elif args.compact:
+        for path in compact_archive(args.h5_template, months=args.compact_months,
+                                    remove=args.remove_days):
+            print(f'wrote {path}')
+
+    elif args.build_catalog:
+        updated = build_catalog(args.build_catalog)
+        print(f'catalogued {updated} day files in {args.build_catalog}')
+
+    elif args.rebuild_bars:
+        for h5filepath in sorted(glob(args.rebuild_bars)):
+            rebuild_bars(h5filepath)
+            print(f'rebuilt bars of {h5filepath}')
+
+    elif args.build_ts_index:
+        index_day_file(args.h5_filepath)
 
     elif args.show_h5py_hdf5:
         show_h5py_hdf5(args.filepath)
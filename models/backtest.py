@@ -0,0 +1,154 @@
+"""Vectorized MACD crossover backtests over packed per-symbol bars.
+
+The strategy is long only: buy at the close of the bar where MACD crosses
+above its signal line, sell at the close of the next bar where it crosses
+below, or else at the last bar (flagged as an open trade). A cost fraction
+is charged on each side. Everything runs on the flat arrays of
+models.segments, trades and equity curves of all symbols at once; grids
+of MACD periods reuse each EMA across combinations, and run_grid spreads
+symbols over worker processes as models.screen does.
+"""
+import numpy as np
+
+from data.catalog import date_catalog
+from data.load import universe_bars
+from models.events import CROSS_UP, segment_crossings
+from models.indicators import ewma
+from models.registry import grid_params
+from models.screen import DEFAULT_WORKERS, map_shards
+from models.segments import apply_padded, pack, segment_lengths
+from utils.ohlc import prices
+from utils.trading_calendar import session_dates
+
+# entry and exit are bar indexes within the symbol's segment
+TRADE_DTYPE = np.dtype([
+    ('symbol_id', 'i8'),
+    ('entry', 'i8'),
+    ('exit', 'i8'),
+    ('return', 'f8'),
+    ('open', '?'),
+])
+
+# per symbol results of backtest: trades and winning trades, their hit rate
+# and mean return, the compounded return and worst drawdown of the equity
+# curve, and turnover as capital traded per bar
+STATS = ('trades', 'hits', 'hit_rate', 'mean_return', 'total_return', 'max_drawdown', 'turnover')
+
+def crossover_trades(events, offsets):
+    """(flat entry, flat exit, open) positions of the trades of crossing
+    events (see models.events.segment_crossings)."""
+    flat = offsets[events['symbol_id']] + events['index']
+    up = events['direction'] == CROSS_UP
+    entries, downs = flat[up], flat[~up]
+    segment_end = offsets[events['symbol_id'][up] + 1] - 1
+    following = np.searchsorted(downs, entries)
+    exits = downs[np.minimum(following, max(len(downs) - 1, 0))] if len(downs) else segment_end
+    is_open = (following == len(downs)) | (exits > segment_end)
+    exits = np.where(is_open, segment_end, exits)
+    # a later cross up before the exit (after a tie) is not a new trade
+    first = np.r_[True, exits[1:] != exits[:-1]] if len(exits) else np.empty(0, dtype=bool)
+    return entries[first], exits[first], is_open[first]
+
+def backtest(closes, offsets, macd_line, signal_line, cost=0.0):
+    """(trades, {stat: per symbol array}) of crossover trading on packed
+    closes with their MACD and signal lines."""
+    closes = np.asarray(closes, dtype=np.float64)
+    lengths = segment_lengths(offsets)
+    symbols = len(lengths)
+    entries, exits, is_open = crossover_trades(segment_crossings(macd_line, offsets, signal_line),
+                                               offsets)
+    symbol_ids = np.searchsorted(offsets, entries, side='right') - 1
+    trades = np.empty(len(entries), dtype=TRADE_DTYPE)
+    trades['symbol_id'] = symbol_ids
+    trades['entry'] = entries - offsets[symbol_ids]
+    trades['exit'] = exits - offsets[symbol_ids]
+    trades['return'] = closes[exits] / closes[entries] * (1 - cost) ** 2 - 1
+    trades['open'] = is_open
+
+    # held over (entry, exit]; the step back down lands at most one past the end
+    change = np.zeros(len(closes) + 1)
+    np.add.at(change, entries + 1, 1)
+    np.add.at(change, exits + 1, -1)
+    position = np.cumsum(change)[:-1]
+    bar_return = np.zeros(len(closes))
+    bar_return[1:] = closes[1:] / closes[:-1] - 1
+    bar_return[offsets[:-1][lengths > 0]] = 0
+    traded = np.zeros(len(closes))
+    np.add.at(traded, entries, 1)
+    np.add.at(traded, exits, 1)
+    log_growth = np.log1p(position * bar_return) + traded * np.log1p(-cost)
+
+    # equity of each symbol restarts at 1 on its first bar
+    def curve(growth):
+        log_equity = np.cumsum(growth, axis=1)
+        return log_equity, np.maximum.accumulate(np.maximum(log_equity, 0), axis=1) - log_equity
+    log_equity, drawdown = apply_padded(curve, offsets, log_growth)
+
+    stats = {name: np.zeros(symbols) for name in STATS}
+    stats['trades'] = np.bincount(symbol_ids, minlength=symbols)
+    wins = np.bincount(symbol_ids, weights=trades['return'] > 0, minlength=symbols)
+    stats['hits'] = wins.astype(np.int64)
+    returns = np.bincount(symbol_ids, weights=trades['return'], minlength=symbols)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats['hit_rate'] = stats['hits'] / stats['trades']
+        stats['mean_return'] = returns / stats['trades']
+    nonempty = lengths > 0
+    if nonempty.any():
+        starts, ends = offsets[:-1][nonempty], offsets[1:][nonempty] - 1
+        stats['total_return'][nonempty] = np.expm1(log_equity[ends])
+        stats['max_drawdown'][nonempty] = -np.expm1(-np.maximum.reduceat(drawdown, starts))
+        stats['turnover'][nonempty] = np.add.reduceat(traded, starts) / lengths[nonempty]
+    return trades, stats
+
+def grid_backtest(closes, offsets, params, cost=0.0):
+    """{stat: array} of shape (combinations, symbols) backtesting every
+    combination in params (see models.registry.grid_params) over packed
+    closes. Each EMA period is filtered once for the whole grid, and each
+    (short, long) MACD line once, padded once for all its signal periods."""
+    emas = {}
+
+    def segment_ewma(values, period):
+        return apply_padded(lambda rows: (ewma(rows, period),), offsets, values)[0]
+
+    for period in np.union1d(params['short'], params['long']).tolist():
+        emas[period] = segment_ewma(closes, period)
+    # {(short, long): {signal: [positions in params]}}
+    groups = {}
+    for i, (short, long, signal) in enumerate(params.tolist()):
+        groups.setdefault((short, long), {}).setdefault(signal, []).append(i)
+    results = {name: [None] * len(params) for name in STATS}
+    for (short, long), signals in groups.items():
+        macd_line = emas[short] - emas[long]
+        signal_lines = apply_padded(lambda rows: tuple(ewma(rows, signal) for signal in signals),
+                                    offsets, macd_line)
+        for positions, signal_line in zip(signals.values(), signal_lines):
+            _, stats = backtest(closes, offsets, macd_line, signal_line, cost)
+            for name in STATS:
+                for i in positions:
+                    results[name][i] = stats[name]
+    symbols = len(offsets) - 1
+    return {name: np.array(values).reshape(len(params), symbols) for name, values in results.items()}
+
+def _grid_shard(symbols, dates, file_path_template, interval, hours, catalog, params, cost):
+    bars = universe_bars(symbols, dates, file_path_template, interval, catalog, hours, ticks=True)
+    empty = np.empty(0, dtype=np.int64)
+    ticks, offsets = pack([bars[symbol]['close'] if symbol in bars else empty
+                           for symbol in symbols], dtype=np.int64)
+    return grid_backtest(prices(ticks), offsets, params, cost)
+
+def run_grid(symbols, date_range, file_path_template, interval='5min',
+             shorts=(12,), longs=(26,), signals=(9,), cost=0.0, hours='regular',
+             catalog=None, workers=DEFAULT_WORKERS):
+    """(params, {stat: (combinations, symbols) array}) of a MACD crossover
+    grid backtest of symbols over the sessions of date_range, one shard of
+    symbols per worker process, each reading its bars file-major. Bars are
+    buckets of the hours ('regular' or 'extended') sessions, the stored
+    bars with hours None."""
+    symbols = list(symbols)
+    params = grid_params(shorts, longs, signals)
+    dates = session_dates(*date_range)
+    if catalog is None:
+        catalog = date_catalog(dates, file_path_template)
+    parts = map_shards(_grid_shard, symbols, workers, dates, file_path_template, interval,
+                       hours, catalog, params, cost)
+    return params, {name: np.concatenate([part[name] for part in parts], axis=1) for name in STATS}
@@ -0,0 +1,49 @@
+"""Crossover and threshold events of whole series in one pass.
+
+A series crosses up at i when it is above the other (a series or a fixed
+threshold) at i but was not at i - 1, i.e. series[i] > other[i] and
+series[i - 1] <= other[i - 1]; crossing down mirrors that. Ties count as
+neither side, so touching a level and turning back is no event, and a
+comparison with NaN never crosses.
+"""
+import numpy as np
+
+CROSS_UP = 1
+CROSS_DOWN = -1
+
+# symbol_id, index within the symbol's segment, CROSS_UP or CROSS_DOWN
+EVENT_DTYPE = np.dtype([
+    ('symbol_id', 'i8'),
+    ('index', 'i8'),
+    ('direction', 'i1'),
+])
+
+def _cross_masks(series, other):
+    series = np.asarray(series)
+    other = np.broadcast_to(np.asarray(other), series.shape)
+    above, below = series > other, series < other
+    not_above, not_below = series <= other, series >= other
+    return above[1:] & not_above[:-1], below[1:] & not_below[:-1]
+
+def crossings(series, other=0):
+    """(cross up, cross down) index arrays of series against other, a
+    series of the same length or a threshold."""
+    up, down = _cross_masks(series, other)
+    return np.flatnonzero(up) + 1, np.flatnonzero(down) + 1
+
+def segment_crossings(series, offsets, other=0):
+    """Events of every segment of a packed series (see models.segments)
+    against other, flat alongside it or a threshold, as an EVENT_DTYPE
+    array ordered by symbol and index. Pairs straddling two segments are
+    not compared."""
+    up, down = _cross_masks(series, other)
+    boundary = offsets[1:-1]
+    boundary = boundary[(boundary > 0) & (boundary < len(up) + 1)] - 1
+    up[boundary] = down[boundary] = False
+    moves = up.view(np.int8) - down.view(np.int8)
+    position = np.flatnonzero(moves) + 1
+    events = np.empty(len(position), dtype=EVENT_DTYPE)
+    events['symbol_id'] = np.searchsorted(offsets, position, side='right') - 1
+    events['index'] = position - offsets[events['symbol_id']]
+    events['direction'] = moves[position - 1]
+    return events
@@ -0,0 +1,129 @@
+import os
+
+import h5py
+import numpy as np
+from scipy.signal import lfilter
+
+# lfilter computes in these dtypes without converting the input
+FILTER_DTYPES = (np.float32, np.float64)
+
+def decay(period, decay_factor=None):
+    """Smoothing factor of an EWMA over period, unless overridden."""
+    return 2 / (period + 1) if decay_factor is None else decay_factor
+
+def _ewma_loop(data, alpha):
+    out = np.zeros_like(data)
+    out[..., 0] = data[..., 0]
+    for i in range(1, data.shape[-1]):
+        out[..., i] = alpha * data[..., i] + (1 - alpha) * out[..., i - 1]
+    return out
+
+def ewma(data, period, decay_factor=None, initial=None):
+    """Exponentially weighted moving average along the last axis, seeded with
+    the first value, or continuing from initial (the average before data).
+
+    Runs as a first order IIR filter with its coefficients in the input's
+    dtype, which rounds every step exactly as the recurrence
+    out[i] = a * data[i] + (1 - a) * out[i - 1] does. Other dtypes (integer
+    input truncates each step) go through that recurrence directly."""
+    data = np.asarray(data)
+    alpha = decay(period, decay_factor)
+    if data.shape[-1] == 0:
+        return np.zeros_like(data)
+    if initial is None:
+        prev, rest = data[..., :1], data[..., 1:]
+    else:
+        prev, rest = np.asarray(initial, dtype=data.dtype)[..., None], data
+    if data.dtype.type not in FILTER_DTYPES:
+        out = _ewma_loop(np.concatenate([prev, rest], axis=-1), alpha)
+        return out if initial is None else out[..., 1:]
+    b = np.array([alpha], dtype=data.dtype)
+    a = np.array([1, -(1 - alpha)], dtype=data.dtype)
+    out = np.empty_like(data)
+    if initial is None:
+        out[..., 0] = data[..., 0]
+    out[..., out.shape[-1] - rest.shape[-1]:], _ = lfilter(b, a, rest, axis=-1, zi=-a[1] * prev)
+    return out
+
+def macd(data, short_period=12, long_period=26, signal_period=9, decay_factor=None):
+    """MACD line, signal line and histogram along the last axis, so a 2-D
+    array of equal length series is done in one call."""
+    macd_line = ewma(data, short_period, decay_factor) - ewma(data, long_period, decay_factor)
+    signal_line = ewma(macd_line, signal_period, decay_factor)
+    return macd_line, signal_line, macd_line - signal_line
+
+class IncrementalMACD:
+    """MACD kept up to date bar by bar, holding each symbol's short, long and
+    signal EMAs so new closes cost O(new bars).
+
+    Values are those macd() gives over the whole series in dtype, float64
+    by default as in the batch screens, and the state saves to an HDF5 file
+    (with its dtype) so a later run carries on from it."""
+
+    STATE = 'macd_state'
+
+    def __init__(self, short_period=12, long_period=26, signal_period=9, decay_factor=None,
+                 dtype=np.float64):
+        self.periods = (short_period, long_period, signal_period)
+        self.decay_factor = decay_factor
+        self.dtype = np.dtype(dtype)
+        self.state = {}     # symbol -> (bars seen, [short, long, signal] EMAs)
+
+    def state_dtype(self):
+        return np.dtype([('symbol', 'S16'), ('bars', 'i8'),
+                         ('short', self.dtype), ('long', self.dtype), ('signal', self.dtype)])
+
+    def update(self, symbol, closes):
+        """MACD line, signal line and histogram at new closes of symbol (a
+        scalar or 1-D batch, in time order after everything seen so far)."""
+        closes = np.asarray(closes, dtype=self.dtype)
+        scalar = closes.ndim == 0
+        closes = np.atleast_1d(closes)
+        short_period, long_period, signal_period = self.periods
+        bars, emas = self.state.get(symbol, (0, None))
+        if len(closes) == 0:
+            return tuple(np.empty(0, dtype=self.dtype) for _ in range(3))
+        short = ewma(closes, short_period, self.decay_factor, None if emas is None else emas[0])
+        long = ewma(closes, long_period, self.decay_factor, None if emas is None else emas[1])
+        macd_line = short - long
+        signal_line = ewma(macd_line, signal_period, self.decay_factor,
+                           None if emas is None else emas[2])
+        self.state[symbol] = (bars + len(closes),
+                              np.array([short[-1], long[-1], signal_line[-1]], dtype=self.dtype))
+        result = macd_line, signal_line, macd_line - signal_line
+        return tuple(values[-1] for values in result) if scalar else result
+
+    def last(self, symbol):
+        """(MACD, signal, histogram) after the latest close of symbol, or
+        None before any."""
+        if symbol not in self.state:
+            return None
+        short, long, signal_line = self.state[symbol][1]
+        macd_line = short - long
+        return macd_line, signal_line, macd_line - signal_line
+
+    def save(self, path):
+        table = np.zeros(len(self.state), dtype=self.state_dtype())
+        for i, symbol in enumerate(sorted(self.state)):
+            bars, emas = self.state[symbol]
+            table[i] = (symbol.encode(), bars, *emas)
+        with h5py.File(path + '.new', 'w') as h5f:
+            dataset = h5f.create_dataset(self.STATE, data=table)
+            dataset.attrs['periods'] = self.periods
+            if self.decay_factor is not None:
+                dataset.attrs['decay_factor'] = self.decay_factor
+        os.replace(path + '.new', path)
+
+    @classmethod
+    def load(cls, path):
+        with h5py.File(path, 'r') as h5f:
+            dataset = h5f[cls.STATE]
+            table = dataset[:]
+            decay_factor = dataset.attrs.get('decay_factor')
+            indicator = cls(*(int(p) for p in dataset.attrs['periods']),
+                            decay_factor=None if decay_factor is None else float(decay_factor),
+                            dtype=table.dtype['short'])
+        for row in table:
+            emas = np.array([row['short'], row['long'], row['signal']], dtype=indicator.dtype)
+            indicator.state[row['symbol'].decode()] = (int(row['bars']), emas)
+        return indicator
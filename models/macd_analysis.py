@@ -1,9 +1,13 @@
 import pandas as pd
 
-# MACD calculation: difference of the 12-day and 26-day EMAs, signal is 9-day EMA of MACD
-def calculate_macd(df):
-    df['ema_12'] = df['price'].ewm(span=12, adjust=False).mean()
-    df['ema_26'] = df['price'].ewm(span=26, adjust=False).mean()
-    df['macd'] = df['ema_12'] - df['ema_26']
-    df['signal'] = df['macd'].ewm(span=9, adjust=False).mean()
+from models.registry import DEFAULT_MACD
+
+# MACD calculation: difference of the short and long EMAs (12 and 26 by
+# default), signal is the signal period (9) EMA of MACD
+def calculate_macd(df, short_period=DEFAULT_MACD[0], long_period=DEFAULT_MACD[1],
+                   signal_period=DEFAULT_MACD[2]):
+    df[f'ema_{short_period}'] = df['price'].ewm(span=short_period, adjust=False).mean()
+    df[f'ema_{long_period}'] = df['price'].ewm(span=long_period, adjust=False).mean()
+    df['macd'] = df[f'ema_{short_period}'] - df[f'ema_{long_period}']
+    df['signal'] = df['macd'].ewm(span=signal_period, adjust=False).mean()
     return df
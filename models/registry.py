@@ -0,0 +1,166 @@
+"""Registry of named indicators with shared, memoized intermediates.
+
+An Indicators object wraps one symbol's bars (or just its closes) and
+computes each indicator at most once per parameter set; indicators ask it
+for the intermediates they need, so every MACD combination with a 12 period
+short EMA shares one EMA(12). macd_grid sweeps many (short, long, signal)
+combinations over the series in one call on top of that.
+"""
+import inspect
+import itertools
+
+import numpy as np
+
+from models.indicators import ewma
+from models.rolling import rolling_stats
+from utils.ohlc import PRICE_FIELDS, PRICE_SCALE, is_ticks, prices
+
+DEFAULT_MACD = (12, 26, 9)
+
+# name -> function(indicators, *params)
+INDICATORS = {}
+
+GRID_DTYPE = np.dtype([
+    ('short', 'i4'),
+    ('long', 'i4'),
+    ('signal', 'i4'),
+])
+
+def grid_params(shorts, longs, signals):
+    """GRID_DTYPE array of every (short, long, signal) combination with
+    short < long, ordered by short, long then signal."""
+    return np.array([combination for combination in itertools.product(
+                         sorted(set(shorts)), sorted(set(longs)), sorted(set(signals)))
+                     if combination[0] < combination[1]], dtype=GRID_DTYPE)
+
+def register(name):
+    """Decorator adding an indicator function to INDICATORS under name."""
+    def add(func):
+        INDICATORS[name] = func
+        return func
+    return add
+
+class Indicators:
+    """Memoized indicators of one series of bars.
+
+    bars is a structured array with the BAR_DTYPE (or TRADE_BAR_DTYPE)
+    fields an indicator needs, or a plain array of closes. Prices in ticks
+    (TICK_BAR_DTYPE and the like) become float64 here."""
+
+    def __init__(self, bars):
+        bars = np.asarray(bars)
+        if bars.dtype.names:
+            ticks = is_ticks(bars)
+            self.columns = {name: bars[name] / PRICE_SCALE if ticks and name in PRICE_FIELDS
+                            else bars[name] for name in bars.dtype.names}
+        else:
+            self.columns = {'close': prices(bars) if is_ticks(bars) else bars}
+        self.memo = {}
+
+    def __len__(self):
+        return len(self.columns['close'])
+
+    def column(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise ValueError(f'Indicator needs a {name} column') from None
+
+    def __call__(self, name, *params):
+        """Indicator name at params, computed on first use."""
+        try:
+            func = INDICATORS[name]
+        except KeyError:
+            raise ValueError(f'Unknown indicator {name}') from None
+        # defaults filled in, so ema(12) and ema(12, None) share an entry
+        bound = inspect.signature(func).bind(self, *params)
+        bound.apply_defaults()
+        key = (name, *bound.args[1:])
+        if key not in self.memo:
+            self.memo[key] = func(*bound.args)
+        return self.memo[key]
+
+    def macd_grid(self, shorts, longs, signals, decay_factor=None):
+        """Every (short, long, signal) combination with short < long.
+
+        Returns (params, macd, signal, histogram): params a GRID_DTYPE array
+        and the rest 2-D, one row per combination. EMAs come from the memo,
+        and each signal period runs over all MACD lines at once."""
+        params = grid_params(shorts, longs, signals)
+        signals = sorted(set(signals))
+        pairs = list(dict.fromkeys(zip(params['short'].tolist(), params['long'].tolist())))
+        if not pairs:
+            empty = np.empty((0, len(self)), dtype=self.column('close').dtype)
+            return params, empty, empty, empty
+        lines = np.stack([self('macd_line', short, long, decay_factor) for short, long in pairs])
+        signal_lines = np.stack([ewma(lines, signal, decay_factor) for signal in signals], axis=1)
+        macd_lines = np.repeat(lines, len(signals), axis=0)
+        signal_lines = signal_lines.reshape(macd_lines.shape)
+        return params, macd_lines, signal_lines, macd_lines - signal_lines
+
+@register('ema')
+def ema(indicators, period, decay_factor=None, source='close'):
+    return ewma(indicators.column(source), period, decay_factor)
+
+@register('macd_line')
+def macd_line(indicators, short_period, long_period, decay_factor=None):
+    return indicators('ema', short_period, decay_factor) - indicators('ema', long_period, decay_factor)
+
+@register('macd')
+def macd(indicators, short_period=DEFAULT_MACD[0], long_period=DEFAULT_MACD[1],
+         signal_period=DEFAULT_MACD[2], decay_factor=None):
+    """(MACD line, signal line, histogram), as models.indicators.macd."""
+    line = indicators('macd_line', short_period, long_period, decay_factor)
+    signal_line = ewma(line, signal_period, decay_factor)
+    return line, signal_line, line - signal_line
+
+@register('rsi')
+def rsi(indicators, period=14):
+    """Relative strength index with Wilder's smoothing (an EWMA with factor
+    1 / period), seeded from the first change."""
+    change = np.diff(indicators.column('close').astype(np.float64))
+    if len(change) == 0:
+        return np.full(len(indicators), np.nan)
+    gain = ewma(np.maximum(change, 0), period, 1 / period)
+    loss = ewma(np.maximum(-change, 0), period, 1 / period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        strength = np.where(loss > 0, 100 - 100 / (1 + gain / loss), np.where(gain > 0, 100, 50))
+    return np.r_[np.nan, strength]
+
+@register('bollinger')
+def bollinger(indicators, window=20, width=2.0):
+    """(middle, upper, lower) bands: rolling mean of closes plus and minus
+    width (population) standard deviations."""
+    stats = indicators('rolling', window)
+    return stats['mean'], stats['mean'] + width * stats['std'], stats['mean'] - width * stats['std']
+
+@register('rolling')
+def rolling(indicators, window, source='close'):
+    """models.rolling statistics of a column over window."""
+    return rolling_stats(indicators.column(source), window)
+
+@register('true_range')
+def true_range(indicators):
+    high = indicators.column('high').astype(np.float64)
+    low = indicators.column('low').astype(np.float64)
+    previous = np.r_[np.nan, indicators.column('close')[:-1]].astype(np.float64)
+    ranges = np.stack([high - low, np.abs(high - previous), np.abs(low - previous)])
+    return np.nanmax(ranges, axis=0) if len(high) else high
+
+@register('atr')
+def atr(indicators, period=14):
+    """Average true range with Wilder's smoothing."""
+    return ewma(indicators('true_range'), period, 1 / period)
+
+@register('vwap')
+def vwap(indicators):
+    """Running volume weighted average price over the series, from the bars'
+    own VWAP when they carry one, else their typical price."""
+    volume = indicators.column('volume').astype(np.float64)
+    if 'vwap' in indicators.columns:
+        price = indicators.column('vwap')
+    else:
+        price = (indicators.column('high').astype(np.float64) + indicators.column('low')
+                 + indicators.column('close')) / 3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.cumsum(price * volume) / np.cumsum(volume)
@@ -0,0 +1,119 @@
+"""Rolling window statistics from cumulative sums.
+
+Cumulative sums of y, y * y and x * y (x counting from a segment's start,
+y less the segment's first value to keep the sums small), restarted at
+every segment, give the sums over any window as two lookups, so every
+statistic of every window length costs O(1) per position once the sums are
+built in one pass. Windows never reach
+back past the start of their segment; the first positions of a segment see
+fewer than window points.
+"""
+import numpy as np
+
+# statistics of window_stats, each one value per position asked for
+STATS = ('count', 'mean', 'std', 'slope', 'intercept', 'r2', 'zscore')
+
+def prefix_sums(values, offsets=None):
+    """Cumulative sums of a series, or of every segment of a packed one
+    (see models.segments), for window_stats. The sums restart at every
+    segment, so a segment's statistics never depend on the ones before it."""
+    values = np.asarray(values)
+    n = len(values)
+    if offsets is None:
+        offsets = np.array([0, n], dtype=np.int64)
+    start = np.repeat(offsets[:-1], np.diff(offsets)).astype(np.int64)
+    base = values[start].astype(np.float64) if n else np.empty(0)
+    y = values - base
+    x = (np.arange(n) - start).astype(np.float64)
+    # models.segments builds on this module, so it is imported here
+    from models.segments import apply_padded
+    sy, syy, sxy = apply_padded(lambda y, x: (np.cumsum(y, axis=-1), np.cumsum(y * y, axis=-1),
+                                              np.cumsum(x * y, axis=-1)), offsets, y, x)
+    return {
+        'values': values,
+        'start': start,
+        'base': base,
+        'y': sy,
+        'yy': syy,
+        'xy': sxy,
+    }
+
+def window_stats(sums, window, at=None):
+    """{stat: array} over the window values ending at each position in at
+    (default every position): count, mean and (population) std, the least
+    squares slope and intercept against 0..count-1 with its r2, and the
+    z-score of the last value. Slope, intercept and r2 are NaN for single
+    points, the z-score NaN where std is 0."""
+    at = np.arange(len(sums['values'])) if at is None else np.asarray(at, dtype=np.int64)
+    start = sums['start'][at]
+    first = np.maximum(at - window + 1, start)
+    n = (at - first + 1).astype(np.float64)
+
+    def window_sum(name):
+        # sums run from the segment start, so a window there takes them whole
+        return sums[name][at] - np.where(first > start, sums[name][first - 1], 0)
+
+    sy, syy = window_sum('y'), window_sum('yy')
+    # x restarts at the window's first position
+    sxy = window_sum('xy') - (first - start) * sy
+    mean = sy / n
+    ssy = np.maximum(syy - sy * mean, 0)
+    return _stats(n, mean, ssy, sxy - (n - 1) / 2 * sy,
+                  sums['values'][at] - sums['base'][at], sums['base'][at])
+
+def _stats(n, mean, ssy, cov, last, base):
+    """window_stats from the count, mean, sum of squared deviations and
+    covariance sum against position of windows of y (values less base) and
+    the last y of each."""
+    sxx = n * (n * n - 1) / 12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(n >= 2, cov / sxx, np.nan)
+        r2 = np.where(n >= 2, np.where(ssy > 0, cov * cov / (sxx * ssy), 0), np.nan)
+        std = np.sqrt(ssy / n)
+        zscore = np.where(std > 0, (last - mean) / std, np.nan)
+    return {
+        'count': n.astype(np.int64),
+        'mean': mean + base,
+        'std': std,
+        'slope': slope,
+        'intercept': mean - slope * (n - 1) / 2 + base,
+        'r2': np.minimum(r2, 1),
+        'zscore': zscore,
+    }
+
+def rolling_stats(values, window, offsets=None):
+    """window_stats at every position of a series or packed segments."""
+    return window_stats(prefix_sums(values, offsets), window)
+
+def segment_ends(offsets):
+    """Position of the last value of every non-empty segment, and the mask
+    of which segments those are."""
+    nonempty = np.diff(offsets) > 0
+    return offsets[1:][nonempty] - 1, nonempty
+
+def last_window_stats(values, offsets, window):
+    """window_stats over the last window values of every segment, NaN
+    (count 0) for empty segments.
+
+    Only those values are read: they are gathered into one left aligned row
+    per segment and fitted directly, with no sums over the rest."""
+    values = np.asarray(values)
+    ends, nonempty = segment_ends(offsets)
+    n = np.minimum(np.diff(offsets)[nonempty], window)
+    x = np.arange(window)
+    valid = x < n[:, None]
+    index = np.where(valid, ends[:, None] - n[:, None] + 1 + x, 0)
+    y = np.where(valid, values[index] if len(values) else 0, 0).astype(np.float64)
+    counts = n.astype(np.float64)
+    mean = y.sum(axis=1) / counts if len(n) else np.empty(0)
+    deviation = np.where(valid, y - mean[:, None], 0)
+    ssy = (deviation * deviation).sum(axis=1)
+    cov = (np.where(valid, x - (counts[:, None] - 1) / 2, 0) * deviation).sum(axis=1)
+    last = y[np.arange(len(n)), n - 1] if len(n) else np.empty(0)
+    stats = _stats(counts, mean, ssy, cov, last, np.zeros(len(n)))
+    out = {}
+    for name, column in stats.items():
+        out[name] = np.zeros(len(nonempty), dtype=column.dtype) if name == 'count' \
+            else np.full(len(nonempty), np.nan)
+        out[name][nonempty] = column
+    return out
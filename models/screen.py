@@ -0,0 +1,78 @@
+"""Universe screens over an HDF5 archive.
+
+Symbols are split into shards, one per worker process. Each worker reads
+its shard's bars file-major (every day file or store opened once), with
+prices in ticks up to the float closes the batched indicators run over,
+all symbols in one pass; the parent applies the
+predicate and ranking to the per-symbol summaries that come back. Bars go
+through data.cache, which worker processes do not share: a single shard
+(workers=1, or few symbols) runs in this process, so repeating it is served
+from memory.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data.catalog import date_catalog
+from data.load import universe_bars
+from models.segments import macd_summary, pack, segment_lengths
+from utils.ohlc import prices
+from utils.trading_calendar import session_dates
+
+DEFAULT_WORKERS = 8
+# below this many symbols per worker a pool costs more than it saves
+MIN_SHARD = 256
+
+def macd_setup(min_slope=0.0, negative=True, below_signal=True):
+    """Predicate of the classic screen: MACD and signal line negative, MACD
+    below the signal line and rising faster than min_slope."""
+    def predicate(summary):
+        keep = summary['slope'] > min_slope
+        if negative:
+            keep &= (summary['macd'] < 0) & (summary['signal'] < 0)
+        if below_signal:
+            keep &= summary['macd'] < summary['signal']
+        return keep
+    return predicate
+
+def map_shards(func, symbols, workers, *args):
+    """[func(shard, *args)] over symbols split into up to workers shards
+    of at least MIN_SHARD symbols, in worker processes when more than one."""
+    shards = max(1, min(workers, len(symbols) // MIN_SHARD))
+    bounds = np.linspace(0, len(symbols), shards + 1).astype(int)
+    jobs = [symbols[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    if shards == 1:
+        return [func(jobs[0], *args)]
+    with ProcessPoolExecutor(max_workers=shards) as pool:
+        return list(pool.map(func, jobs, *([arg] * shards for arg in args)))
+
+def _screen_shard(symbols, dates, file_path_template, interval, hours, catalog, periods, window):
+    bars = universe_bars(symbols, dates, file_path_template, interval, catalog, hours, ticks=True)
+    empty = np.empty(0, dtype=np.int64)
+    ticks, offsets = pack([bars[symbol]['close'] if symbol in bars else empty
+                           for symbol in symbols], dtype=np.int64)
+    summary = macd_summary(prices(ticks), offsets, *periods, window=window)
+    summary['bars'] = segment_lengths(offsets)
+    return summary
+
+def screen(symbols, date_range, file_path_template, interval='5min', predicate=None,
+           rank_by='slope', top=None, periods=(12, 26, 9), window=5, hours='regular',
+           catalog=None, workers=DEFAULT_WORKERS):
+    """Ranked (symbol, value) pairs of the symbols whose MACD summary (see
+    models.segments.macd_summary) over the sessions of date_range passes
+    predicate (default macd_setup()), best first by the summary field
+    rank_by, at most top of them. Symbols without bars never pass. Bars
+    are buckets of the hours ('regular' or 'extended') sessions, the stored
+    bars with hours None."""
+    symbols = list(symbols)
+    dates = session_dates(*date_range)
+    if catalog is None:
+        catalog = date_catalog(dates, file_path_template)
+    parts = map_shards(_screen_shard, symbols, workers, dates, file_path_template, interval,
+                       hours, catalog, periods, window)
+    summary = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    keep = (summary['bars'] > 0) & (predicate or macd_setup())(summary)
+    ranked = np.flatnonzero(keep)
+    ranked = ranked[np.argsort(-summary[rank_by][ranked], kind='stable')][:top]
+    return [(symbols[i], float(summary[rank_by][i])) for i in ranked]
@@ -0,0 +1,98 @@
+"""Indicators over many series at once, packed CSR style.
+
+Every symbol's values sit back to back in one flat array and offsets (one
+longer than the number of symbols) marks where each starts, so segment i is
+values[offsets[i]:offsets[i + 1]]. Filters run on padded 2-D blocks of
+segments of similar length, one row per segment, which restarts them at
+every segment boundary and gives the same numbers as running them on each
+segment alone. Results come back flat, or as one value per segment.
+"""
+import numpy as np
+
+from models.indicators import macd
+from models.rolling import last_window_stats
+
+def pack(arrays, dtype=None):
+    """(values, offsets) of a sequence of 1-D arrays."""
+    lengths = [len(array) for array in arrays]
+    offsets = np.r_[0, np.cumsum(lengths, dtype=np.int64)].astype(np.int64)
+    if dtype is None:
+        dtype = np.result_type(*arrays) if len(arrays) else np.float64
+    if not len(arrays):
+        return np.empty(0, dtype=dtype), offsets
+    return np.concatenate(arrays).astype(dtype, copy=False), offsets
+
+def segment_lengths(offsets):
+    return np.diff(offsets)
+
+def length_classes(offsets):
+    """Segment ids grouped by length, each group's lengths within a factor
+    of two, so padding a group to its longest member at most doubles it."""
+    lengths = segment_lengths(offsets)
+    ids = np.flatnonzero(lengths)
+    if len(ids) == 0:
+        return []
+    classes = np.ceil(np.log2(lengths[ids])).astype(np.int64)
+    order = np.argsort(classes, kind='stable')
+    ids, classes = ids[order], classes[order]
+    bounds = np.flatnonzero(np.r_[True, classes[1:] != classes[:-1], True])
+    return [ids[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+def apply_padded(func, offsets, *arrays):
+    """Flat outputs of func run on segments of arrays as padded rows.
+
+    func takes 2-D arrays (one row per segment, padded at the end by
+    repeating the segment's last value) and returns a tuple of arrays of
+    the same shape; it must not let padding affect the values before it."""
+    outputs = None
+    lengths = segment_lengths(offsets)
+    for ids in length_classes(offsets):
+        width = lengths[ids].max()
+        steps = np.arange(width)
+        index = offsets[ids, None] + np.minimum(steps, lengths[ids, None] - 1)
+        valid = steps < lengths[ids, None]
+        results = func(*(array[index] for array in arrays))
+        if outputs is None:
+            outputs = tuple(np.empty(offsets[-1], dtype=result.dtype) for result in results)
+        for output, result in zip(outputs, results):
+            output[index[valid]] = result[valid]
+    if outputs is None:     # every segment empty
+        outputs = tuple(np.empty(0, dtype=result.dtype)
+                        for result in func(*(array[:0].reshape(0, 0) for array in arrays)))
+    return outputs
+
+def segment_macd(values, offsets, short_period=12, long_period=26, signal_period=9,
+                 decay_factor=None):
+    """Flat MACD line, signal line and histogram of every segment."""
+    return apply_padded(lambda rows: macd(rows, short_period, long_period, signal_period,
+                                          decay_factor), offsets, values)
+
+def segment_last(values, offsets, fill=np.nan):
+    """Last value of every segment, fill for empty ones."""
+    lengths = segment_lengths(offsets)
+    last = np.full(len(lengths), fill, dtype=values.dtype if values.dtype.kind == 'f' else np.float64)
+    nonempty = lengths > 0
+    last[nonempty] = values[offsets[1:][nonempty] - 1]
+    return last
+
+def segment_slope(values, offsets, window=5):
+    """Least squares slope against position of the last window values of
+    every segment (fewer in shorter ones), NaN with fewer than two."""
+    return last_window_stats(values, offsets, window)['slope']
+
+def macd_summary(values, offsets, short_period=12, long_period=26, signal_period=9,
+                 decay_factor=None, window=5):
+    """{name: per segment array} of the last MACD, signal and histogram
+    values, and the slope, its r2 and the z-score of the MACD line over its
+    last window points."""
+    macd_line, signal_line, histogram = segment_macd(values, offsets, short_period, long_period,
+                                                     signal_period, decay_factor)
+    trend = last_window_stats(macd_line, offsets, window)
+    return {
+        'macd': segment_last(macd_line, offsets),
+        'signal': segment_last(signal_line, offsets),
+        'histogram': segment_last(histogram, offsets),
+        'slope': trend['slope'],
+        'r2': trend['r2'],
+        'zscore': trend['zscore'],
+    }
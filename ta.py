@@ -1,35 +1,40 @@
 import h5py
 import numpy as np
 import pandas as pd
-from scipy.stats import linregress
 from typing import Tuple, List, Optional
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from datetime import datetime, timedelta
-from os.path import isfile
 
-# Define default MACD parameters
-DEFAULT_SHORT_PERIOD = 12
-DEFAULT_LONG_PERIOD = 26
-DEFAULT_SIGNAL_PERIOD = 9
-#DEFAULT_SHORT_PERIOD = 3
-#DEFAULT_LONG_PERIOD = 10
-#DEFAULT_SIGNAL_PERIOD = 16
+from data import cache
+from data.catalog import date_catalog, universe
+from data.compact import symbol_sources
+from data.load import file_bars, load_trades, trades_frame
+from models import indicators
+from models.events import crossings
+from models.registry import DEFAULT_MACD
+from models.screen import DEFAULT_WORKERS, macd_setup, screen
+from utils.ohlc import BAR_DTYPE, INTERVAL_NS, float_bars, trade_bars
+from utils.trading_calendar import session_dates
+
+# Define default MACD parameters; sweep others with Indicators.macd_grid
+DEFAULT_SHORT_PERIOD, DEFAULT_LONG_PERIOD, DEFAULT_SIGNAL_PERIOD = DEFAULT_MACD
 
 # Helper function to generate a list of dates between two dates
 def generate_date_range(start_date: str, end_date: str) -> List[str]:
-    """Generate a list of date strings between start_date and end_date."""
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    g = [(start+timedelta(days=i)).strftime("%Y%m%d") for i in range((end-start).days+1)]
-    dates = list(g)
-    return dates
+    """Generate a list of date strings of the trading sessions between start_date
+    and end_date; weekends and exchange holidays have no day files."""
+    return session_dates(start_date, end_date)
 
 # Function to load tick data from multiple HDF5 files in date range
 def load_tick_data(symbol: str,
                    start_date: str,
                    end_date: str,
-                   file_path_template: str) -> pd.DataFrame:
+                   file_path_template: str,
+                   columns: Tuple[str, ...] = ('ts', 'price'),
+                   start_ts: Optional[int] = None,
+                   end_ts: Optional[int] = None,
+                   catalog: Optional[dict] = None,
+                   ticks: bool = False) -> pd.DataFrame:
     """
     Load tick data for a symbol across multiple HDF5 files within a specific date range.
     
@@ -38,47 +43,69 @@ def load_tick_data(symbol: str,
     - start_date: Start date in "YYYY-MM-DD" format.
     - end_date: End date in "YYYY-MM-DD" format.
     - file_path_template: "/path/to/data/{}.h5" with {} replaced with date.
+    - columns: Trade columns to read; only these are read from columnar files.
+    - start_ts, end_ts: Optional ns bounds; only trades with start_ts <= ts < end_ts are read.
+    - catalog: Archive catalog (see data.catalog.load_catalog), loaded when not given.
+    - ticks: Prices as int64 ticks (see utils.ohlc.PRICE_SCALE) instead of floats.
 
     Returns:
     - A concatenated DataFrame of tick data within the specified date range.
     """
     date_range = generate_date_range(start_date, end_date)
-    all_data = []
-    
-    for date in date_range:
-        file_path = file_path_template.format(date)
-        if isfile(file_path): # ignore missing files
-            try:
-                with h5py.File(file_path, 'r') as f:
-                    group_path = f"trades/{symbol}"
-                    if group_path in f:
-                        symbol_data = f[group_path]
-                        df = pd.DataFrame({
-                            #'timestamp': symbol_data['timestamp'][:],
-                            'ts': symbol_data['ts'][:],
-                            'price': symbol_data['price'][:],
-                            'size': symbol_data['size'][:],
-                            'trade_id': symbol_data['trade_id'][:]
-                        })
-                        df['ts'] = pd.to_datetime(df['ts'], unit='ns')
-                        all_data.append(df)
-            except (OSError, KeyError):
-                print(f"File or group not found for {file_path} and symbol {symbol}")
-        else:
-            continue
-    
-    return pd.concat(all_data, ignore_index=True) if all_data else pd.DataFrame()
+
+    # compacted stores serve the days they cover, one read per run of days;
+    # the catalog rules out other days without the symbol before any file is opened
+    trades = load_trades(symbol, date_range, file_path_template, columns,
+                         start_ts, end_ts, catalog, ticks=ticks)
+    return trades_frame(trades) if len(next(iter(trades.values()), [])) else pd.DataFrame()
+
+# Function to load pre-aggregated bars from multiple HDF5 files in date range
+def load_bars(symbol: str,
+              start_date: str,
+              end_date: str,
+              file_path_template: str,
+              interval: str = '5min',
+              catalog: Optional[dict] = None,
+              hours: Optional[str] = 'regular') -> np.ndarray:
+    """
+    Load the OHLCV bars written at ingest for a symbol across a date range.
+
+    Days whose file predates bars are aggregated from their ticks instead.
+    catalog is the archive catalog (see data.catalog.load_catalog), loaded
+    when not given. The bars are buckets of the regular trading sessions
+    rolled up from the 1min bars, of the extended ones with hours
+    'extended', or the stored bars as they are with hours None (see
+    utils.ohlc.stored_hours).
+
+    Returns:
+    - Bars (see BAR_DTYPE) in time order, empty when there is no data.
+    """
+    def read_file_bars(file_path, store_days):
+        with h5py.File(file_path, 'r') as f:
+            if f"trades/{symbol}" not in f:
+                return {}
+            return {'bars': file_bars(f, symbol, store_days, interval, hours)}
+
+    all_bars = []
+    for file_path, store_days in symbol_sources(symbol, generate_date_range(start_date, end_date),
+                                                file_path_template, catalog=catalog):
+        try:
+            # repeated screens over the same days are served from memory
+            # (shared with data.load.universe_bars, so keyed by price kind too)
+            cached = cache.CACHE.fetch(file_path, symbol,
+                                       ('bars', interval, hours, False, *(store_days or ())),
+                                       lambda: read_file_bars(file_path, store_days))
+            if cached:
+                all_bars.append(cached['bars'])
+        except (OSError, KeyError):
+            print(f"File or group not found for {file_path} and symbol {symbol}")
+
+    return np.concatenate(all_bars) if all_bars else np.empty(0, dtype=BAR_DTYPE)
 
 # EWMA Calculation with Custom Decay
 def ewma(data: np.ndarray, period: int, decay_factor: Optional[float] = None) -> np.ndarray:
-    """Calculate Exponentially Weighted Moving Average."""
-    if decay_factor is None:
-        decay_factor = 2 / (period + 1)
-    ewma_data = np.zeros_like(data)
-    ewma_data[0] = data[0]
-    for i in range(1, len(data)):
-        ewma_data[i] = decay_factor * data[i] + (1 - decay_factor) * ewma_data[i - 1]
-    return ewma_data
+    """Calculate Exponentially Weighted Moving Average along the last axis."""
+    return indicators.ewma(data, period, decay_factor)
 
 # MACD Calculation
 def calculate_macd(data: np.ndarray,
@@ -88,24 +115,16 @@ def calculate_macd(data: np.ndarray,
                    decay_factor: Optional[float] = None) -> Tuple[np.ndarray,
                                                                   np.ndarray,
                                                                   np.ndarray]:
-    """Calculate MACD line, Signal line, and MACD histogram."""
-    short_ema = ewma(data, short_period, decay_factor)
-    long_ema = ewma(data, long_period, decay_factor)
-    macd_line = short_ema - long_ema
-    signal_line = ewma(macd_line, signal_period, decay_factor)
-    macd_histogram = macd_line - signal_line
-    return macd_line, signal_line, macd_histogram
+    """Calculate MACD line, Signal line, and MACD histogram.
+
+    data may be 2-D, one equal length series per row."""
+    return indicators.macd(data, short_period, long_period, signal_period, decay_factor)
 
 # Mark Condition Function
 def find_macd_conditions(macd_line: np.ndarray, signal_line: np.ndarray) -> List[int]:
     """Identify points where MACD crosses above/below the signal line."""
-    conditions = []
-    for i in range(1, len(macd_line)):
-        if macd_line[i] > signal_line[i] and macd_line[i - 1] <= signal_line[i - 1]:
-            conditions.append(i)  # Cross above
-        elif macd_line[i] < signal_line[i] and macd_line[i - 1] >= signal_line[i - 1]:
-            conditions.append(i)  # Cross below
-    return conditions
+    cross_above, cross_below = crossings(macd_line, signal_line)
+    return np.sort(np.concatenate([cross_above, cross_below])).tolist()
 
 # Visualization
 # Modified plot_macd function to use aggregated timestamps
@@ -155,115 +174,89 @@ def plot_macd(aggregated_data: np.ndarray,
 
 # Define a function to convert timestamp to the nearest interval
 def convert_to_interval(ts: np.ndarray, interval: str = '1min') -> np.ndarray:
-    """Convert nanosecond timestamps to the nearest interval."""
+    """Convert nanosecond timestamps to the index of their fixed length
+    interval from the epoch. Session buckets, which the bar builders use,
+    come from utils.trading_calendar.session_buckets."""
 
     # Convert datetime64[ns] to integer nanoseconds
     ts_ns = ts.astype('int64')
-
-    if interval == '1min':
-        interval_ns = int(60 * 1e9) # 1 minute in nanoseconds
-    elif interval == '5min':
-        interval_ns = int(5 * 60 * 1e9) # 5 minutes in nanoseconds
-    elif interval == '10min':
-        interval_ns = int(10 * 60 * 1e9)
-    elif interval == '30min':
-        interval_ns = int(30 * 60 * 1e9)
-    elif interval == '1h':
-        interval_ns = int(60 * 60 * 1e9)
-    elif interval == '2h':
-        interval_ns = int(120 * 60 * 1e9)
-    elif interval == '4h':
-        interval_ns = int(240 * 60 * 1e9)
-    elif interval == '1d':
-        interval_ns = int(390 * 60 * 1e9)
-    else:
+    if interval not in INTERVAL_NS:
         raise ValueError(f'Unsupported interval {interval}')
+    interval_ns = INTERVAL_NS[interval]
 
     # Calculate interval index (bucket) for each timestamp
     return (ts_ns // interval_ns).astype(np.int64)
 
 # Aggregate data at specified intervals
-def aggregate_trades(trades: np.ndarray, interval: str = '1min') -> np.ndarray:
+def aggregate_trades(trades: np.ndarray, interval: str = '1min',
+                     hours: Optional[str] = 'regular') -> np.ndarray:
     """Aggregate trade data to specified intervals.
 
     Parameters:
-    - trades: NumPy structured array with 'ts' and 'price' fields.
+    - trades: NumPy structured array with 'ts' and 'price' fields, in time
+      order, and optionally 'size' (each trade counts 1 without it).
     - interval: Time interval for aggregation ('1min', '5min', etc.)
+    - hours: 'regular' (default) or 'extended' for buckets of the trading
+      sessions, leaving out trades outside them; None for fixed lengths
+      from the epoch.
 
     Returns:
-    - Aggregated close prices per interval."""
-
-    intervals = convert_to_interval(trades['ts'], interval)
-    unique_intervals, last_indices = np.unique(intervals, return_index=True)
-
-    # Extract the last trade per interval as the "close" price
-    close_prices = trades['price'][last_indices]
-    timestamps = trades['ts'][last_indices]
-
-    # Return structured array with interval timestamps and close prices
-    return np.array(list(zip(timestamps, close_prices)),
-                    dtype=[('ts', 'i8'), ('close', 'f4')])
+    - Bars (see TRADE_BAR_DTYPE, or TICK_TRADE_BAR_DTYPE for prices in ticks)
+      per interval: ts is the interval start, close the price of its last trade."""
+    ts = trades['ts'].astype('int64')
+    size = trades['size'] if 'size' in trades.dtype.names else np.ones(len(trades), dtype=np.int64)
+    return trade_bars(ts, trades['price'], size, interval, hours)
 
 def filter_symbols_for_macd(symbols: List[str],
                             date_range: Tuple[str, str],
                             file_path_template: str,
-                            interval: str = '5min') -> List[Tuple[str, float]]:
+                            interval: str = '5min',
+                            catalog: Optional[dict] = None,
+                            min_slope: float = 0.0,
+                            top: Optional[int] = None,
+                            workers: int = DEFAULT_WORKERS,
+                            hours: Optional[str] = 'regular') -> List[Tuple[str, float]]:
     """ Filter symbols based on MACD criteria: both MACD and Signal Line are negative,
     and MACD is trending toward a crossover with the highest positive slope.
 
-    Returns:
-    - A list of tuples with (symbol, slope), sorted by the greatest positive slope."""
-
-    qualified_symbols = []
-
-    for symbol in symbols:
-        # Load and aggregate data
-        tick_data = load_tick_data(symbol, date_range[0], date_range[1], file_path_template)
-        if tick_data.empty:
-            continue  # Skip symbols with no data
-
-        aggregated_data = aggregate_trades(tick_data.to_records(), interval=interval)
-
-        # Calculate MACD and Signal Line
-        macd_line, signal_line, _ = calculate_macd(aggregated_data['close'])
+    Each day file is opened once per worker process for all symbols (see
+    models.screen.screen); the slope is over the last 5 MACD points. Bars
+    are buckets of the regular sessions unless hours says otherwise (None
+    for the fixed length bars stored at ingest).
 
-        # Check if both MACD and Signal Line are negative
-        if macd_line[-1] < 0 and signal_line[-1] < 0:
-            # Calculate slope over the last few points to assess trend
-            # TODO
-            #recent_macd = macd_line[-3:]  # Last 5 points for slope calculation
-            recent_macd = macd_line[-5:]  # Last 5 points for slope calculation
-            slope, _, _, _, _ = linregress(range(len(recent_macd)), recent_macd)
-
-            # Check if MACD is trending positively (towards crossing signal line)
-            # TODO
-            if slope > 0 and macd_line[-1] < signal_line[-1]:
-            #if slope > 0 and macd_line[-1] == signal_line[-1]:
-                qualified_symbols.append((symbol, slope))
-
-    # Sort symbols by the greatest positive slope
-    qualified_symbols.sort(key=lambda x: x[1], reverse=True)
-
-    return qualified_symbols
+    Returns:
+    - A list of tuples with (symbol, slope), sorted by the greatest positive slope,
+      at most top of them."""
+    return screen(symbols, date_range, file_path_template, interval=interval,
+                  predicate=macd_setup(min_slope=min_slope), rank_by='slope', top=top,
+                  periods=(DEFAULT_SHORT_PERIOD, DEFAULT_LONG_PERIOD, DEFAULT_SIGNAL_PERIOD),
+                  window=5, hours=hours, catalog=catalog, workers=workers)
 
 
 # Example usage
-symbols = []
-with h5py.File('/srv/b/h5/20241028.h5', 'r') as hf:
-    for symbol in hf['trades'].keys():
-        symbols.append(symbol)
-
 date_range = ('2024-10-28', '2024-11-01')
 file_path_template = '/srv/b/h5/{}.h5'
 
+# Universe of the date range, from the archive catalog when there is one
+catalog = date_catalog(generate_date_range(*date_range), file_path_template)
+if catalog:
+    symbols = universe(catalog)
+else:
+    symbols = []
+    with h5py.File('/srv/b/h5/20241028.h5', 'r') as hf:
+        for symbol in hf['trades'].keys():
+            symbols.append(symbol)
+
 # Get symbols prioritized by MACD trend
 filtered_symbols = filter_symbols_for_macd(symbols,
                                            date_range,
                                            file_path_template,
-                                           interval='2h')
+                                           interval='2h',
+                                           catalog=catalog,
+                                           top=25)
 
 # Display the top results
-for symbol, slope in filtered_symbols[:25]:  # Limit to top 25
+for symbol, slope in filtered_symbols:
     print(f'Symbol: {symbol}  Slope: {slope:.4f}')
 
 
@@ -281,11 +274,14 @@ if __name__ == '__main__':
     tick_data = load_tick_data(args.symbol,
                                args.start_date,
                                args.end_date,
-                               args.file_path_template)
+                               args.file_path_template,
+                               columns=('ts', 'price', 'size'),
+                               ticks=True)
     if tick_data.empty:
         print(f"No data available for symbol {symbol} in the given date range.")
     elif args.aggregate:
-        aggregated_data = aggregate_trades(tick_data.to_records(), interval=args.aggregate)
+        # bars are built from exact ticks; prices become floats for the plot
+        aggregated_data = float_bars(aggregate_trades(tick_data.to_records(), interval=args.aggregate))
         macd_line, signal_line, _ = calculate_macd(aggregated_data['close'])
     
         # Plot the MACD and conditions
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import models.backtest
+import models.screen
+from models.backtest import STATS, backtest, grid_backtest, run_grid
+from models.indicators import macd
+from models.registry import grid_params
+from models.segments import apply_padded, pack
+from tests.screen_test import universe
+
+
+def walk(n, seed):
+    rng = np.random.default_rng(seed)
+    return (50 + np.cumsum(rng.normal(0, 0.3, n))).clip(1).astype('f4')
+
+
+def reference(closes, short=12, long=26, signal=9, cost=0.0):
+    # bar by bar: long from a cross up to the next cross down
+    macd_line, signal_line, _ = macd(closes, short, long, signal)
+    closes = closes.astype('f8')
+    trades, equity, peak, drawdown, traded, entry = [], 1.0, 1.0, 0.0, 0, None
+    for i in range(len(closes)):
+        if entry is not None and i > 0:
+            equity *= closes[i] / closes[i - 1]
+        up = i > 0 and macd_line[i] > signal_line[i] and macd_line[i - 1] <= signal_line[i - 1]
+        down = i > 0 and macd_line[i] < signal_line[i] and macd_line[i - 1] >= signal_line[i - 1]
+        last = i == len(closes) - 1
+        if entry is None and up:
+            entry, traded, equity = i, traded + 1, equity * (1 - cost)
+        elif entry is not None and (down or last):
+            trades.append((entry, i, closes[i] / closes[entry] * (1 - cost) ** 2 - 1, not down))
+            entry, traded, equity = None, traded + 1, equity * (1 - cost)
+        peak = max(peak, equity)
+        drawdown = max(drawdown, 1 - equity / peak)
+    return trades, equity - 1, drawdown, traded / len(closes)
+
+
+@pytest.mark.parametrize('cost', [0.0, 0.001])
+def test_backtest_matches_bar_loop(cost):
+    pieces = [walk(n, seed) for seed, n in enumerate([500, 0, 1, 40, 2000])]
+    closes, offsets = pack(pieces)
+    macd_line = np.concatenate([macd(p)[0] for p in pieces])
+    signal_line = np.concatenate([macd(p)[1] for p in pieces])
+    trades, stats = backtest(closes, offsets, macd_line, signal_line, cost)
+
+    for i, piece in enumerate(pieces):
+        mine = trades[trades['symbol_id'] == i]
+        if len(piece) == 0:
+            assert len(mine) == 0 and stats['trades'][i] == 0
+            continue
+        want, total, drawdown, turnover = reference(piece, cost=cost)
+        assert [(t['entry'], t['exit'], bool(t['open'])) for t in mine] == \
+            [(entry, exit, is_open) for entry, exit, _, is_open in want]
+        assert mine['return'] == pytest.approx([r for _, _, r, _ in want], rel=1e-9)
+        assert stats['trades'][i] == len(want)
+        assert stats['hits'][i] == sum(r > 0 for _, _, r, _ in want)
+        assert stats['total_return'][i] == pytest.approx(total, rel=1e-9, abs=1e-12)
+        assert stats['max_drawdown'][i] == pytest.approx(drawdown, rel=1e-9, abs=1e-12)
+        assert stats['turnover'][i] == pytest.approx(turnover)
+
+
+def test_grid_rows_match_single_backtests():
+    closes, offsets = pack([walk(n, seed) for seed, n in enumerate([800, 300, 1200])])
+    params = grid_params((5, 12), (20, 26), (9, 4))
+    grid = grid_backtest(closes, offsets, params, cost=0.0005)
+    assert all(grid[name].shape == (len(params), 3) for name in STATS)
+    for row, (short, long, signal) in enumerate(params.tolist()):
+        pieces = [macd(closes[lo:hi], short, long, signal) for lo, hi in zip(offsets[:-1], offsets[1:])]
+        _, stats = backtest(closes, offsets, np.concatenate([p[0] for p in pieces]),
+                            np.concatenate([p[1] for p in pieces]), 0.0005)
+        for name in STATS:
+            assert np.array_equal(grid[name][row], stats[name], equal_nan=True)
+
+
+def test_grid_filters_each_macd_line_once(monkeypatch):
+    closes, offsets = pack([walk(n, seed) for seed, n in enumerate([800, 300])])
+    params = grid_params((5, 12), (20, 26), (9, 4, 6))
+    calls = []
+
+    def counting(func, offsets, *arrays):
+        if func.__qualname__.startswith('grid_backtest.'):
+            calls.append(len(func(*(array[:0].reshape(0, 0) for array in arrays))))
+        return apply_padded(func, offsets, *arrays)
+    monkeypatch.setattr(models.backtest, 'apply_padded', counting)
+    grid = grid_backtest(closes, offsets, params)
+
+    # four EMA periods, then one pass over each of four MACD lines for its three signals
+    assert calls == [1] * 4 + [3] * 4
+    # shuffled and repeated combinations land in their own rows
+    shuffled = params[[5, 0, 11, 5, 3]]
+    again = grid_backtest(closes, offsets, shuffled)
+    for name in STATS:
+        assert np.array_equal(again[name], grid[name][[5, 0, 11, 5, 3]], equal_nan=True)
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_run_grid_over_archive(universe, monkeypatch, workers):
+    template, symbols = universe
+    monkeypatch.setattr(models.screen, 'MIN_SHARD', 1)
+    params, stats = run_grid(symbols + ['NONE'], ('2024-06-03', '2024-07-01'), template, '1min',
+                             shorts=(5, 12), longs=(26,), signals=(9,), workers=workers)
+    assert params.tolist() == [(5, 26, 9), (12, 26, 9)]
+    assert stats['trades'].shape == (2, len(symbols) + 1)
+    assert stats['trades'][:, -1].tolist() == [0, 0]
+    assert stats['trades'].sum() > 0
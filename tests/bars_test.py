@@ -0,0 +1,169 @@
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.ingest import ingest_capture
+from tests.iex_fixtures import capture, sample_trades
+from utils.hdf5_handler import TradeWriter, has_ticks, read_bars, read_trades, rebuild_bars
+from utils.ohlc import (INTERVAL_NS, PRICE_SCALE, SESSION_INTERVALS, TICK_BAR_DTYPE,
+                        TICK_TRADE_BAR_DTYPE, TRADE_BAR_DTYPE, BarBuilder, as_prices, bar_pyramid,
+                        float_bars, get_ohlc, ohlcv_bars, roll_up, trade_bars)
+from utils.trading_calendar import session_buckets
+
+
+def random_trades(n, seed=0):
+    rng = np.random.default_rng(seed)
+    ts = 1718631000000000000 + np.cumsum(rng.integers(0, 3 * 10**9, n))
+    price = (100 + np.cumsum(rng.normal(0, 0.05, n))).astype('f4')
+    size = rng.integers(1, 500, n).astype('i4')
+    return ts, price, size
+
+
+@pytest.mark.parametrize('interval', list(INTERVAL_NS))
+def test_bars_match_per_bucket_reference(interval):
+    ts, price, size = random_trades(20000)
+    bars = bar_pyramid(ts, price, size)[interval]
+
+    if interval in SESSION_INTERVALS:
+        # bars of the regular session only, from its open
+        buckets = session_buckets(ts, interval, 'regular')
+    else:
+        buckets = ts // INTERVAL_NS[interval] * INTERVAL_NS[interval]
+    assert bars['ts'].tolist() == np.unique(buckets[buckets >= 0]).tolist()
+    for bar in bars[::max(1, len(bars) // 50)]:
+        rows = buckets == bar['ts']
+        assert bar['open'] == price[rows][0] and bar['close'] == price[rows][-1]
+        assert bar['high'] == price[rows].max() and bar['low'] == price[rows].min()
+        assert bar['volume'] == size[rows].sum()
+
+
+def test_roll_up_equals_direct_build():
+    ts, price, size = random_trades(5000, seed=1)
+    minutes = ohlcv_bars(ts, price, size, '1min')
+    for interval in INTERVAL_NS:
+        assert np.array_equal(roll_up(minutes, interval), ohlcv_bars(ts, price, size, interval))
+
+
+def test_empty_and_unknown_interval():
+    assert len(ohlcv_bars(np.empty(0, 'i8'), np.empty(0, 'f4'), np.empty(0, 'i4'))) == 0
+    with pytest.raises(ValueError):
+        ohlcv_bars(np.zeros(1, 'i8'), np.zeros(1, 'f4'), np.zeros(1, 'i4'), '3min')
+
+
+def test_ingest_writes_bars_and_rebuild_matches(tmp_path):
+    path = tmp_path / 'day.pcap'
+    path.write_bytes(capture(sample_trades(3000)))
+    h5filepath = str(tmp_path / 'day.h5')
+    ingest_capture(str(path), h5filepath)
+
+    with h5py.File(h5filepath, 'r') as h5f:
+        assert sorted(h5f['bars']) == sorted(INTERVAL_NS)
+        written = {i: read_bars(h5f, 'MSFT', i) for i in INTERVAL_NS}
+        trades = read_trades(h5f, 'MSFT')
+    assert written['1min']['volume'].sum() == trades['size'].sum()
+    assert written['1d']['close'][-1] == trades['price'][-1]
+
+    rebuild_bars(h5filepath)
+    with h5py.File(h5filepath, 'r') as h5f:
+        for interval, bars in written.items():
+            assert np.array_equal(read_bars(h5f, 'MSFT', interval), bars)
+        assert read_bars(h5f, 'NOPE', '5min') is None
+
+
+def test_ingest_fixed_point_day(tmp_path):
+    path = tmp_path / 'day.pcap'
+    trades = sample_trades(3000)
+    path.write_bytes(capture(trades))
+    h5filepath = str(tmp_path / 'day.h5')
+    ingest_capture(str(path), h5filepath, ticks=True)
+
+    with h5py.File(h5filepath, 'r') as h5f:
+        assert has_ticks(h5f)
+        stored = read_trades(h5f, 'MSFT')
+        bars = read_bars(h5f, 'MSFT', '1d')
+    assert stored['price'].dtype == np.int64
+    assert stored['price'].tolist() == [t[3] for t in trades if t[1] == 'MSFT']
+    assert bars.dtype == TICK_BAR_DTYPE
+    assert bars['close'][-1] == stored['price'][-1]
+    assert bars['high'][0] == stored['price'].max()
+
+    # one kind of price per file
+    with h5py.File(h5filepath, 'a') as h5f:
+        with pytest.raises(ValueError):
+            TradeWriter(h5f)
+
+
+def test_tick_bars_are_exact():
+    ts, price, size = random_trades(20000, seed=8)
+    # above $1M, where f4 has no cents left
+    ticks = as_prices(price, ticks=True) + 10**10
+    bars = trade_bars(ts, ticks, size, '5min')
+    assert bars.dtype == TICK_TRADE_BAR_DTYPE
+    buckets = ts // INTERVAL_NS['5min']
+    for bar in bars[::max(1, len(bars) // 50)]:
+        rows = buckets == bar['ts'] // INTERVAL_NS['5min']
+        assert bar['close'] == ticks[rows][-1] and bar['low'] == ticks[rows].min()
+        notional = sum(int(p) * int(s) for p, s in zip(ticks[rows], size[rows]))
+        assert bar['vwap'] == notional / int(size[rows].sum())
+    assert np.array_equal(roll_up(ohlcv_bars(ts, ticks, size, '1min'), '1h'),
+                          ohlcv_bars(ts, ticks, size, '1h'))
+
+    shown = float_bars(bars)
+    assert shown.dtype == TRADE_BAR_DTYPE
+    assert np.array_equal(shown['close'], (bars['close'] / PRICE_SCALE).astype('f4'))
+    assert np.allclose(shown['vwap'], bars['vwap'] / PRICE_SCALE, rtol=1e-15)
+
+
+def test_trade_bars_count_and_vwap():
+    ts, price, size = random_trades(20000, seed=5)
+    bars = trade_bars(ts, price, size, '5min')
+    plain = ohlcv_bars(ts, price, size, '5min')
+    for name in plain.dtype.names:
+        assert np.array_equal(bars[name], plain[name])
+    buckets = ts // INTERVAL_NS['5min']
+    for bar in bars[::max(1, len(bars) // 50)]:
+        rows = buckets == bar['ts'] // INTERVAL_NS['5min']
+        assert bar['count'] == rows.sum()
+        assert bar['vwap'] == pytest.approx(np.average(price[rows], weights=size[rows]), rel=1e-12)
+
+
+@pytest.mark.parametrize('chunks', [1, 3, 17, 400])
+def test_bar_builder_chunks_match_one_pass(chunks):
+    ts, price, size = random_trades(20000, seed=6)
+    builder = BarBuilder('1min')
+    cuts = np.sort(np.random.default_rng(chunks).choice(len(ts), chunks - 1, replace=False))
+    built = [builder.add(t, p, s) for t, p, s in zip(*(np.split(a, cuts) for a in (ts, price, size)))]
+    built.append(builder.add(ts[:0], price[:0], size[:0]))
+    built.append(builder.close())
+    bars = np.concatenate(built)
+    want = trade_bars(ts, price, size, '1min')
+    for name in TRADE_BAR_DTYPE.names:
+        if name == 'vwap':
+            assert np.allclose(bars[name], want[name], rtol=1e-12)
+        else:
+            assert np.array_equal(bars[name], want[name])
+    assert len(builder.close()) == 0
+
+
+def test_bar_builder_ticks_carry_exact_notional():
+    ts, price, size = random_trades(20000, seed=9)
+    ticks = as_prices(price, ticks=True)
+    builder = BarBuilder('1min', ticks=True)
+    cuts = np.sort(np.random.default_rng(0).choice(len(ts), 99, replace=False))
+    built = [builder.add(t, p, s) for t, p, s in zip(*(np.split(a, cuts) for a in (ts, ticks, size)))]
+    built.append(builder.close())
+    # integer sums do not depend on where the chunks were cut
+    assert np.array_equal(np.concatenate(built), trade_bars(ts, ticks, size, '1min'))
+
+
+def test_get_ohlc_frame():
+    ts, price, size = random_trades(1000, seed=7)
+    frame = pd.DataFrame({'price': price, 'size': size}, index=ts)
+    bars = get_ohlc(frame, '10min')
+    want = trade_bars(ts, price, size, '10min')
+    assert bars.index.asi8.tolist() == want['ts'].tolist()
+    assert bars['close'].tolist() == want['close'].tolist()
+    # ts as a datetime column and no sizes: each trade counts once
+    counted = get_ohlc(pd.DataFrame({'ts': ts.view('M8[ns]'), 'price': price}), '10min')
+    assert counted['volume'].tolist() == want['count'].tolist()
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+
+from data.cache import ArrayCache
+from data.load import CACHE_BLOCK_ROWS, load_trades
+from tests.compact_test import archive, day_trades, write_day
+
+DATES = ['20240603', '20240604', '20240605']
+
+
+def entry(n, fill=0):
+    return {'x': np.full(n, fill, dtype='i8')}
+
+
+def test_lru_eviction_within_budget():
+    cache = ArrayCache(max_bytes=3 * 800)
+    for key in 'abc':
+        cache.put(key, entry(100))
+    cache.get('a')                      # b is now least recently used
+    cache.put('d', entry(100))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('d') is not None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (3, 1, 1)
+    assert stats['bytes'] == 3 * 800
+
+    cache.put('big', entry(1000))       # larger than the whole budget
+    assert cache.get('big') is None and cache.stats()['entries'] == 3
+
+
+def test_cached_arrays_are_read_only():
+    cache = ArrayCache()
+    value = cache.put('a', entry(10))
+    with pytest.raises(ValueError):
+        value['x'][0] = 1
+
+
+def test_spill_tier_reloads_evicted_entries(tmp_path):
+    cache = ArrayCache(max_bytes=800, spill_dir=str(tmp_path), spill_bytes=1600)
+    for i, key in enumerate('abcd'):
+        cache.put(key, entry(100, i))
+
+    assert cache.get('a') is None          # spilled past spill_bytes
+    assert cache.get('c')['x'][0] == 2     # back from disk
+    stats = cache.stats()
+    assert stats['spill_hits'] == 1 and stats['spills'] == 4   # d made room for c
+    cache.clear()
+    assert os.listdir(tmp_path) == []
+
+
+def test_repeated_loads_come_from_memory(archive):
+    cache = ArrayCache()
+    first = load_trades('AAPL', DATES, archive, cache=cache)
+    # the slices, then the ts and price block of each of the three days
+    assert cache.stats()['misses'] == 9
+
+    again = load_trades('AAPL', DATES, archive, cache=cache)
+    assert cache.stats()['hits'] == 9 and cache.stats()['misses'] == 9
+    assert all(np.array_equal(first[k], again[k]) for k in first)
+
+    # a range read finds its rows through the ts index; they lie in a block
+    # already cached, so only its slices are new
+    ts = day_trades(archive, '20240604', 'AAPL')['ts']
+    held = cache.stats()['bytes']
+    ranged = load_trades('AAPL', DATES, archive, ('price',), start_ts=ts[10], end_ts=ts[20], cache=cache)
+    assert ranged['price'].tolist() == first['price'][510:520].tolist()
+    assert cache.stats()['misses'] == 9 + 3
+    assert cache.stats()['bytes'] - held == 16      # one slice
+
+    # a rewritten file is a new key
+    path = archive.format('20240604')
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10**9))
+    load_trades('AAPL', DATES, archive, cache=cache)
+    assert cache.stats()['misses'] == 15
+
+
+def test_blocks_are_shared_by_overlapping_reads(tmp_path):
+    template = str(tmp_path / '{}.h5')
+    write_day(template, '20240603', ['AAPL'], n=3 * CACHE_BLOCK_ROWS)
+    whole = load_trades('AAPL', ['20240603'], template, ('ts', 'price'), cache=ArrayCache(0))
+
+    cache = ArrayCache()
+    ts = whole['ts']
+    for first, stop in [(100, 5000), (4000, 9000), (0, len(ts))]:
+        end_ts = ts[stop] if stop < len(ts) else None
+        got = load_trades('AAPL', ['20240603'], template, ('ts', 'price'), start_ts=ts[first],
+                          end_ts=end_ts, cache=cache)
+        assert all(np.array_equal(got[k], whole[k][first:stop]) for k in got)
+    # every block of each column was read once
+    assert cache.stats()['misses'] == 3 + 3 * 2
+
+
+def test_disabled_cache_reads_from_disk(archive):
+    cached = load_trades('AAPL', DATES, archive, ('ts', 'trade_id'), cache=ArrayCache())
+    direct = load_trades('AAPL', DATES, archive, ('ts', 'trade_id'), cache=ArrayCache(0))
+    assert all(np.array_equal(cached[k], direct[k]) for k in cached)
@@ -0,0 +1,78 @@
+import os
+
+import h5py
+import numpy as np
+
+from data.catalog import (_tables, build_catalog, catalog_path, date_catalog, day_files,
+                          describe_day_file, load_catalog, lookup, universe)
+from data.ingest import bulk_ingest
+from tests.iex_fixtures import capture, sample_trades
+from utils.hdf5_handler import read_trades
+
+
+def test_bulk_ingest_catalogs_each_day(tmp_path):
+    pcaps = tmp_path / 'pcap'
+    pcaps.mkdir()
+    (pcaps / 'data_feeds_20240617_20240617_IEXTP1_TOPS1.6.pcap').write_bytes(capture(sample_trades(30)))
+    (pcaps / 'data_feeds_20240618_20240618_IEXTP1_TOPS1.6.pcap').write_bytes(
+        capture(sample_trades(12, symbols=('AAPL', 'TSLA'))))
+    template = str(tmp_path / 'h5' / '{}.h5')
+    os.mkdir(tmp_path / 'h5')
+    bulk_ingest(str(pcaps), template, workers=1)
+
+    catalog = load_catalog(str(tmp_path / 'h5'), check=True)
+    assert sorted(catalog) == ['20240617.h5', '20240618.h5']
+    entry = lookup(catalog['20240617.h5'], 'MSFT')
+    with h5py.File(template.format('20240617'), 'r') as h5f:
+        ts = read_trades(h5f, 'MSFT', ('ts',))['ts']
+    assert (entry['rows'], entry['min_ts'], entry['max_ts']) == (len(ts), ts[0], ts[-1])
+    assert entry['bytes'] > 0
+    assert lookup(catalog['20240618.h5'], 'MSFT') is None
+    assert universe(catalog) == ['AAPL', 'BRK.B', 'MSFT', 'TSLA']
+    assert universe(catalog, ['20240618.h5']) == ['AAPL', 'TSLA']
+
+    dates = ['20240615', '20240616', '20240617', '20240618']
+    assert day_files('MSFT', dates, template) == [template.format('20240617')]
+    assert day_files('AAPL', dates, template) == [template.format(d) for d in dates[2:]]
+    assert day_files('MSFT', dates, template, start_ts=ts[-1]) == [template.format('20240617')]
+    assert day_files('MSFT', dates, template, start_ts=ts[-1] + 1) == []
+    assert day_files('MSFT', dates, template, end_ts=ts[0]) == []
+
+
+def test_build_catalog_picks_up_new_and_changed_files(tmp_path):
+    day = tmp_path / '20240617.h5'
+    with h5py.File(day, 'w') as h5f:
+        h5f['trades/AAPL'] = np.zeros(3, dtype=[('ts', 'i8'), ('price', 'f4')])
+    assert build_catalog(str(tmp_path)) == 1
+    assert build_catalog(str(tmp_path)) == 0
+
+    with h5py.File(day, 'a') as h5f:
+        h5f['trades/MSFT'] = np.zeros(2, dtype=[('ts', 'i8'), ('price', 'f4')])
+    assert build_catalog(str(tmp_path)) == 1
+    entries = load_catalog(str(tmp_path))['20240617.h5']
+    assert np.array_equal(entries, describe_day_file(str(day)))
+    assert entries['symbol'].tolist() == [b'AAPL', b'MSFT']
+
+    # uncatalogued days are still found by existence
+    other = tmp_path / '20240618.h5'
+    other.write_bytes(b'')
+    assert day_files('TSLA', ['20240617', '20240618'], str(tmp_path / '{}.h5')) == [str(other)]
+
+
+def test_load_catalog_reads_only_named_tables(tmp_path):
+    for date in ('20240617', '20240618'):
+        with h5py.File(tmp_path / f'{date}.h5', 'w') as h5f:
+            h5f['trades/AAPL'] = np.zeros(3, dtype=[('ts', 'i8'), ('price', 'f4')])
+    build_catalog(str(tmp_path))
+
+    catalog = date_catalog(['20240618', '20240619'], str(tmp_path / '{}.h5'))
+    assert list(catalog) == ['20240618.h5']
+    _, tables, _ = _tables[catalog_path(str(tmp_path))]
+    assert sorted(tables) == ['20240618.h5', '20240619.h5']     # nothing else was read
+    assert sorted(load_catalog(str(tmp_path))) == ['20240617.h5', '20240618.h5']
+
+    # a rebuilt catalog is read afresh
+    with h5py.File(tmp_path / '20240619.h5', 'w') as h5f:
+        h5f['trades/MSFT'] = np.zeros(2, dtype=[('ts', 'i8'), ('price', 'f4')])
+    build_catalog(str(tmp_path))
+    assert universe(date_catalog(['20240619'], str(tmp_path / '{}.h5'))) == ['MSFT']
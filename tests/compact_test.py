@@ -0,0 +1,123 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from data.catalog import build_catalog, load_catalog
+from data.compact import (compact, compact_archive, compacted_dates, period_end, period_key,
+                          read_store_bars, read_store_trades, symbol_sources)
+from utils.hdf5_handler import (TICK_RECORD_DTYPE, TRADE_RECORD_DTYPE, TradeWriter, build_day_bars,
+                                read_bars, read_trades)
+from utils.ohlc import as_prices
+
+DAY_NS = 86400 * 10**9
+
+
+def write_day(template, date, symbols, n=500, ticks=False, first='13:30'):
+    start = np.datetime64(f'{date[:4]}-{date[4:6]}-{date[6:]}T{first}').astype('M8[ns]').astype('i8')
+    with h5py.File(template.format(date), 'w') as h5f:
+        with TradeWriter(h5f, ticks=ticks) as writer:
+            for k, symbol in enumerate(symbols):
+                trades = np.empty(n, dtype=TICK_RECORD_DTYPE if ticks else TRADE_RECORD_DTYPE)
+                trades['ts'] = start + np.arange(n) * 10**9 * (k + 1)
+                trades['size'] = 100
+                trades['price'] = as_prices(50 + np.sin(np.arange(n) / 10 + int(date)), ticks)
+                trades['trade_id'] = int(date) * 1000 + np.arange(n)
+                writer.append(f'/trades/{symbol}', trades)
+        build_day_bars(h5f)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    template = str(tmp_path / '{}.h5')
+    days = {'20240603': ['AAPL', 'MSFT'], '20240604': ['AAPL'], '20240605': ['AAPL', 'MSFT'],
+            '20240701': ['MSFT']}
+    for date, symbols in days.items():
+        write_day(template, date, symbols)
+    return template
+
+
+def day_trades(template, date, symbol):
+    with h5py.File(template.format(date), 'r') as h5f:
+        return read_trades(h5f, symbol) if f'trades/{symbol}' in h5f else None
+
+
+def test_store_reproduces_day_files(archive):
+    june = ['20240603', '20240604', '20240605']
+    expected = {(d, s): day_trades(archive, d, s) for d in june for s in ('AAPL', 'MSFT')}
+    paths = compact_archive(archive)
+    assert [os.path.basename(p) for p in paths] == ['202406.h5', '202407.h5']
+    assert compacted_dates(archive)['20240604'] == paths[0]
+
+    with h5py.File(paths[0], 'r') as store:
+        assert list(store['trades']) == ['AAPL', 'MSFT']
+        for (date, symbol), trades in expected.items():
+            got = read_store_trades(store, symbol, [date])
+            if trades is None:
+                assert len(got['ts']) == 0
+                continue
+            for name, column in trades.items():
+                assert np.array_equal(got[name], column)
+
+        both = read_store_trades(store, 'AAPL', ['20240603', '20240605'], ('trade_id',))
+        assert both['trade_id'].tolist() == (expected['20240603', 'AAPL']['trade_id'].tolist()
+                                             + expected['20240605', 'AAPL']['trade_id'].tolist())
+
+        ts = expected['20240604', 'AAPL']['ts']
+        ranged = read_store_trades(store, 'AAPL', june, ('ts',), ts[100], ts[200])
+        assert ranged['ts'].tolist() == ts[100:200].tolist()
+
+    with h5py.File(paths[0], 'r') as store, h5py.File(archive.format('20240604'), 'r') as day:
+        for interval in ('1min', '1h'):
+            assert np.array_equal(read_store_bars(store, 'AAPL', ['20240604'], interval),
+                                  read_bars(day, 'AAPL', interval))
+
+
+def test_store_session_bars_of_days_opening_mid_session(tmp_path):
+    template = str(tmp_path / '{}.h5')
+    for date in ('20240603', '20240604'):
+        write_day(template, date, ['AAPL'], n=3000, first='14:15')
+    path = compact(template, ['20240603', '20240604'], '202406')
+
+    with h5py.File(path, 'r') as store, h5py.File(template.format('20240604'), 'r') as day:
+        for interval in ('1h', '4h', '1d'):
+            bars = read_store_bars(store, 'AAPL', ['20240604'], interval)
+            assert np.array_equal(bars, read_bars(day, 'AAPL', interval))
+            # the first bar starts at the open, before the first trade
+            assert bars['ts'][0] == np.datetime64('2024-06-04T13:30', 'ns').astype('i8')
+        daily = read_store_bars(store, 'AAPL', ['20240603', '20240604'], '1d')
+        assert len(daily) == 2
+
+
+def test_sources_route_covered_days_to_stores(archive):
+    compact(archive, ['20240603', '20240604'], '202406', remove=True)
+    dates = ['20240603', '20240604', '20240605', '20240701']
+    sources = symbol_sources('AAPL', dates, archive)
+
+    store = os.path.join(os.path.dirname(archive), 'compacted', '202406.h5')
+    assert sources == [(store, ['20240603', '20240604']), (archive.format('20240605'), None),
+                       (archive.format('20240701'), None)]
+    assert not os.path.exists(archive.format('20240603'))
+
+
+def test_period_key():
+    assert period_key('20240815') == '202408'
+    assert period_key('20240815', months=3) == '202407'
+    assert period_key('20241231', months=12) == '202401'
+    assert period_end('202408') == '20240901'
+    assert period_end('202410', months=3) == '20250101'
+
+
+def test_archive_leaves_running_period_and_prunes_catalog(archive):
+    directory = os.path.dirname(archive)
+    build_catalog(directory)
+    paths = compact_archive(archive, remove=True, today='20240715')
+    assert [os.path.basename(p) for p in paths] == ['202406.h5']
+    assert os.path.isfile(archive.format('20240701'))
+    assert sorted(load_catalog(directory)) == ['20240701.h5']
+
+    # the month is compacted once it is over
+    paths = compact_archive(archive, remove=True, today='20240801')
+    assert [os.path.basename(p) for p in paths] == ['202407.h5']
+    assert load_catalog(directory) == {}
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from models.events import CROSS_DOWN, CROSS_UP, crossings, segment_crossings
+from models.segments import pack
+
+
+def reference_crossings(series, other):
+    # the loop ta.find_macd_conditions used to run
+    other = np.broadcast_to(other, np.shape(series))
+    up, down = [], []
+    for i in range(1, len(series)):
+        if series[i] > other[i] and series[i - 1] <= other[i - 1]:
+            up.append(i)
+        elif series[i] < other[i] and series[i - 1] >= other[i - 1]:
+            down.append(i)
+    return up, down
+
+
+def wiggle(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # rounded so ties with the other series and the threshold happen
+    return np.round(np.cumsum(rng.normal(0, 1, n)), 0)
+
+
+@pytest.mark.parametrize('other', ['series', 0.0, 2])
+def test_crossings_match_loop(other):
+    series = wiggle(5000)
+    other = wiggle(5000, seed=1) if other == 'series' else other
+    up, down = crossings(series, other)
+    want_up, want_down = reference_crossings(series, other)
+    assert up.tolist() == want_up and down.tolist() == want_down
+
+
+def test_crossings_ignore_nan_and_short_series():
+    up, down = crossings(np.array([-1.0, np.nan, 1.0, -1.0]))
+    assert up.tolist() == [] and down.tolist() == [3]
+    assert [len(x) for x in crossings(np.array([1.0]))] == [0, 0]
+
+
+def test_segment_crossings_stay_within_segments():
+    pieces = [wiggle(n, seed) for seed, n in enumerate([0, 300, 1, 2, 50, 0, 400])]
+    series, offsets = pack(pieces)
+    events = segment_crossings(series, offsets, 0.5)
+
+    expected = []
+    for symbol_id, piece in enumerate(pieces):
+        up, down = reference_crossings(piece, 0.5)
+        expected += [(symbol_id, i, CROSS_UP) for i in up] + [(symbol_id, i, CROSS_DOWN) for i in down]
+    assert events.tolist() == sorted(expected)
+
+
+def test_segment_crossings_of_two_series():
+    a, offsets = pack([wiggle(100, 3), wiggle(100, 4)])
+    b, _ = pack([wiggle(100, 5), wiggle(100, 6)])
+    events = segment_crossings(a, offsets, b)
+    second = events[events['symbol_id'] == 1]
+    up, down = crossings(a[100:], b[100:])
+    assert second['index'][second['direction'] == CROSS_UP].tolist() == up.tolist()
+    assert second['index'][second['direction'] == CROSS_DOWN].tolist() == down.tolist()
@@ -0,0 +1,69 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from data.gzip_index import (build_index, index_path, iter_range_blocks,
+                             iter_segment_blocks, load_index, split_segments)
+from data.tops import decode_packets, decode_trades
+from tests.iex_fixtures import capture, sample_trades
+
+SPACING = 64 << 10
+
+
+@pytest.fixture(scope='module')
+def indexed(tmp_path_factory):
+    raw = capture(sample_trades(60000), per_packet=3)
+    path = tmp_path_factory.mktemp('pcap') / 'day.pcap.gz'
+    # two members, so checkpoints in the first one must run on into the second
+    third = len(raw) // 3
+    path.write_bytes(gzip.compress(raw[:third]) + gzip.compress(raw[third:]))
+    return str(path), build_index(str(path), spacing=SPACING), decode_trades(raw)
+
+
+def decode_all(blocks):
+    return np.concatenate([decode_packets(view, offsets, lengths)
+                           for view, offsets, lengths, _ in blocks])
+
+
+def test_index_has_checkpoints(indexed):
+    path, index, _ = indexed
+    points = index['points']
+
+    assert len(points) > 10
+    assert len(index['members']) == 2
+    assert np.all(np.diff(points['send_time']) >= 0)
+    assert np.all(points['record_offset'] >= points['out_offset'])
+    assert load_index(path, build=False)['points'].tolist() == points.tolist()
+
+
+@pytest.mark.parametrize('parts', [1, 3, 8])
+def test_segments_cover_capture_once(indexed, parts):
+    path, index, trades = indexed
+    segments = split_segments(index, parts)
+    assert len(segments) == parts
+
+    decoded = decode_all(block for start, stop in segments
+                         for block in iter_segment_blocks(path, index, start, stop))
+    assert np.array_equal(decoded, trades)
+
+
+def test_range_read_starts_near_checkpoint(indexed):
+    path, index, trades = indexed
+    start_ts, end_ts = trades['ts'][40000], trades['ts'][45000]
+    decoded = decode_all(iter_range_blocks(path, start_time=start_ts, end_time=end_ts))
+
+    assert decoded['ts'][0] <= start_ts and decoded['ts'][-1] >= end_ts
+    assert len(decoded) < len(trades) // 4
+    assert np.isin(trades['trade_id'][40000:45001], decoded['trade_id']).all()
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    path = tmp_path / 'day.pcap.gz'
+    path.write_bytes(gzip.compress(capture(sample_trades(30))))
+    build_index(str(path))
+    path.write_bytes(gzip.compress(capture(sample_trades(60))))
+
+    with pytest.raises(FileNotFoundError):
+        load_index(str(path), build=False)
+    assert load_index(str(path))['path'] == index_path(str(path))
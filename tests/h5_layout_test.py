@@ -0,0 +1,205 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from data.catalog import load_catalog
+from utils import hdf5_handler
+from utils.hdf5_handler import (FORMAT_VERSION, TRADE_RECORD_DTYPE, TradeWriter, chunk_rows,
+                                convert_to_columnar, format_version, get_single_date,
+                                index_day_file, read_bars, read_trades, row_range, trade_rows, trades_to_hdf5,
+                                write_trades_to_dataset)
+
+V1_FIXTURE = os.path.join(os.path.dirname(__file__), 'data_test.h5')
+
+
+def trades(n, start=0):
+    out = np.empty(n, dtype=TRADE_RECORD_DTYPE)
+    out['ts'] = 1718631000000000000 + np.arange(start, start + n) * 1000
+    out['size'] = 100
+    out['price'] = 123.45
+    out['trade_id'] = np.arange(start, start + n)
+    return out
+
+
+def test_columns_append_and_read_back(tmp_path):
+    path = tmp_path / '20240617.h5'
+    with h5py.File(path, 'w') as h5f:
+        write_trades_to_dataset(h5f, '/trades/AAPL', trades(5))
+        write_trades_to_dataset(h5f, '/trades/AAPL', trades(70000, 5))
+
+    with h5py.File(path, 'r') as h5f:
+        assert format_version(h5f) == FORMAT_VERSION
+        assert trade_rows(h5f, '/trades/AAPL') == 70005
+        ts = h5f['trades/AAPL/ts']
+        assert ts.compression == 'lzf' and ts.shuffle and ts.chunks is not None
+        columns = read_trades(h5f, 'AAPL', ('ts', 'price'))
+    assert set(columns) == {'ts', 'price'}
+    assert np.array_equal(columns['ts'], trades(70005)['ts'])
+
+    df = get_single_date('AAPL', '20240617', datadir=str(tmp_path))
+    assert list(df.columns) == ['symbol', 'size', 'price', 'trade_id']
+    assert df.index[0] == trades(1)['ts'][0]
+
+
+def test_convert_v1_day_file(tmp_path):
+    path = tmp_path / 'v2.h5'
+    convert_to_columnar(V1_FIXTURE, str(path))
+
+    with h5py.File(V1_FIXTURE, 'r') as old, h5py.File(path, 'r') as new:
+        assert format_version(old) == 1 and format_version(new) == FORMAT_VERSION
+        assert list(old['trades']) == list(new['trades'])
+        for symbol in ('AAPL', 'A'):
+            expected = old['trades'][symbol][:]
+            converted = read_trades(new, symbol)
+            for name in TRADE_RECORD_DTYPE.names:
+                assert np.array_equal(converted[name], expected[name])
+
+
+def test_columnar_file_is_smaller(tmp_path):
+    rows = trades(200000)
+    rows['price'] = 100 + np.cumsum(np.random.default_rng(0).integers(-2, 3, len(rows))) / 100
+    v1, v2 = tmp_path / 'v1.h5', tmp_path / 'v2.h5'
+    with h5py.File(v1, 'w') as h5f:
+        legacy = np.empty(len(rows), dtype=[('ts', 'i8'), ('symbol', 'S10'), ('size', 'i4'),
+                                            ('price', 'f4'), ('trade_id', 'i8')])
+        for name in TRADE_RECORD_DTYPE.names:
+            legacy[name] = rows[name]
+        legacy['symbol'] = b'AAPL'
+        h5f.create_dataset('trades/AAPL', data=legacy, maxshape=(None,))
+    convert_to_columnar(str(v1), str(v2))
+
+    assert os.path.getsize(v2) * 3 < os.path.getsize(v1)
+
+
+def test_v1_file_is_not_mixed(tmp_path):
+    path = tmp_path / 'v1.h5'
+    with h5py.File(path, 'w') as h5f:
+        h5f['trades/AAPL'] = trades(3)
+        with pytest.raises(ValueError):
+            write_trades_to_dataset(h5f, '/trades/MSFT', trades(3))
+
+
+def test_writer_bounds_buffers_and_trims(tmp_path):
+    path = tmp_path / 'day.h5'
+    expected = {f'S{i}': trades(10 * i + 1, 1000 * i) for i in range(40)}
+    with h5py.File(path, 'w') as h5f:
+        writer = TradeWriter(h5f, buffer_bytes=64 << 10)
+        for start in range(0, 400, 7):
+            for symbol, rows in expected.items():
+                writer.append(f'/trades/{symbol}', rows[start:start + 7])
+            assert writer.buffered <= 2 * writer.buffer_bytes
+        assert any(symbol_group in h5f for symbol_group in writer.buffers)
+        writer.close()
+
+    with h5py.File(path, 'r') as h5f:
+        for symbol, rows in expected.items():
+            assert h5f[f'trades/{symbol}/ts'].shape == (len(rows),)
+            assert h5f[f'trades/{symbol}/price'].chunks == (chunk_rows(len(rows)),)
+            assert np.array_equal(read_trades(h5f, symbol)['trade_id'], rows['trade_id'])
+
+
+def test_writer_reuses_buffer_written_at_max_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(hdf5_handler, 'MAX_BUFFER_ROWS', 256)
+    with h5py.File(tmp_path / 'day.h5', 'w') as h5f:
+        writer = TradeWriter(h5f)
+        writer.append('/trades/AAPL', trades(256))
+        buf = writer.buffers['/trades/AAPL'][0]
+        writer.append('/trades/AAPL', trades(100, 256))
+        assert writer.buffers['/trades/AAPL'][0] is buf
+        assert writer.buffered == buf.nbytes
+        writer.close()
+        assert np.array_equal(read_trades(h5f, 'AAPL')['trade_id'], np.arange(356))
+
+
+def test_writer_spills_largest_allocations_first(tmp_path):
+    with h5py.File(tmp_path / 'day.h5', 'w') as h5f:
+        writer = TradeWriter(h5f, buffer_bytes=28 << 10)
+        writer.append('/trades/A', trades(1000))
+        writer.flush()      # no rows left, but 1024 rows still allocated
+        writer.append('/trades/C', trades(100))
+        writer.append('/trades/B', trades(64))
+
+        # releasing A's empty buffer is enough, C's rows stay buffered
+        assert '/trades/A' not in writer.buffers
+        assert writer.buffers['/trades/C'][1] == 100
+        assert '/trades/C' not in h5f
+        writer.close()
+
+
+def test_small_writes_are_rechunked_on_close(tmp_path):
+    path = tmp_path / 'day.h5'
+    with h5py.File(path, 'w') as h5f:
+        with TradeWriter(h5f) as writer:
+            for start in range(0, 40000, 100):
+                writer.append('/trades/AAPL', trades(100, start))
+                writer.flush()
+            assert h5f['trades/AAPL/ts'].chunks == (chunk_rows(100),)
+
+    with h5py.File(path, 'r') as h5f:
+        assert h5f['trades/AAPL/ts'].chunks == (chunk_rows(40000),)
+        assert np.array_equal(read_trades(h5f, 'AAPL')['trade_id'], trades(40000)['trade_id'])
+        assert list(h5f['trades/AAPL']) == ['price', 'size', 'trade_id', 'ts', 'ts_index']
+
+
+def test_trades_to_hdf5_from_parser_tuples(tmp_path):
+    path = tmp_path / 'day.h5'
+    rows = trades(5000)
+    parser = ((t['ts'], 'AAPL' if t['trade_id'] % 3 else 'MSFT', t['size'], t['price'], t['trade_id'])
+              for t in rows)
+    trades_to_hdf5(parser, str(path), buffer_bytes=16 << 10)
+
+    with h5py.File(path, 'r') as h5f:
+        aapl = read_trades(h5f, 'AAPL')['trade_id']
+        msft = read_trades(h5f, 'MSFT')['trade_id']
+    assert aapl.tolist() == [i for i in range(5000) if i % 3]
+    assert msft.tolist() == list(range(0, 5000, 3))
+
+
+def test_trades_to_hdf5_builds_bars_and_catalog(tmp_path):
+    path = tmp_path / '20240617.h5'
+    parser = ((t['ts'], 'AAPL', t['size'], t['price'], t['trade_id']) for t in trades(5000))
+    trades_to_hdf5(parser, str(path))
+
+    with h5py.File(path, 'r') as h5f:
+        bars = read_bars(h5f, 'AAPL', '1min')
+    assert bars is not None and bars['volume'].sum() == 5000 * 100
+    entries = load_catalog(str(tmp_path), check=True)['20240617.h5']
+    assert entries['symbol'].tolist() == [b'AAPL'] and entries['rows'].tolist() == [5000]
+
+
+@pytest.mark.parametrize('rows', [1, 4096, 4097, 20000])
+def test_time_range_reads_match_full_scan(tmp_path, rows):
+    path = tmp_path / 'day.h5'
+    data = trades(rows)
+    data['ts'] = 1718631000000000000 + np.repeat(np.arange(rows // 3 + 1) * 1000, 3)[:rows]
+    with h5py.File(path, 'w') as h5f:
+        with TradeWriter(h5f) as writer:
+            writer.append('/trades/AAPL', data)
+
+    ts = data['ts']
+    bounds = [None, ts[0] - 1, ts[0], ts[rows // 2], ts[-1], ts[-1] + 1, ts[min(4096, rows - 1)]]
+    with h5py.File(path, 'r') as h5f:
+        assert h5f['trades/AAPL/ts_index'].shape[0] == -(-rows // 4096)
+        for start in bounds:
+            for end in bounds:
+                got = read_trades(h5f, 'AAPL', ('ts', 'trade_id'), start_ts=start, end_ts=end)
+                keep = np.ones(rows, dtype=bool)
+                if start is not None:
+                    keep &= ts >= start
+                if end is not None:
+                    keep &= ts < end
+                assert got['trade_id'].tolist() == data['trade_id'][keep].tolist()
+
+
+def test_stale_index_is_extended(tmp_path):
+    path = tmp_path / 'day.h5'
+    with h5py.File(path, 'w') as h5f:
+        with TradeWriter(h5f) as writer:
+            writer.append('/trades/AAPL', trades(5000))
+        write_trades_to_dataset(h5f, '/trades/AAPL', trades(5000, 5000))
+        assert row_range(h5f, 'AAPL', trades(1, 9000)['ts'][0]) == (9000, 10000)
+    index_day_file(str(path))
+    with h5py.File(path, 'r') as h5f:
+        assert h5f['trades/AAPL/ts_index'][:].tolist() == trades(10000)['ts'][::4096].tolist()
@@ -0,0 +1,81 @@
+'''Synthetic IEX-TP captures for the decoder tests.'''
+
+import struct
+
+TOPS_PROTOCOL_ID = 0x8003
+SESSION_ID = 1150681088
+
+
+def trade_report(ts, symbol, size, price, trade_id, flags=0):
+    '''Trade Report message body with price given in ticks.'''
+    return struct.pack('<BBq8sIqq', ord('T'), flags, ts,
+                       symbol.encode().ljust(8), size, price, trade_id)
+
+
+def segment(messages, first_seq, send_time, stream_offset=0):
+    '''IEX-TP segment (UDP payload) carrying the given message bodies.'''
+    body = b''.join(struct.pack('<H', len(m)) + m for m in messages)
+    header = struct.pack('<BBHIIHHqqq', 1, 0, TOPS_PROTOCOL_ID, 1, SESSION_ID,
+                         len(body), len(messages), stream_offset, first_seq,
+                         send_time)
+    return header + body
+
+
+def frame(payload, vlan=False):
+    '''Ethernet/IPv4/UDP frame around an IEX-TP segment.'''
+    udp = struct.pack('>HHHH', 10378, 10378, 8 + len(payload), 0) + payload
+    ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                     b'\x17\xe2\x03\x03', b'\xe9\xd7\x15\x56') + udp
+    tag = struct.pack('>HH', 0x8100, 1) if vlan else b''
+    return b'\x01\x00\x5e\x57\x15\x04' + b'\x00\x00\x00\x00\x00\x01' + tag + b'\x08\x00' + ip
+
+
+def pcap(frames):
+    '''Classic little endian pcap file holding the given frames.'''
+    out = [struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)]
+    for i, f in enumerate(frames):
+        out.append(struct.pack('<IIII', 1718631000 + i, 0, len(f), len(f)) + f)
+    return b''.join(out)
+
+
+def pcapng(frames):
+    '''Little endian pcapng file holding the given frames as EPBs.'''
+    shb = struct.pack('<IIIHHq', 0x0A0D0D0A, 28, 0x1A2B3C4D, 1, 0, -1) + struct.pack('<I', 28)
+    idb = struct.pack('<IIHHI', 1, 20, 1, 0, 65535) + struct.pack('<I', 20)
+    out = [shb, idb]
+    for f in frames:
+        padded = f + b'\x00' * (-len(f) % 4)
+        block_len = 32 + len(padded)
+        out.append(struct.pack('<IIIIIII', 6, block_len, 0, 0, 0, len(f), len(f))
+                   + padded + struct.pack('<I', block_len))
+    return b''.join(out)
+
+
+def sample_trades(n, symbols=('AAPL', 'MSFT', 'BRK.B')):
+    '''n (ts, symbol, size, price_ticks, trade_id) tuples in time order.'''
+    base = 1718631000000000000
+    return [(base + i * 1000003, symbols[i % len(symbols)], 100 + i,
+             1234500 + 25 * i, 16811559 + i) for i in range(n)]
+
+
+def capture(trades, per_packet=3, fmt=pcap, first_seq=1):
+    '''Capture packing per_packet trade reports into each segment.'''
+    frames = []
+    seq = first_seq
+    for i in range(0, len(trades), per_packet):
+        chunk = trades[i:i + per_packet]
+        messages = [trade_report(*t) for t in chunk]
+        frames.append(frame(segment(messages, seq, chunk[0][0])))
+        seq += len(messages)
+    return fmt(frames)
+
+
+def quote_update(ts, symbol, bid_size, bid_price, ask_price, ask_size, flags=0):
+    '''Quote Update message body with prices given in ticks.'''
+    return struct.pack('<BBq8sIqqI', ord('Q'), flags, ts, symbol.encode().ljust(8),
+                       bid_size, bid_price, ask_price, ask_size)
+
+
+def official_price(ts, symbol, price, price_type=b'Q'):
+    '''Official Price message body with price given in ticks.'''
+    return struct.pack('<Bcq8sq', ord('X'), price_type, ts, symbol.encode().ljust(8), price)
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from models.indicators import IncrementalMACD, ewma, macd
+
+
+def reference_ewma(data, period, decay_factor=None):
+    # the recurrence ta.ewma has always used
+    if decay_factor is None:
+        decay_factor = 2 / (period + 1)
+    ewma_data = np.zeros_like(data)
+    ewma_data[0] = data[0]
+    for i in range(1, len(data)):
+        ewma_data[i] = decay_factor * data[i] + (1 - decay_factor) * ewma_data[i - 1]
+    return ewma_data
+
+
+def random_closes(shape, dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    return (100 + np.cumsum(rng.normal(0, 0.5, shape), axis=-1)).astype(dtype)
+
+
+@pytest.mark.parametrize('dtype', ['f4', 'f8'])
+@pytest.mark.parametrize('period,decay_factor', [(12, None), (26, None), (9, 0.3), (5, 0.123456789)])
+def test_ewma_is_bit_identical_to_recurrence(dtype, period, decay_factor):
+    closes = random_closes(20000, dtype)
+    result = ewma(closes, period, decay_factor)
+    assert result.dtype == closes.dtype
+    assert np.array_equal(result, reference_ewma(closes, period, decay_factor))
+
+
+def test_ewma_integer_input_keeps_recurrence():
+    closes = np.arange(100, 200, dtype='i8') * 3
+    assert np.array_equal(ewma(closes, 12), reference_ewma(closes, 12))
+
+
+def test_ewma_short_series():
+    assert ewma(np.array([5.0]), 12).tolist() == [5.0]
+    assert ewma(np.empty(0), 12).shape == (0,)
+
+
+@pytest.mark.parametrize('dtype', ['f4', 'f8'])
+def test_macd_rows_match_one_series_at_a_time(dtype):
+    closes = random_closes((7, 3000), dtype, seed=1)
+    batched = macd(closes, 12, 26, 9)
+    for row in range(len(closes)):
+        short = reference_ewma(closes[row], 12)
+        long = reference_ewma(closes[row], 26)
+        line = short - long
+        signal = reference_ewma(line, 9)
+        for got, want in zip(batched, (line, signal, line - signal)):
+            assert np.array_equal(got[row], want)
+
+
+@pytest.mark.parametrize('dtype', ['f4', 'f8'])
+def test_ewma_continues_from_initial(dtype):
+    closes = random_closes(5000, dtype, seed=2)
+    whole = ewma(closes, 12, 0.2)
+    head = ewma(closes[:1234], 12, 0.2)
+    assert np.array_equal(ewma(closes[1234:], 12, 0.2, initial=head[-1]), whole[1234:])
+
+
+@pytest.mark.parametrize('dtype', ['f4', 'f8'])
+def test_incremental_macd_matches_batch(tmp_path, dtype):
+    closes = random_closes(3000, dtype, seed=4)
+    batch = macd(closes, 12, 26, 9)
+
+    incremental = IncrementalMACD(dtype=dtype)
+    pieces = [incremental.update('AAPL', closes[:1000])]
+    for close in closes[1000:1010]:
+        pieces.append([np.array([value]) for value in incremental.update('AAPL', close)])
+    incremental.save(str(tmp_path / 'state.h5'))
+
+    # a later run picks up from the saved state
+    resumed = IncrementalMACD.load(str(tmp_path / 'state.h5'))
+    assert resumed.state['AAPL'][0] == 1010 and resumed.dtype == closes.dtype
+    pieces.append(resumed.update('AAPL', closes[1010:]))
+
+    for i, want in enumerate(batch):
+        got = np.concatenate([piece[i] for piece in pieces])
+        assert got.dtype == closes.dtype
+        assert np.array_equal(got, want)
+    assert [float(v) for v in resumed.last('AAPL')] == [float(v[-1]) for v in batch]
+    assert resumed.last('MSFT') is None
+
+
+def test_incremental_macd_defaults_to_batch_precision():
+    # closes of a high priced symbol, where float32 EMAs drift from the screens
+    closes = random_closes(2000, 'f8', seed=5) * 1000
+    incremental = IncrementalMACD()
+    got = incremental.update('BRK.A', closes)
+    assert all(np.array_equal(g, w) for g, w in zip(got, macd(closes, 12, 26, 9)))
+    assert incremental.state_dtype()['short'] == np.float64
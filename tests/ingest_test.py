@@ -0,0 +1,181 @@
+import gzip
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from data.gzip_index import build_index
+from data.ingest import (bulk_ingest, capture_date, find_gaps, ingest_capture,
+                         is_complete, read_checkpoint)
+from data.pcap_io import MAX_CAPLEN
+from tests.iex_fixtures import (capture, frame, pcap, sample_trades, segment,
+                                trade_report)
+from utils.hdf5_handler import (FORMAT_VERSION, TRADE_COLUMNS, TS_INDEX, TradeWriter, chunk_rows,
+                                has_ticks)
+
+BLOCK_SIZE = 2 * MAX_CAPLEN
+
+CAPTURE_NAME = 'data_feeds_{0}_{0}_IEXTP1_TOPS1.6.pcap'
+
+
+@pytest.fixture
+def captures(tmp_path):
+    src = tmp_path / 'pcap'
+    src.mkdir()
+    (src / CAPTURE_NAME.format('20240617')).write_bytes(capture(sample_trades(30)))
+    gz = src / (CAPTURE_NAME.format('20240618') + '.gz')
+    gz.write_bytes(gzip.compress(capture(sample_trades(12))))
+    return src
+
+
+def test_capture_date():
+    assert capture_date('/srv/a/pcap/' + CAPTURE_NAME.format('20241111') + '.gz') == '20241111'
+    with pytest.raises(ValueError):
+        capture_date('/srv/a/pcap/latest.pcap')
+
+
+def test_bulk_ingest_writes_one_file_per_day(tmp_path, captures):
+    template = str(tmp_path / '{}.h5')
+    assert bulk_ingest(str(captures), template, workers=2) == {}
+
+    with h5py.File(template.format('20240617'), 'r') as h5f:
+        assert sorted(h5f['trades']) == ['AAPL', 'BRK.B', 'MSFT']
+        assert sum(h5f['trades'][s]['ts'].shape[0] for s in h5f['trades']) == 30
+        assert h5f.attrs['format_version'] == FORMAT_VERSION
+        assert sorted(h5f['trades/AAPL']) == sorted([*TRADE_COLUMNS, TS_INDEX])
+    assert is_complete(template.format('20240618'))
+
+
+def test_bulk_ingest_skips_complete_days(tmp_path, captures, capsys):
+    template = str(tmp_path / '{}.h5')
+    bulk_ingest(str(captures), template, workers=1)
+    mtime = os.path.getmtime(template.format('20240617'))
+
+    bulk_ingest(str(captures / '*.pcap*'), template, workers=1)
+    assert os.path.getmtime(template.format('20240617')) == mtime
+    assert 'skip' in capsys.readouterr().out
+
+
+def test_incomplete_day_is_redone(tmp_path, captures):
+    template = str(tmp_path / '{}.h5')
+    with h5py.File(template.format('20240617'), 'w') as h5f:
+        h5f['trades/AAPL'] = [1, 2, 3]
+
+    assert not is_complete(template.format('20240617'))
+    bulk_ingest(str(captures), template, workers=1)
+    assert is_complete(template.format('20240617'))
+
+
+def read_day(h5filepath):
+    with h5py.File(h5filepath, 'r') as h5f:
+        return {s: h5f['trades'][s]['trade_id'][:].tolist() for s in h5f['trades']}
+
+
+@pytest.mark.parametrize('name', ['day.pcap', 'day.pcap.gz', 'indexed.pcap.gz', 'stale.pcap.gz'])
+def test_crashed_ingest_resumes_without_duplicates(tmp_path, monkeypatch, name):
+    raw = capture(sample_trades(12000), per_packet=4)
+    path = tmp_path / name
+    path.write_bytes(gzip.compress(raw) if name.endswith('gz') else raw)
+    if name.startswith(('indexed', 'stale')):
+        build_index(str(path), spacing=1 << 16)
+    if name.startswith('stale'):
+        # the capture is replaced after its sidecar was built
+        path.write_bytes(gzip.compress(raw, compresslevel=1))
+    clean, crashed = str(tmp_path / 'clean.h5'), str(tmp_path / 'crashed.h5')
+    ingest_capture(str(path), clean, block_size=BLOCK_SIZE)
+
+    # die half way through writing the symbols of the second block
+    calls = []
+    def flaky_write(writer, symbol_group):
+        calls.append(symbol_group)
+        write(writer, symbol_group)
+        if len(calls) == 5:
+            raise RuntimeError('crash')
+    write = TradeWriter.write
+    monkeypatch.setattr(TradeWriter, 'write', flaky_write)
+    with pytest.raises(RuntimeError):
+        ingest_capture(str(path), crashed, block_size=BLOCK_SIZE)
+    monkeypatch.undo()
+
+    assert not is_complete(crashed)
+    checkpoint = read_checkpoint(crashed, str(path))
+    assert 0 < checkpoint['offset'] < len(raw)
+
+    _, written, _, missing = ingest_capture(str(path), crashed, block_size=BLOCK_SIZE)
+    assert is_complete(crashed)
+    assert written == 12000 and missing == 0
+    assert read_day(crashed) == read_day(clean)
+    with h5py.File(crashed, 'r') as h5f:
+        for symbol in h5f['trades']:
+            ts = h5f['trades'][symbol]['ts']
+            assert ts.chunks == (chunk_rows(ts.shape[0]),)
+
+
+def test_resume_before_any_segment_counts_no_gap(tmp_path, monkeypatch):
+    # a block of non-IP frames, checkpointed before the first segment is seen
+    junk = [b'\x01' * 6 + b'\x02' * 6 + b'\x08\x06' + bytes(1486)] * (BLOCK_SIZE // 1000)
+    trades = sample_trades(30)
+    frames = junk + [frame(segment([trade_report(*t) for t in trades], 1, 0))]
+    path = tmp_path / 'day.pcap'
+    path.write_bytes(pcap(frames))
+    h5filepath = str(tmp_path / 'day.h5')
+
+    write = TradeWriter.write
+    def flaky_write(writer, symbol_group):
+        write(writer, symbol_group)
+        raise RuntimeError('crash')
+    monkeypatch.setattr(TradeWriter, 'write', flaky_write)
+    with pytest.raises(RuntimeError):
+        ingest_capture(str(path), h5filepath, block_size=BLOCK_SIZE)
+    monkeypatch.undo()
+    checkpoint = read_checkpoint(h5filepath, str(path))
+    assert checkpoint['offset'] > 0 and checkpoint['seq'] == -1
+
+    _, written, _, missing = ingest_capture(str(path), h5filepath, block_size=BLOCK_SIZE)
+    assert written == 30 and missing == 0
+
+
+def test_resume_with_other_price_kind_starts_over(tmp_path, monkeypatch):
+    raw = capture(sample_trades(12000), per_packet=4)
+    path = tmp_path / 'day.pcap'
+    path.write_bytes(raw)
+    clean, crashed = str(tmp_path / 'clean.h5'), str(tmp_path / 'crashed.h5')
+    ingest_capture(str(path), clean, block_size=BLOCK_SIZE, ticks=True)
+
+    calls = []
+    write = TradeWriter.write
+    def flaky_write(writer, symbol_group):
+        calls.append(symbol_group)
+        write(writer, symbol_group)
+        if len(calls) == 5:
+            raise RuntimeError('crash')
+    monkeypatch.setattr(TradeWriter, 'write', flaky_write)
+    with pytest.raises(RuntimeError):
+        ingest_capture(str(path), crashed, block_size=BLOCK_SIZE)
+    monkeypatch.undo()
+    assert read_checkpoint(crashed, str(path))['ticks'] is False
+
+    _, written, _, _ = ingest_capture(str(path), crashed, block_size=BLOCK_SIZE, ticks=True)
+    assert written == 12000
+    assert read_day(crashed) == read_day(clean)
+    with h5py.File(crashed, 'r') as h5f:
+        assert has_ticks(h5f)
+
+
+def test_sequence_gaps_are_counted(tmp_path):
+    trades = sample_trades(6)
+    frames = [frame(segment([trade_report(*t) for t in trades[:2]], 1, 0)),
+              frame(segment([trade_report(*t) for t in trades[2:4]], 3, 0)),
+              frame(segment([trade_report(*t) for t in trades[4:]], 10, 0))]
+    path = tmp_path / 'day.pcap'
+    path.write_bytes(pcap(frames))
+
+    _, written, _, missing = ingest_capture(str(path), str(tmp_path / 'day.h5'))
+    assert written == 6 and missing == 5
+
+
+def test_find_gaps_across_blocks():
+    gaps, expected = find_gaps(np.array([5, 7, 12]), np.array([2, 3, 1]), 4)
+    assert gaps.tolist() == [[4, 5], [10, 12]]
+    assert expected == 13
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from data.cache import ArrayCache
+from data.compact import compact
+from data.load import date_strings, load_trades, trades_frame, universe_bars
+from tests.compact_test import archive, day_trades, write_day
+from utils.hdf5_handler import get_daterange, get_single_date
+from utils.ohlc import TICK_BAR_DTYPE, as_bars, as_prices
+
+DATES = ['20240603', '20240604', '20240605', '20240701']
+
+
+def expected(template, symbol, dates, name):
+    days = [day_trades(template, d, symbol) for d in dates]
+    return np.concatenate([d[name] for d in days if d is not None])
+
+
+@pytest.mark.parametrize('compacted', [False, True])
+def test_load_trades_matches_day_reads(archive, compacted):
+    ts = expected(archive, 'AAPL', DATES, 'ts')
+    trade_ids = expected(archive, 'AAPL', DATES, 'trade_id')
+    if compacted:
+        compact(archive, DATES[:2], '202406')
+
+    got = load_trades('AAPL', DATES, archive, ('ts', 'trade_id'), workers=3)
+    assert got['ts'].tolist() == ts.tolist()
+    assert got['trade_id'].tolist() == trade_ids.tolist()
+
+    ranged = load_trades('AAPL', DATES, archive, ('trade_id',),
+                         start_ts=ts[300], end_ts=ts[1200])
+    assert ranged['trade_id'].tolist() == trade_ids[300:1200].tolist()
+
+    empty = load_trades('TSLA', DATES, archive)
+    assert [len(c) for c in empty.values()] == [0, 0]
+
+
+@pytest.mark.parametrize('cache_bytes', [0, 1 << 20])
+def test_load_mixes_fixed_point_and_float_days(tmp_path, cache_bytes):
+    template = str(tmp_path / '{}.h5')
+    write_day(template, '20240603', ['AAPL'])
+    write_day(template, '20240604', ['AAPL'], ticks=True)
+    dates = ['20240603', '20240604']
+    floats, ticks = (day_trades(template, date, 'AAPL')['price'] for date in dates)
+    assert floats.dtype == np.float32 and ticks.dtype == np.int64
+
+    cache = ArrayCache(cache_bytes)
+    got = load_trades('AAPL', dates, template, ('price',), cache=cache, ticks=True)['price']
+    assert got.tolist() == as_prices(floats, ticks=True).tolist() + ticks.tolist()
+    got = load_trades('AAPL', dates, template, ('price',), cache=cache)['price']
+    assert got.dtype == np.float32
+    assert got.tolist() == floats.tolist() + as_prices(ticks).tolist()
+
+    bars = universe_bars(['AAPL'], dates, template, '5min', ticks=True)['AAPL']
+    assert bars.dtype == TICK_BAR_DTYPE
+    floated = universe_bars(['AAPL'], dates, template, '5min')['AAPL']
+    assert np.array_equal(bars, as_bars(floated, ticks=True))
+
+    # a fixed-point store converts the float day once, at compaction
+    compact(template, dates, '202406', ticks=True)
+    cache = ArrayCache(cache_bytes)
+    got = load_trades('AAPL', dates, template, ('price',), cache=cache, ticks=True)['price']
+    assert got.tolist() == as_prices(floats, ticks=True).tolist() + ticks.tolist()
+
+
+def test_frame_shares_loaded_columns(archive):
+    columns = load_trades('MSFT', DATES, archive, ('ts', 'price'))
+    df = trades_frame(columns)
+    assert df['ts'].dtype == 'datetime64[ns]'
+    assert np.shares_memory(df['price'].to_numpy(), columns['price'])
+    assert np.shares_memory(df['ts'].to_numpy(), columns['ts'])
+
+
+def test_get_single_date_and_daterange(archive, tmp_path):
+    datadir = str(tmp_path)
+    one = get_single_date('AAPL', '20240604', datadir)
+    assert list(one.columns) == ['symbol', 'size', 'price', 'trade_id']
+    assert one.index.tolist() == day_trades(archive, '20240604', 'AAPL')['ts'].tolist()
+    assert (one['symbol'] == 'AAPL').all()
+
+    week = get_daterange('20240603', '20240605', 'MSFT', datadir)
+    assert week['trade_id'].tolist() == expected(archive, 'MSFT', DATES[:3], 'trade_id').tolist()
+    assert week['ts'].iloc[0] == np.datetime64(int(week.index[0]), 'ns')
+
+
+def test_date_strings():
+    assert date_strings('2024-02-28', '20240301') == ['20240228', '20240229', '20240301']
@@ -0,0 +1,129 @@
+import gzip
+import struct
+
+import numpy as np
+import pytest
+
+from data.pcap_io import CAPTURE_SPAN, MAX_CAPLEN, iter_packet_blocks, scan_records
+from data.tops import decode_trades, iter_trade_batches
+from tests.iex_fixtures import capture, pcapng, sample_trades
+
+BLOCK_SIZE = 2 * MAX_CAPLEN
+
+
+@pytest.fixture
+def big_capture():
+    # spans several blocks so records straddle block boundaries
+    return capture(sample_trades(12000), per_packet=5)
+
+
+def test_mapped_blocks_cover_every_trade(tmp_path, big_capture):
+    path = tmp_path / 'day.pcap'
+    path.write_bytes(big_capture)
+    batches = list(iter_trade_batches(str(path), block_size=BLOCK_SIZE))
+
+    assert len(batches) > 1
+    assert np.array_equal(np.concatenate(batches), decode_trades(big_capture))
+
+
+def test_gzip_blocks_cover_every_trade(tmp_path, big_capture):
+    path = tmp_path / 'day.pcap.gz'
+    # two gzip members, as produced by concatenating captures
+    half = len(big_capture) // 2
+    path.write_bytes(gzip.compress(big_capture[:half]) + gzip.compress(big_capture[half:]))
+    batches = list(iter_trade_batches(str(path), block_size=BLOCK_SIZE))
+
+    assert len(batches) > 1
+    assert np.array_equal(np.concatenate(batches), decode_trades(big_capture))
+
+
+def test_block_base_is_capture_offset(tmp_path):
+    data = capture(sample_trades(9000), per_packet=2, fmt=pcapng)
+    plain, packed = tmp_path / 'day.pcap', tmp_path / 'day.pcap.gz'
+    plain.write_bytes(data)
+    packed.write_bytes(gzip.compress(data))
+
+    for path in (plain, packed):
+        for view, offsets, lengths, base in iter_packet_blocks(str(path), BLOCK_SIZE):
+            first, last = offsets[0], offsets[-1] + lengths[-1]
+            assert bytes(view[first:last]) == data[base + first:base + last]
+
+
+def test_blocks_resume_at_record_boundary(tmp_path, big_capture):
+    plain, packed = tmp_path / 'day.pcap', tmp_path / 'day.pcap.gz'
+    plain.write_bytes(big_capture)
+    packed.write_bytes(gzip.compress(big_capture))
+
+    for path in (plain, packed):
+        blocks = [(bytes(view), base) for view, _, _, base in iter_packet_blocks(str(path), BLOCK_SIZE)]
+        view, base = blocks[1]
+        resumed = [(bytes(v), b) for v, _, _, b in iter_packet_blocks(str(path), BLOCK_SIZE, start=base)]
+        assert resumed[0][1] == base
+        assert b''.join(v for v, _ in resumed) == big_capture[base:]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.pcap'
+    path.write_bytes(b'')
+    assert list(iter_packet_blocks(str(path))) == []
+
+
+def test_block_size_too_small(tmp_path):
+    with pytest.raises(ValueError):
+        iter_packet_blocks(str(tmp_path / 'day.pcap'), block_size=1024)
+
+
+def records(payloads, endian='<', ts0=1718631000):
+    '''pcap records (no file header) around the given payloads.'''
+    return b''.join(struct.pack(endian + 'IIII', ts0 + ts, 0, len(p), len(p)) + p
+                    for ts, p in payloads)
+
+
+def walk(buf, endian):
+    '''Reference record walk, one header at a time.'''
+    pos, offsets, lengths = 0, [], []
+    while pos + 16 <= len(buf):
+        caplen = struct.unpack_from(endian + 'I', buf, pos + 8)[0]
+        if pos + 16 + caplen > len(buf):
+            break
+        offsets.append(pos + 16)
+        lengths.append(caplen)
+        pos += 16 + caplen
+    return offsets, lengths, pos
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+def test_scan_records_matches_header_walk(endian):
+    rng = np.random.default_rng(7)
+    payloads = []
+    for i in range(400):
+        body = rng.integers(0, 256, int(rng.integers(0, 90)), dtype=np.uint8).tobytes()
+        if i % 3 == 0:
+            # a payload that looks like a record header
+            body = struct.pack(endian + 'IIII', 1718631000, 0, 20, 20) + body
+        if i % 50 == 0:
+            body = bytes(30)
+        # a few records far enough away in time to miss the candidate test
+        ts = 2 * CAPTURE_SPAN if i % 97 == 5 else i
+        payloads.append((ts, body))
+    buf = records(payloads, endian)
+
+    for cut in (len(buf), len(buf) - 1, len(buf) - 30, 5000, 17, 3):
+        offsets, lengths, end = scan_records(memoryview(buf[:cut]), ('pcap', endian))
+        expected = walk(buf[:cut], endian)
+        assert (offsets.tolist(), lengths.tolist(), end) == expected
+
+
+def test_scan_records_resumes_at_pos():
+    buf = records([(i, bytes(i)) for i in range(40)])
+    pos = 16 * 10 + sum(range(10))
+    offsets, lengths, end = scan_records(buf, ('pcap', '<'), pos)
+    assert offsets[0] == pos + 16 and lengths.tolist() == list(range(10, 40))
+    assert end == len(buf)
+
+
+def test_scan_records_rejects_corrupt_header():
+    buf = records([(0, b'x' * 10), (1, b'y' * 10)])
+    corrupt = buf[:26] + struct.pack('<IIII', 0, 0, MAX_CAPLEN + 1, 0) + buf[42:]
+    with pytest.raises(ValueError, match='offset 26'):
+        scan_records(corrupt, ('pcap', '<'))
@@ -0,0 +1,96 @@
+import functools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import models.registry
+from models.indicators import ewma, macd
+from models.registry import Indicators
+from utils.ohlc import PRICE_SCALE, as_prices, trade_bars
+
+
+def bars(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    ts = 1718631000000000000 + np.cumsum(rng.integers(1, 2 * 10**9, n * 20))
+    price = (100 + np.cumsum(rng.normal(0, 0.02, len(ts)))).astype('f4')
+    size = rng.integers(1, 500, len(ts)).astype('i4')
+    return trade_bars(ts, price, size, '1min')
+
+
+def test_shared_emas_are_computed_once(monkeypatch):
+    calls = []
+    ema = models.registry.INDICATORS['ema']
+
+    @functools.wraps(ema)
+    def counted(*args):
+        calls.append(args[1:])
+        return ema(*args)
+
+    monkeypatch.setitem(models.registry.INDICATORS, 'ema', counted)
+    indicators = Indicators(bars())
+    for long in (20, 26, 30):
+        for signal in (5, 9):
+            indicators('macd', 12, long, signal)
+    indicators('ema', 12)
+    assert sorted(calls) == [(12, None, 'close'), (20, None, 'close'), (26, None, 'close'),
+                             (30, None, 'close')]
+
+
+def test_macd_matches_kernel():
+    closes = bars()['close']
+    got = Indicators(closes)('macd')
+    for a, b in zip(got, macd(closes, 12, 26, 9)):
+        assert np.array_equal(a, b)
+
+
+def test_ticks_become_float64_prices():
+    series = bars(seed=3)
+    # one trade per bar, at its close, in ticks
+    ticks = trade_bars(series['ts'], as_prices(series['close'], ticks=True), series['volume'], '1min')
+    indicators = Indicators(ticks)
+    assert indicators.column('close').dtype == np.float64
+    assert np.array_equal(indicators.column('close'), ticks['close'] / PRICE_SCALE)
+    for a, b in zip(indicators('macd'), macd(ticks['close'] / PRICE_SCALE, 12, 26, 9)):
+        assert np.array_equal(a, b)
+    assert np.array_equal(Indicators(ticks['close'])('ema', 12), indicators('ema', 12))
+
+
+def test_macd_grid_matches_each_combination():
+    closes = bars(seed=1)['close']
+    params, macd_lines, signal_lines, histograms = Indicators(closes).macd_grid(
+        range(3, 15, 3), range(10, 40, 5), (5, 9, 16))
+    assert len(params) == len(macd_lines) == 4 * 6 * 3 - 3  # 12 is not below 10
+    assert (params['short'] < params['long']).all()
+    for row in range(0, len(params), 7):
+        short, long, signal = params[row]
+        want = macd(closes, short, long, signal)
+        for got, expected in zip((macd_lines, signal_lines, histograms), want):
+            assert np.array_equal(got[row], expected)
+
+
+def test_other_indicators():
+    series = bars(seed=2)
+    indicators = Indicators(series)
+    close = series['close'].astype('f8')
+
+    middle, upper, lower = indicators('bollinger', 20, 2.0)
+    rolled = pd.Series(close).rolling(20)
+    assert np.allclose(middle[19:], rolled.mean()[19:])
+    assert np.allclose(upper[19:], (rolled.mean() + 2 * rolled.std(ddof=0))[19:])
+
+    rsi = indicators('rsi', 14)
+    assert np.isnan(rsi[0]) and ((rsi[1:] >= 0) & (rsi[1:] <= 100)).all()
+
+    previous = np.r_[close[0], close[:-1]]
+    high, low = series['high'].astype('f8'), series['low'].astype('f8')
+    ranges = np.maximum(high - low, np.maximum(abs(high - previous), abs(low - previous)))
+    assert np.allclose(indicators('atr', 14), ewma(ranges, 14, 1 / 14))
+
+    weights = series['volume']
+    assert indicators('vwap')[-1] == pytest.approx(np.average(series['vwap'], weights=weights))
+
+    with pytest.raises(ValueError):
+        indicators('nope')
+    with pytest.raises(ValueError):
+        Indicators(close)('atr')
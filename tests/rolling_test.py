@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import linregress
+
+from models.rolling import last_window_stats, rolling_stats
+from models.segments import pack
+
+
+def walk(n, seed=0, dtype='f8'):
+    rng = np.random.default_rng(seed)
+    return (100 + np.cumsum(rng.normal(0, 1, n))).astype(dtype)
+
+
+def reference(series, window, j):
+    y = series[max(0, j - window + 1):j + 1].astype('f8')
+    fit = linregress(np.arange(len(y)), y) if len(y) > 1 else None
+    return y, fit
+
+
+@pytest.mark.parametrize('window', [2, 5, 30])
+def test_rolling_matches_direct_fits(window):
+    series = walk(2000)
+    stats = rolling_stats(series, window)
+    for j in list(range(window + 2)) + list(range(100, 2000, 97)):
+        y, fit = reference(series, window, j)
+        assert stats['count'][j] == len(y)
+        assert stats['mean'][j] == pytest.approx(y.mean(), rel=1e-12)
+        assert stats['std'][j] == pytest.approx(y.std(), rel=1e-7, abs=1e-9)
+        if fit is None:
+            assert np.isnan(stats['slope'][j]) and np.isnan(stats['r2'][j])
+            continue
+        assert stats['slope'][j] == pytest.approx(fit.slope, rel=1e-7, abs=1e-9)
+        assert stats['intercept'][j] == pytest.approx(fit.intercept, rel=1e-9)
+        assert stats['r2'][j] == pytest.approx(fit.rvalue ** 2, rel=1e-6, abs=1e-9)
+        assert stats['zscore'][j] == pytest.approx((y[-1] - y.mean()) / y.std(), rel=1e-6)
+
+
+def test_rolling_mean_std_match_pandas():
+    series = walk(5000, seed=1, dtype='f4')
+    stats = rolling_stats(series, 20)
+    rolled = pd.Series(series.astype('f8')).rolling(20)
+    assert np.allclose(stats['mean'][19:], rolled.mean()[19:], rtol=1e-12)
+    assert np.allclose(stats['std'][19:], rolled.std(ddof=0)[19:], rtol=1e-7)
+
+
+def test_windows_stay_within_segments():
+    pieces = [walk(n, seed) for seed, n in enumerate([0, 1, 4, 50, 0, 300])]
+    values, offsets = pack(pieces)
+    stats = rolling_stats(values, 8, offsets)
+    last = last_window_stats(values, offsets, 8)
+    for i, piece in enumerate(pieces):
+        alone = rolling_stats(piece, 8)
+        for name in alone:
+            assert np.allclose(stats[name][offsets[i]:offsets[i + 1]], alone[name], equal_nan=True)
+        if len(piece) == 0:
+            assert last['count'][i] == 0 and np.isnan(last['slope'][i])
+        else:
+            assert last['slope'][i] == pytest.approx(alone['slope'][-1], nan_ok=True)
+
+
+def test_constant_series():
+    stats = rolling_stats(np.full(10, 3.5), 4)
+    assert (stats['slope'][1:] == 0).all() and (stats['r2'][1:] == 0).all()
+    assert np.isnan(stats['zscore']).all()
+
+
+def test_segments_do_not_see_earlier_prices():
+    # a long run near $600k packed ahead of a $0.50 series
+    rng = np.random.default_rng(4)
+    big = 600000 + np.cumsum(rng.normal(0, 50, 2_000_000))
+    small = 0.5 + np.cumsum(rng.normal(0, 0.001, 400))
+    values, offsets = pack([big, small])
+    alone = rolling_stats(small, 5)
+    stats = rolling_stats(values, 5, offsets)
+    for name in alone:
+        assert np.allclose(stats[name][offsets[1]:], alone[name], rtol=1e-9, equal_nan=True)
+    tail = small[-5:]
+    last = last_window_stats(values, offsets, 5)
+    assert last['slope'][1] == pytest.approx(linregress(range(5), tail).slope, rel=1e-9)
+    assert last['zscore'][1] == pytest.approx((tail[-1] - tail.mean()) / tail.std(), rel=1e-9)
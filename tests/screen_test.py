@@ -0,0 +1,123 @@
+import h5py
+import numpy as np
+import pytest
+from scipy.stats import linregress
+
+import data.cache
+import models.screen
+from data.cache import ArrayCache
+from data.catalog import build_catalog
+from data.compact import compact
+from data.load import universe_bars
+from models.indicators import macd
+from models.screen import macd_setup, screen
+from tests.compact_test import archive
+from utils.hdf5_handler import TRADE_RECORD_DTYPE, TradeWriter, build_day_bars, read_bars
+from utils.ohlc import as_prices, prices
+
+DATES = ['20240603', '20240604', '20240605', '20240701']
+SYMBOLS = ['AAPL', 'MSFT', 'TSLA']
+
+
+def reference_screen(template, symbols, interval, min_slope=0.0):
+    # what filter_symbols_for_macd did one symbol at a time
+    ranked = []
+    for symbol in symbols:
+        days = []
+        for date in DATES:
+            with h5py.File(template.format(date), 'r') as h5f:
+                bars = read_bars(h5f, symbol, interval)
+            if bars is not None:
+                days.append(bars)
+        if not days:
+            continue
+        # the screen reads closes as ticks and runs its indicators in float64
+        closes = prices(as_prices(np.concatenate(days)['close'], ticks=True))
+        macd_line, signal_line, _ = macd(closes)
+        if macd_line[-1] < 0 and signal_line[-1] < 0:
+            recent = macd_line[-5:]
+            slope = linregress(range(len(recent)), recent).slope
+            if slope > min_slope and macd_line[-1] < signal_line[-1]:
+                ranked.append((symbol, slope))
+    return sorted(ranked, key=lambda x: x[1], reverse=True)
+
+
+@pytest.fixture
+def universe(tmp_path):
+    # random walks, so some symbols pass the screen and some do not
+    template = str(tmp_path / '{}.h5')
+    symbols = [f'S{i:03d}' for i in range(60)]
+    rng = np.random.default_rng(0)
+    for date in DATES:
+        start = np.datetime64(f'{date[:4]}-{date[4:6]}-{date[6:]}T13:30').astype('M8[ns]').astype('i8')
+        with h5py.File(template.format(date), 'w') as h5f:
+            with TradeWriter(h5f) as writer:
+                for symbol in symbols[:len(symbols) - int(date[-1])]:
+                    trades = np.zeros(300, dtype=TRADE_RECORD_DTYPE)
+                    trades['ts'] = start + np.arange(300) * 10 * 10**9
+                    trades['size'] = 100
+                    trades['price'] = 50 + np.cumsum(rng.normal(0, 0.1, 300))
+                    writer.append(f'/trades/{symbol}', trades)
+            build_day_bars(h5f)
+    return template, symbols
+
+
+@pytest.mark.parametrize('compacted', [False, True])
+def test_universe_bars_matches_day_reads(archive, compacted):
+    expected = {}
+    for symbol in SYMBOLS:
+        days = []
+        for date in DATES:
+            with h5py.File(archive.format(date), 'r') as h5f:
+                if f'trades/{symbol}' in h5f:
+                    days.append(read_bars(h5f, symbol, '1min'))
+        if days:
+            expected[symbol] = np.concatenate(days)
+    build_catalog(str(archive).rsplit('/', 1)[0])
+    if compacted:
+        compact(archive, DATES[:3], '202406')
+
+    got = universe_bars(SYMBOLS, DATES, archive, '1min')
+    assert sorted(got) == sorted(expected) == ['AAPL', 'MSFT']
+    for symbol, bars in expected.items():
+        assert np.array_equal(got[symbol], bars)
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_screen_matches_per_symbol_reference(universe, monkeypatch, workers):
+    template, symbols = universe
+    monkeypatch.setattr(models.screen, 'MIN_SHARD', 1)
+    want = reference_screen(template, symbols, '1min', min_slope=0.0)
+    assert want, 'fixture should pass some symbols'
+
+    got = screen(symbols, ('2024-06-03', '2024-07-01'), template, '1min',
+                 predicate=macd_setup(min_slope=0.0), workers=workers)
+    assert [s for s, _ in got] == [s for s, _ in want]
+    assert [v for _, v in got] == pytest.approx([v for _, v in want], rel=1e-9)
+
+    top = screen(symbols, ('2024-06-03', '2024-07-01'), template, '1min',
+                 predicate=macd_setup(min_slope=0.0), top=2, workers=workers)
+    assert top == got[:2]
+
+
+def test_screen_custom_predicate_and_ranking(universe):
+    template, symbols = universe
+    got = screen(symbols + ['NONE'], ('2024-06-03', '2024-07-01'), template, '1min',
+                 predicate=lambda summary: summary['histogram'] > 0, rank_by='macd')
+    values = [v for _, v in got]
+    assert values == sorted(values, reverse=True)
+    assert 'NONE' not in [s for s, _ in got]
+
+
+def test_repeated_screen_reads_bars_from_cache(universe, monkeypatch):
+    template, symbols = universe
+    cache = ArrayCache()
+    monkeypatch.setattr(data.cache, 'CACHE', cache)
+    args = (symbols, ('2024-06-03', '2024-07-01'), template, '1min')
+    first = screen(*args, predicate=macd_setup(min_slope=0.0), workers=1)
+    misses = cache.stats()['misses']
+    assert misses > 0 and cache.stats()['hits'] == 0
+
+    monkeypatch.setattr(h5py, 'File', None)     # no file is opened the second time
+    assert screen(*args, predicate=macd_setup(min_slope=0.0), workers=1) == first
+    assert cache.stats()['misses'] == misses and cache.stats()['hits'] == misses
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from scipy.stats import linregress
+
+from models.indicators import macd
+from models.segments import macd_summary, pack, segment_last, segment_macd, segment_slope
+
+
+def ragged_closes(lengths, dtype='f4', seed=0):
+    rng = np.random.default_rng(seed)
+    return [(50 + np.cumsum(rng.normal(0, 0.2, n))).astype(dtype) for n in lengths]
+
+
+LENGTHS = [0, 1, 2, 3, 5, 17, 64, 65, 200, 0, 1000, 7]
+
+
+def test_pack_offsets():
+    values, offsets = pack(ragged_closes([3, 0, 2]))
+    assert offsets.tolist() == [0, 3, 3, 5]
+    assert values.dtype == np.float32 and len(values) == 5
+    values, offsets = pack([], dtype='f4')
+    assert offsets.tolist() == [0] and values.dtype == np.float32
+
+
+@pytest.mark.parametrize('dtype', ['f4', 'f8'])
+def test_segment_macd_matches_each_series_alone(dtype):
+    closes = ragged_closes(LENGTHS, dtype)
+    values, offsets = pack(closes)
+    flat = segment_macd(values, offsets)
+    for i, series in enumerate(closes):
+        segment = slice(offsets[i], offsets[i + 1])
+        for got, want in zip(flat, macd(series)):
+            assert np.array_equal(got[segment], want)
+
+
+def test_segment_last_and_slope():
+    closes = ragged_closes(LENGTHS, 'f8', seed=3)
+    values, offsets = pack(closes)
+    last = segment_last(values, offsets)
+    slope = segment_slope(values, offsets, window=5)
+    for i, series in enumerate(closes):
+        if len(series) == 0:
+            assert np.isnan(last[i])
+        else:
+            assert last[i] == series[-1]
+        if len(series) < 2:
+            assert np.isnan(slope[i])
+        else:
+            tail = series[-5:]
+            assert slope[i] == pytest.approx(linregress(range(len(tail)), tail).slope, rel=1e-9)
+
+
+def test_macd_summary_all_empty():
+    summary = macd_summary(*pack([np.empty(0, 'f4')] * 3))
+    assert all(len(column) == 3 and np.isnan(column).all() for column in summary.values())
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from data.pcap_io import read_pcap_header, scan_records
+from data.tops import MESSAGE_TYPES, TICK_TRADE_DTYPE, TRADE_DTYPE, decode_messages, decode_trades
+from tests.iex_fixtures import (capture, frame, official_price, pcap, pcapng,
+                                quote_update, sample_trades, segment, trade_report)
+
+
+def test_decode_trades_matches_wire_values():
+    trades = sample_trades(10)
+    decoded = decode_trades(capture(trades))
+
+    assert decoded.dtype == TRADE_DTYPE
+    assert len(decoded) == 10
+    assert decoded['ts'].tolist() == [t[0] for t in trades]
+    assert decoded['symbol'].tolist() == [t[1].encode() for t in trades]
+    assert decoded['size'].tolist() == [t[2] for t in trades]
+    assert np.allclose(decoded['price'], [t[3] / 10000 for t in trades])
+    assert decoded['trade_id'].tolist() == [t[4] for t in trades]
+
+
+def test_decode_trades_keeps_ticks():
+    trades = sample_trades(10)
+    buf = capture(trades)
+    decoded = decode_trades(buf, ticks=True)
+    assert decoded.dtype == TICK_TRADE_DTYPE
+    assert decoded['price'].tolist() == [t[3] for t in trades]
+
+    offsets, lengths, _ = scan_records(buf, *read_pcap_header(buf))
+    batch = decode_messages(buf, offsets, lengths, ['trade_report'], ticks=True)['trade_report']
+    assert batch['price'].tolist() == [t[3] for t in trades]
+
+
+def test_decode_trades_pcapng_and_vlan():
+    trades = sample_trades(4)
+    frames = [frame(segment([trade_report(*t)], i + 1, t[0]), vlan=bool(i % 2))
+              for i, t in enumerate(trades)]
+
+    for fmt in (pcap, pcapng):
+        decoded = decode_trades(fmt(frames))
+        assert decoded['trade_id'].tolist() == [t[4] for t in trades]
+
+
+def test_decode_trades_skips_other_messages():
+    trades = sample_trades(2)
+    heartbeat = segment([], 1, 0)
+    system_event = b'S' + b'O' + (0).to_bytes(8, 'little')
+    mixed = segment([system_event, trade_report(*trades[0]), system_event,
+                     trade_report(*trades[1])], 1, trades[0][0])
+    decoded = decode_trades(pcap([frame(heartbeat), frame(mixed)]))
+
+    assert decoded['trade_id'].tolist() == [t[4] for t in trades]
+
+
+def test_decode_trades_empty_capture():
+    assert len(decode_trades(pcap([]))) == 0
+
+
+def test_decode_trades_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        decode_trades(b'\x00' * 64)
+
+
+def mixed_capture():
+    trades = sample_trades(6)
+    messages = []
+    for i, t in enumerate(trades):
+        messages.append(quote_update(t[0] - 1, t[1], 100, t[3] - 100, t[3] + 100, 200))
+        messages.append(trade_report(*t))
+    messages.append(official_price(trades[-1][0] + 1, 'AAPL', 1250000))
+    frames = [frame(segment(messages[i:i + 4], i + 1, trades[0][0]))
+              for i in range(0, len(messages), 4)]
+    return trades, pcap(frames)
+
+
+def test_decode_messages_per_type_batches():
+    trades, buf = mixed_capture()
+    offsets, lengths, _ = scan_records(buf, *read_pcap_header(buf))
+    batches = decode_messages(buf, offsets, lengths)
+
+    assert set(batches) == set(MESSAGE_TYPES)
+    quotes = batches['quote_update']
+    assert quotes['symbol'].tolist() == [t[1].encode() for t in trades]
+    assert np.allclose(quotes['ask_price'], [(t[3] + 100) / 10000 for t in trades])
+    assert batches['trade_report']['trade_id'].tolist() == [t[4] for t in trades]
+    assert batches['trade_report']['seq'].tolist() == [2, 4, 6, 8, 10, 12]
+    assert batches['official_price']['official_price'].tolist() == [125.0]
+    assert len(batches['system_event']['timestamp']) == 0
+
+
+def test_decode_messages_type_and_symbol_pushdown():
+    trades, buf = mixed_capture()
+    offsets, lengths, _ = scan_records(buf, *read_pcap_header(buf))
+    batches = decode_messages(buf, offsets, lengths,
+                              types={'quote_update', 'official_price'}, symbols=['AAPL', 'BRK.B'])
+
+    assert set(batches) == {'quote_update', 'official_price'}
+    assert set(batches['quote_update']['symbol'].tolist()) == {b'AAPL', b'BRK.B'}
+    assert len(batches['official_price']['symbol']) == 1
+    assert len(decode_trades(buf, symbols=['MSFT'])) == 2
+    assert len(decode_trades(buf, symbols=[])) == 0
+
+
+def test_decode_messages_rejects_unknown_type():
+    _, buf = mixed_capture()
+    offsets, lengths, _ = scan_records(buf, *read_pcap_header(buf))
+    with pytest.raises(ValueError):
+        decode_messages(buf, offsets, lengths, types={'order_book'})
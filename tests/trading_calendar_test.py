@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from utils.ohlc import BarBuilder, ohlcv_bars, roll_up, trade_bars
+from utils.trading_calendar import (early_closes, holidays, session_bounds, session_buckets,
+                                    session_dates, trading_days)
+
+
+def ns(text):
+    return np.datetime64(text, 'ns').astype('i8')
+
+
+def test_holidays_and_early_closes():
+    assert sorted(holidays(2024)) == [
+        '2024-01-01', '2024-01-15', '2024-02-19', '2024-03-29', '2024-05-27', '2024-06-19',
+        '2024-07-04', '2024-09-02', '2024-11-28', '2024-12-25']
+    assert sorted(early_closes(2024)) == ['2024-07-03', '2024-11-29', '2024-12-24']
+    # New Year's Day 2022 fell on a Saturday: no holiday on Friday 2021-12-31
+    assert '2021-12-31' not in holidays(2021) and '2021-12-24' in holidays(2021)
+    assert len(trading_days('2024-01-01', '2024-12-31')) == 252
+    assert session_dates('2024-06-28', '2024-07-08') == [
+        '20240628', '20240701', '20240702', '20240703', '20240705', '20240708']
+
+
+def test_session_bounds_follow_dst_and_early_closes():
+    opens, closes = session_bounds('2024-03-08', '2024-03-11')
+    # 9:30 New York is 14:30 UTC before the change to daylight time, 13:30 after
+    assert opens.tolist() == [ns('2024-03-08T14:30'), ns('2024-03-11T13:30')]
+    _, closes = session_bounds('2024-07-03', '2024-07-03', 'extended')
+    assert closes.tolist() == [ns('2024-07-03T21:00')]
+    with pytest.raises(ValueError):
+        session_bounds('2024-07-03', '2024-07-03', 'overnight')
+
+
+def test_session_buckets_start_at_the_open():
+    ts = np.array([ns('2024-07-02T13:29'), ns('2024-07-02T13:30'), ns('2024-07-02T14:29:59'),
+                   ns('2024-07-02T14:30'), ns('2024-07-02T19:59'), ns('2024-07-02T20:00'),
+                   ns('2024-07-03T16:59'), ns('2024-07-03T17:00'), ns('2024-07-04T15:00')])
+    hourly = session_buckets(ts, '1h')
+    assert hourly.tolist() == [-1, ns('2024-07-02T13:30'), ns('2024-07-02T13:30'),
+                               ns('2024-07-02T14:30'), ns('2024-07-02T19:30'), -1,
+                               ns('2024-07-03T16:30'), -1, -1]
+    daily = session_buckets(ts, '1d')
+    assert daily.tolist() == [-1] + [ns('2024-07-02T13:30')] * 4 + [-1, ns('2024-07-03T13:30'), -1, -1]
+    assert session_buckets(ts[:1], '1h', 'extended').tolist() == [ns('2024-07-02T13:00')]
+
+
+@pytest.mark.parametrize('interval', ['5min', '1h', '2h', '4h', '1d'])
+@pytest.mark.parametrize('hours', ['regular', 'extended'])
+def test_session_bars_roll_up_from_minutes(interval, hours):
+    rng = np.random.default_rng(0)
+    ts = np.sort(rng.integers(ns('2024-06-28T07:00'), ns('2024-07-09T01:00'), 50000))
+    price = (100 + np.cumsum(rng.normal(0, 0.01, len(ts)))).astype('f4')
+    size = rng.integers(1, 100, len(ts)).astype('i4')
+
+    bars = ohlcv_bars(ts, price, size, interval, hours)
+    assert np.array_equal(roll_up(ohlcv_bars(ts, price, size, '1min', None), interval, hours), bars)
+    assert bars['volume'].sum() == size[session_buckets(ts, interval, hours) >= 0].sum()
+    opens, closes = session_bounds('2024-06-28', '2024-07-09', hours)
+    session = np.searchsorted(opens, bars['ts'], side='right') - 1
+    assert (bars['ts'] < closes[session]).all()
+    if interval == '1d':
+        assert bars['ts'].tolist() == opens[opens < ts.max()].tolist()
+    assert np.array_equal(trade_bars(ts, price, size, interval, hours)['close'], bars['close'])
+
+
+def test_bar_builders_default_to_regular_sessions():
+    rng = np.random.default_rng(1)
+    ts = np.sort(rng.integers(ns('2024-06-28T07:00'), ns('2024-07-09T01:00'), 20000))
+    price = (100 + np.cumsum(rng.normal(0, 0.01, len(ts)))).astype('f4')
+    size = rng.integers(1, 100, len(ts)).astype('i4')
+    opens, _ = session_bounds('2024-06-28', '2024-07-09')
+
+    # one '1d' bar per session, starting at its open
+    for daily in (ohlcv_bars(ts, price, size, '1d'), trade_bars(ts, price, size, '1d'),
+                  BarBuilder('1d').add(ts, price, size)):
+        assert daily['ts'][:5].tolist() == opens[:5].tolist()
+    daily = trade_bars(ts, price, size, '1d')
+    assert daily['ts'].tolist() == opens[opens < ts.max()].tolist()
+    # hourly bars start on the half hour of the open, none before it
+    hourly = ohlcv_bars(ts, price, size, '1h')
+    assert hourly['ts'][0] == opens[0] and (hourly['ts'] % (30 * 60 * 10**9) == 0).all()
+    assert (hourly['ts'] % (60 * 60 * 10**9) != 0).all()
@@ -1,121 +1,481 @@
 from datetime import datetime
-from collections import defaultdict
 import pandas as pd
 import numpy as np
 import h5py
 
-def get_single_date(symbol, date, datadir='/srv/b/h5'):
-    # Open a single HDF5 file and access the "symbol" group
-    with h5py.File('{}/{}.h5'.format(datadir, date), 'r') as hfile:
-        # Access the dataset for 'AAPL' inside the 'trades' group
-        aapl_data = hfile['trades'][f'{symbol}']
-
-        # Convert the dataset to a list of tuples
-        data = [tuple(row) for row in aapl_data]
-
-        # Convert the list of tuples into a DataFrame
-
-        # elements after the first one for columns
-        df = pd.DataFrame([row[1:] for row in data],
-                          # first element (timestamp) as the index
-                          index=[row[0] for row in data],
-                          # Specify column names
-                          columns=['symbol', 'size', 'price', 'trade_id']
-                         )
-
-        df['symbol'] = df['symbol'].str.decode('utf-8')
-        return df
-
-def get_daterange(start,end):
-    test_files = [
-        '/srv/b/h5/20241007.h5',
-        '/srv/b/h5/20241008.h5',
-        '/srv/b/h5/20241009.h5',
-        '/srv/b/h5/20241010.h5',
-        '/srv/b/h5/20241011.h5']
-    
-    # Initialize an empty list to hold DataFrames
-    dfs = []
-    
-    # Loop through each file and extract the data for 'AAPL'
-    for file in files:
-        with h5py.File(file, 'r') as hfile:
-            symbol_data = hfile['trades'][f'{symbol}']
-            data = [tuple(row) for row in symbol_data]
-    
-            # Create a DataFrame for the current file's data
-            df = pd.DataFrame([row[1:] for row in data],
-                              index=[row[0] for row in data],
-                              columns=['symbol', 'size', 'price', 'trade_id']
-                             )
-            df['symbol'] = df['symbol'].str.decode('utf-8')
-            dfs.append(df)
-    
-    # Concatenate all the DataFrames from different files
-    final_df = pd.concat(dfs)
-    
-    # Sort the DataFrame by index (timestamp) if needed
-    final_df = final_df.sort_index()
-    final_df['ts'] = final_df.index.map(lambda x: datetime.fromtimestamp(x/1000000000))
-    
-    print(final_df)
-    return final_df
-
-
-# Optimized HDF5 writer with batch writes
-def trades_to_hdf5(tradeparser, h5filepath, batch_size=1000):
-    print(f'Starting trades_to_hdf5: {datetime.now()}')
+from utils.ohlc import INTERVAL_NS, PRICE_SCALE, bar_pyramid
+
+# Day file layout, recorded in the root 'format_version' attribute.
+#   1: /trades/{symbol} is one compound (ts, symbol, size, price, trade_id)
+#      dataset, unchunked and uncompressed (files without the attribute)
+#   2: /trades/{symbol} is a group holding one chunked, compressed dataset
+#      per column, so a scan of ts and price never reads size or trade_id
+FORMAT_VERSION = 2
+TRADE_COLUMNS = {
+    'ts': 'i8',
+    'size': 'i4',
+    'price': 'f4',
+    'trade_id': 'i8',
+}
+TRADE_RECORD_DTYPE = np.dtype(list(TRADE_COLUMNS.items()))
+
+# Fixed-point day files, marked by a root 'price_scale' attribute, store
+# price as the wire's int64 ticks of 1 / price_scale: exact at any price,
+# and integer columns shuffle and compress better than f4. A file holds
+# one kind of price or the other.
+PRICE_SCALE_ATTR = 'price_scale'
+TICK_COLUMNS = dict(TRADE_COLUMNS, price='i8')
+TICK_RECORD_DTYPE = np.dtype(list(TICK_COLUMNS.items()))
+
+def trade_columns(ticks=False):
+    return TICK_COLUMNS if ticks else TRADE_COLUMNS
+
+def has_ticks(h5f):
+    """True when an open day file or store holds prices in ticks."""
+    return PRICE_SCALE_ATTR in h5f.attrs
+
+def set_price_mode(h5f, ticks):
+    """Mark an open file as holding ticks or float prices, refusing to mix
+    the two in a file that already has trades."""
+    if 'trades' in h5f and len(h5f['trades']) and has_ticks(h5f) != ticks:
+        kind = 'ticks' if has_ticks(h5f) else 'float prices'
+        raise ValueError(f'{h5f.filename} holds {kind}, not {"ticks" if ticks else "float prices"}')
+    if ticks:
+        h5f.attrs[PRICE_SCALE_ATTR] = PRICE_SCALE
+    elif PRICE_SCALE_ATTR in h5f.attrs:
+        del h5f.attrs[PRICE_SCALE_ATTR]
+
+# Up to 32k rows, 256 KiB of int64, per chunk: big enough for lzf and
+# sequential reads, small enough for h5py's default 1 MiB chunk cache.
+# Symbols with few rows get smaller chunks, as most of the universe trades a
+# few hundred times a day. Appended columns are sized by their first write,
+# so writers rechunk them for their final rows when they close.
+CHUNK_ROWS = 1 << 15
+MIN_CHUNK_ROWS = 1 << 9
+RECHUNK_ROWS = 1 << 20     # rows copied at a time when rechunking
+COLUMN_OPTIONS = dict(maxshape=(None,), compression='lzf', shuffle=True)
+
+# The newer chunk indexes cost a fraction of the v1 B-trees per dataset,
+# which matters with four datasets for each of ~10k symbols a day
+LIBVER = 'latest'
+
+# Sidecar in each symbol group holding the ts of every 4096th row, so a time
+# range read touches two 4096-row stretches of ts plus the rows it returns
+TS_INDEX = 'ts_index'
+TS_INDEX_STRIDE = 1 << 12
+
+def chunk_rows(rows):
+    return int(np.clip(1 << max(int(rows) - 1, 0).bit_length(), MIN_CHUNK_ROWS, CHUNK_ROWS))
+
+def _load_frame(start, end, symbol, datadir, start_ts, end_ts):
+    # data.load builds on this module, so it is imported here
+    from data.load import date_strings, load_trades, trades_frame
 
-    # Buffer to hold trades for each symbol before batch write
-    trade_buffers = defaultdict(list)
+    columns = load_trades(symbol, date_strings(start, end), datadir + '/{}.h5',
+                          columns=tuple(TRADE_COLUMNS), start_ts=start_ts, end_ts=end_ts)
+    df = trades_frame(columns, index='ts')
+    df.insert(0, 'symbol', symbol)
+    return df, columns
 
-    with h5py.File(h5filepath, 'a') as h5f:
-        for trade in tradeparser:
-            ts, symbol, size, price, trade_id = trade
-            symbol_group = f'/trades/{symbol}'
+def get_single_date(symbol, date, datadir='/srv/b/h5', start_ts=None, end_ts=None):
+    # Bulk read the symbol's columns, optionally just the trades with
+    # start_ts <= ts < end_ts, indexed by timestamp
+    return _load_frame(date, date, symbol, datadir, start_ts, end_ts)[0]
 
-            # Append trade to the buffer for the symbol
-            trade_buffers[symbol_group].append((ts, symbol, size, price, trade_id))
+def get_daterange(start, end, symbol, datadir='/srv/b/h5', start_ts=None, end_ts=None):
+    # As get_single_date over start..end (YYYYMMDD), plus the timestamps
+    # as datetime64 in a 'ts' column
+    df, columns = _load_frame(start, end, symbol, datadir, start_ts, end_ts)
+    df['ts'] = columns['ts'].view('M8[ns]')
+    return df
 
-            # If buffer reaches batch size, write to HDF5
-            if len(trade_buffers[symbol_group]) >= batch_size:
-                write_trades_to_dataset(h5f, symbol_group, trade_buffers[symbol_group])
-                trade_buffers[symbol_group].clear()  # Clear buffer after writing
 
-        # Write any remaining data in the buffer to HDF5
-        for symbol_group, trades in trade_buffers.items():
-            if trades:  # Only write if buffer is not empty
-                write_trades_to_dataset(h5f, symbol_group, trades)
+# Optimized HDF5 writer with bounded, amortized batch writes; with ticks
+# the parser yields prices as int64 ticks. Like ingest_capture, the day file
+# is finished with its bar pyramid and recorded in the directory's catalog.
+def trades_to_hdf5(tradeparser, h5filepath, buffer_bytes=None, ticks=False):
+    # data.catalog builds on this module, so it is imported here
+    from data.catalog import update_catalog
+
+    print(f'Starting trades_to_hdf5: {datetime.now()}')
+
+    with h5py.File(h5filepath, 'a', libver=LIBVER) as h5f:
+        with TradeWriter(h5f, buffer_bytes or DEFAULT_BUFFER_BYTES, ticks) as writer:
+            for ts, symbol, size, price, trade_id in tradeparser:
+                writer.append_row(f'/trades/{symbol}', (ts, size, price, trade_id))
+        build_day_bars(h5f)
+    update_catalog(h5filepath)
 
     print(f'Finished trades_to_hdf5: {datetime.now()}')
 
+# Buffered writes: ~20 bytes a trade, so 256 MiB holds ~13M trades across
+# all symbols before the largest buffers are written out
+DEFAULT_BUFFER_BYTES = 256 << 20
+INITIAL_BUFFER_ROWS = 64
+MAX_BUFFER_ROWS = 1 << 20
+
+class TradeWriter:
+    """
+    Per-symbol trade buffers over an open day file.
+
+    Buffers are preallocated TRADE_RECORD_DTYPE (with ticks,
+    TICK_RECORD_DTYPE) arrays that double as they fill, up to
+    MAX_BUFFER_ROWS, when they are written out. Whenever the
+    buffers together hold more than buffer_bytes the largest are written
+    and released until they fit in half of it, so memory stays bounded
+    however many symbols trade. Column datasets grow geometrically rather
+    than by each write, and close() trims them to the rows written.
+    """
+    def __init__(self, h5f, buffer_bytes=DEFAULT_BUFFER_BYTES, ticks=False):
+        set_price_mode(h5f, ticks)
+        self.h5f = h5f
+        self.dtype = TICK_RECORD_DTYPE if ticks else TRADE_RECORD_DTYPE
+        self.buffer_bytes = buffer_bytes
+        self.buffers = {}   # symbol_group -> [array, rows used]
+        self.buffered = 0   # bytes allocated across buffers
+        self.rows = {}      # symbol_group -> rows on disk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    def reserve(self, symbol_group, n):
+        """
+        Buffer for symbol_group with room for n more rows.
+        """
+        entry = self.buffers.get(symbol_group)
+        if entry is None:
+            entry = self.buffers[symbol_group] = [np.empty(0, dtype=self.dtype), 0]
+        buf, used = entry
+        if used + n > len(buf) and used and used + n > MAX_BUFFER_ROWS:
+            # written out, the buffer is empty again and may already fit n
+            self.write(symbol_group)
+            buf, used = entry
+        if used + n > len(buf):
+            capacity = max(INITIAL_BUFFER_ROWS, len(buf))
+            while capacity < used + n:
+                capacity *= 2
+            grown = np.empty(capacity, dtype=self.dtype)
+            grown[:used] = buf[:used]
+            self.buffered += grown.nbytes - buf.nbytes
+            entry[0] = buf = grown
+            if self.buffered > self.buffer_bytes:
+                self.spill(keep=symbol_group)
+        return entry
+
+    def append_row(self, symbol_group, trade):
+        entry = self.reserve(symbol_group, 1)
+        entry[0][entry[1]] = trade
+        entry[1] += 1
+
+    def append(self, symbol_group, trades):
+        if trades.dtype['price'].kind != self.dtype['price'].kind:
+            raise ValueError(f'Writer takes {self.dtype["price"]} prices, got {trades.dtype["price"]}')
+        trades = np.asarray(trades, dtype=self.dtype)
+        entry = self.reserve(symbol_group, len(trades))
+        entry[0][entry[1]:entry[1] + len(trades)] = trades
+        entry[1] += len(trades)
+
+    def spill(self, keep=None):
+        """
+        Write out and release the largest buffers, by bytes allocated,
+        until they fit in half the budget.
+        """
+        for symbol_group in sorted(self.buffers, key=lambda g: self.buffers[g][0].nbytes, reverse=True):
+            if self.buffered <= self.buffer_bytes // 2:
+                break
+            if symbol_group != keep:
+                self.write(symbol_group)
+                self.buffered -= self.buffers.pop(symbol_group)[0].nbytes
+
+    def write(self, symbol_group):
+        """
+        Append the buffered rows of symbol_group to its column datasets.
+        """
+        entry = self.buffers[symbol_group]
+        buf, used = entry
+        if not used:
+            return
+        if symbol_group not in self.h5f:
+            write_trades_to_dataset(self.h5f, symbol_group, buf[:used])
+            self.rows[symbol_group] = used
+        else:
+            group = self.h5f[symbol_group]
+            rows = self.rows.setdefault(symbol_group, trade_rows(self.h5f, symbol_group))
+            capacity = group['ts'].shape[0]
+            if rows + used > capacity:
+                capacity = max(rows + used, 2 * capacity)
+                for name in TRADE_COLUMNS:
+                    group[name].resize(capacity, axis=0)
+            for name in TRADE_COLUMNS:
+                group[name][rows:rows + used] = buf[name][:used]
+            self.rows[symbol_group] = rows + used
+        entry[1] = 0
+
+    def flush(self):
+        """
+        Write every buffer, keeping their memory for reuse.
+        """
+        for symbol_group in self.buffers:
+            self.write(symbol_group)
+
+    def close(self):
+        """
+        Flush, then trim the datasets written to their row counts, rechunk
+        them for those rows and update their ts indexes.
+        """
+        self.flush()
+        for symbol_group, rows in self.rows.items():
+            truncate_trades(self.h5f, symbol_group, rows)
+            rechunk_trades(self.h5f, symbol_group)
+            build_ts_index(self.h5f, symbol_group)
+        self.buffers.clear()
+        self.buffered = 0
+
+# Decoded trade batches (see data.tops.TRADE_DTYPE) grouped for writing
+def split_by_symbol(batch):
+    """
+    Yield (symbol, trades) with trades in TRADE_RECORD_DTYPE, or
+    TICK_RECORD_DTYPE for a batch of ticks, keeping the time order of each
+    symbol.
+    """
+    if len(batch) == 0:
+        return
+    # 8-byte symbols sort as integers much faster than as strings
+    keys = np.ascontiguousarray(batch['symbol']).view('<u8')
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+
+    symbols = batch['symbol'][order[starts]]
+
+    dtype = TICK_RECORD_DTYPE if batch['price'].dtype.kind in 'iu' else TRADE_RECORD_DTYPE
+    records = np.empty(len(batch), dtype=dtype)
+    for name in dtype.names:
+        records[name] = batch[name][order]
+
+    for symbol, start, end in zip(symbols, starts, ends):
+        yield symbol.decode(), records[start:end]
+
+def format_version(h5f):
+    """
+    Layout version of an open day file; files that predate the attribute
+    are version 1.
+    """
+    default = 1 if 'trades' in h5f else FORMAT_VERSION
+    return int(h5f.attrs.get('format_version', default))
+
 def write_trades_to_dataset(h5f, symbol_group, trades):
     """
-    Helper function to write a batch of trades to HDF5 dataset.
+    Helper function to append a batch of trades to the column datasets of
+    symbol_group, prices as the file holds them (see has_ticks).
     """
     # Convert trades to structured NumPy array
-    trade_array = np.array(trades, dtype=[
-        ('ts', 'i8'),
-        ('symbol', 'S10'),
-        ('size', 'i4'),
-        ('price', 'f4'),
-        ('trade_id', 'i8')
-    ])
+    columns = trade_columns(has_ticks(h5f))
+    trade_array = np.asarray(trades)
+    if trade_array.dtype.names and trade_array['price'].dtype.kind != np.dtype(columns['price']).kind:
+        raise ValueError(f'{h5f.filename} holds {"ticks" if has_ticks(h5f) else "float prices"}, '
+                         f'got {trade_array["price"].dtype} prices')
+    trade_array = np.asarray(trade_array, dtype=np.dtype(list(columns.items())))
 
     if symbol_group in h5f:
-        # Dataset exists, append data
-        dataset = h5f[symbol_group]
-        current_size = dataset.shape[0]
-        dataset.resize(current_size + trade_array.shape[0], axis=0)
-        dataset[current_size:] = trade_array
+        # Group exists, append to every column
+        group = h5f[symbol_group]
+        current_size = group['ts'].shape[0]
+        for name in TRADE_COLUMNS:
+            group[name].resize(current_size + len(trade_array), axis=0)
+            group[name][current_size:] = trade_array[name]
+    else:
+        if format_version(h5f) != FORMAT_VERSION:
+            raise ValueError(f'{h5f.filename} is format {format_version(h5f)}, '
+                             f'convert it with convert_to_columnar first')
+        h5f.attrs['format_version'] = FORMAT_VERSION
+        group = h5f.create_group(symbol_group)
+        chunks = (chunk_rows(len(trade_array)),)
+        for name, dtype in columns.items():
+            group.create_dataset(name, data=trade_array[name], dtype=dtype,
+                                 chunks=chunks, **COLUMN_OPTIONS)
+
+def trade_rows(h5f, symbol_group):
+    """
+    Number of trades stored under symbol_group, in either layout.
+    """
+    node = h5f[symbol_group]
+    return node.shape[0] if isinstance(node, h5py.Dataset) else node['ts'].shape[0]
+
+def truncate_trades(h5f, symbol_group, rows):
+    """
+    Drop every trade of symbol_group after the first rows.
+    """
+    node = h5f[symbol_group]
+    if isinstance(node, h5py.Dataset):
+        node.resize(rows, axis=0)
+        return
+    for name in TRADE_COLUMNS:
+        node[name].resize(rows, axis=0)
+    if TS_INDEX in node:
+        node[TS_INDEX].resize(-(-rows // TS_INDEX_STRIDE), axis=0)
+
+def rechunk_trades(h5f, symbol_group):
+    """
+    Rewrite the columns of symbol_group with chunks sized for the rows they
+    hold, when their first write sized them for fewer (or more). Columns
+    are copied RECHUNK_ROWS at a time and replaced one by one, so the space
+    of each is free for the next.
+    """
+    group = h5f[symbol_group]
+    rows = group['ts'].shape[0]
+    chunks = (chunk_rows(rows),)
+    if group['ts'].chunks == chunks:
+        return
+    for name in TRADE_COLUMNS:
+        column = group[name]
+        new = group.create_dataset(f'{name}.new', shape=column.shape, dtype=column.dtype,
+                                   chunks=chunks, **COLUMN_OPTIONS)
+        for start in range(0, rows, RECHUNK_ROWS):
+            new[start:start + RECHUNK_ROWS] = column[start:start + RECHUNK_ROWS]
+        del group[name]
+        group.move(f'{name}.new', name)
+
+def rechunk_all_trades(h5f):
+    """
+    Rechunk the columns of every symbol of a columnar day file for their
+    rows (see rechunk_trades).
+    """
+    for symbol in h5f.get('trades', {}):
+        rechunk_trades(h5f, f'/trades/{symbol}')
+
+def build_ts_index(h5f, symbol_group):
+    """
+    Write the ts of every TS_INDEX_STRIDE-th row of symbol_group next to its
+    columns. Entries never change once written, so an index is extended
+    only when appends have crossed a stride boundary.
+    """
+    group = h5f[symbol_group]
+    ts = group['ts']
+    entries = -(-ts.shape[0] // TS_INDEX_STRIDE)
+    if TS_INDEX in group:
+        index = group[TS_INDEX]
+        if index.shape[0] == entries:
+            return
+        del group[TS_INDEX]
+    group.create_dataset(TS_INDEX, data=ts[::TS_INDEX_STRIDE], maxshape=(None,))
+
+def build_ts_indexes(h5f):
+    """
+    Bring the ts index of every symbol of a columnar day file up to date.
+    """
+    for symbol in h5f.get('trades', {}):
+        build_ts_index(h5f, f'/trades/{symbol}')
+
+def row_range(h5f, symbol, start_ts=None, end_ts=None):
+    """
+    (first, stop) rows of symbol with start_ts <= ts < end_ts, in ns.
+
+    With a current ts index only the (at most two) stride blocks holding
+    the bounds are read; without one the whole ts column is.
+    """
+    node = h5f[f'trades/{symbol}']
+    rows = trade_rows(h5f, f'/trades/{symbol}')
+    if isinstance(node, h5py.Dataset):
+        ts = node.fields('ts')[:]
+        bound = lambda value: int(np.searchsorted(ts, value, side='left'))
+    elif TS_INDEX not in node or node[TS_INDEX].shape[0] != -(-rows // TS_INDEX_STRIDE):
+        ts = node['ts'][:]
+        bound = lambda value: int(np.searchsorted(ts, value, side='left'))
     else:
-        # Create dataset if it does not exist
-        h5f.create_dataset(
-            symbol_group,
-            data=trade_array,
-            maxshape=(None,),
-            dtype=trade_array.dtype
-        )
+        index = node[TS_INDEX][:]
+        def bound(value):
+            block = int(np.searchsorted(index, value, side='left'))
+            if block == 0:
+                return 0
+            first = (block - 1) * TS_INDEX_STRIDE
+            stop = min(block * TS_INDEX_STRIDE, rows)
+            return first + int(np.searchsorted(node['ts'][first:stop], value, side='left'))
+
+    first = 0 if start_ts is None else bound(start_ts)
+    stop = rows if end_ts is None else bound(end_ts)
+    return first, max(first, stop)
+
+def read_trades(h5f, symbol, columns=tuple(TRADE_COLUMNS), start_ts=None, end_ts=None):
+    """
+    {column: array} of one symbol's trades, reading only the requested
+    columns from a version 2 file, and with start_ts/end_ts (ns) only the
+    rows with start_ts <= ts < end_ts. Prices come as stored, int64 ticks
+    in a fixed-point file.
+    """
+    node = h5f[f'trades/{symbol}']
+    rows = slice(*row_range(h5f, symbol, start_ts, end_ts)) \
+        if start_ts is not None or end_ts is not None else slice(None)
+    if isinstance(node, h5py.Dataset):
+        return {name: node.fields(name)[rows] for name in columns}
+    return {name: node[name][rows] for name in columns}
+
+def convert_to_columnar(src_filepath, dst_filepath):
+    """
+    Rewrite a format 1 day file in the current columnar layout.
+    """
+    with h5py.File(src_filepath, 'r') as src, h5py.File(dst_filepath, 'w', libver=LIBVER) as dst:
+        dst.attrs.update(src.attrs)
+        dst.attrs['format_version'] = FORMAT_VERSION
+        for symbol in src.get('trades', {}):
+            columns = read_trades(src, symbol)
+            trades = np.empty(len(columns['ts']), dtype=TRADE_RECORD_DTYPE)
+            for name in TRADE_COLUMNS:
+                trades[name] = columns[name]
+            write_trades_to_dataset(dst, f'/trades/{symbol}', trades)
+        build_ts_indexes(dst)
+
+def index_day_file(h5filepath):
+    """
+    Add or update the ts indexes of an existing columnar day file.
+    """
+    with h5py.File(h5filepath, 'a', libver=LIBVER) as h5f:
+        build_ts_indexes(h5f)
+
+def write_bars(h5f, symbol, pyramid):
+    """
+    Store {interval: bars} as /bars/{interval}/{symbol}, replacing any
+    bars already there.
+    """
+    for interval, bars in pyramid.items():
+        path = f'/bars/{interval}/{symbol}'
+        if path in h5f:
+            del h5f[path]
+        h5f.create_dataset(path, data=bars)
+
+def read_bars(h5f, symbol, interval):
+    """
+    OHLCV bars (see utils.ohlc.BAR_DTYPE, or TICK_BAR_DTYPE in a
+    fixed-point file) of one symbol, or None when the day file has none at
+    that interval.
+    """
+    if interval not in INTERVAL_NS:
+        raise ValueError(f'Unsupported interval {interval}')
+    dataset = h5f.get(f'bars/{interval}/{symbol}')
+    return None if dataset is None else dataset[:]
+
+def build_day_bars(h5f):
+    """
+    Build the bar pyramid of every symbol from its stored trades.
+    """
+    for symbol in h5f.get('trades', {}):
+        trades = read_trades(h5f, symbol, ('ts', 'price', 'size'))
+        write_bars(h5f, symbol, bar_pyramid(trades['ts'], trades['price'], trades['size']))
+
+def rebuild_bars(h5filepath):
+    """
+    Rebuild the bars of an existing day file, e.g. one ingested before bars
+    were written or after a change to the intervals.
+    """
+    with h5py.File(h5filepath, 'a', libver=LIBVER) as h5f:
+        if 'bars' in h5f:
+            del h5f['bars']
+        build_day_bars(h5f)
 
 def show_h5py_hdf5(filepath):
     with h5py.File(filepath, 'r') as hfile:
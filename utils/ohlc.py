@@ -1,7 +1,263 @@
 import pandas as pandas
+import numpy as np
 
-def get_ohlc(df):
-   return
+NS_PER_MINUTE = 60 * 10**9
+
+# Bar intervals in nanoseconds. '1d' is the 390 minute regular session
+# length; its bars are whole sessions (see SESSION_INTERVALS).
+INTERVAL_NS = {
+    '1min': NS_PER_MINUTE,
+    '5min': 5 * NS_PER_MINUTE,
+    '10min': 10 * NS_PER_MINUTE,
+    '30min': 30 * NS_PER_MINUTE,
+    '1h': 60 * NS_PER_MINUTE,
+    '2h': 120 * NS_PER_MINUTE,
+    '4h': 240 * NS_PER_MINUTE,
+    '1d': 390 * NS_PER_MINUTE,
+}
+
+# Intervals that do not divide the half hour the regular session opens on.
+# Fixed lengths from the epoch would cut their bars across the session (an
+# hour from 9:00, a '1d' from 1970), so they are stored and built from
+# buckets of the STORED_HOURS sessions instead; the shorter intervals from
+# the epoch line up with every session.
+SESSION_INTERVALS = frozenset(interval for interval, length in INTERVAL_NS.items()
+                              if 30 * NS_PER_MINUTE % length)
+STORED_HOURS = 'regular'
+
+# ts is the start of the bar's interval
+BAR_DTYPE = np.dtype([
+    ('ts', 'i8'),
+    ('open', 'f4'),
+    ('high', 'f4'),
+    ('low', 'f4'),
+    ('close', 'f4'),
+    ('volume', 'i8'),
+])
+
+# BAR_DTYPE plus the number of trades and their volume weighted price
+TRADE_BAR_DTYPE = np.dtype(BAR_DTYPE.descr + [('count', 'i8'), ('vwap', 'f8')])
+
+# Fixed-point prices are int64 ticks of 1 / PRICE_SCALE, as on the wire.
+# Bars of ticks keep every price field in ticks (vwap too, as the exact
+# notional over volume); prices become floats only for indicators and
+# display, through prices() and float_bars().
+PRICE_SCALE = 10000
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'vwap')
+TICK_BAR_DTYPE = np.dtype([(name, 'i8' if name in PRICE_FIELDS else dtype)
+                           for name, dtype in BAR_DTYPE.descr])
+TICK_TRADE_BAR_DTYPE = np.dtype(TICK_BAR_DTYPE.descr + [('count', 'i8'), ('vwap', 'f8')])
+
+def interval_ns(interval):
+    """Length of a named bar interval in nanoseconds."""
+    try:
+        return INTERVAL_NS[interval]
+    except KeyError:
+        raise ValueError(f'Unsupported interval {interval}') from None
+
+def is_ticks(values):
+    """True for fixed-point prices (or bars of them)."""
+    values = np.asarray(values)
+    if values.dtype.names:
+        values = values['close']
+    return values.dtype.kind in 'iu'
+
+def as_prices(values, ticks=False):
+    """Prices as int64 ticks or, without ticks, as BAR_DTYPE floats,
+    converting only those held the other way."""
+    values = np.asarray(values)
+    if is_ticks(values) == ticks:
+        return values
+    if ticks:
+        return np.rint(values.astype(np.float64) * PRICE_SCALE).astype(np.int64)
+    return (values / PRICE_SCALE).astype(BAR_DTYPE['close'])
+
+def prices(values):
+    """float64 prices of float prices or ticks, for indicators."""
+    values = np.asarray(values)
+    return values / PRICE_SCALE if is_ticks(values) else values.astype(np.float64, copy=False)
+
+def as_bars(bars, ticks=False):
+    """Bars (or trade bars) with prices as ticks or as floats."""
+    if is_ticks(bars) == ticks:
+        return bars
+    trade = 'count' in bars.dtype.names
+    dtype = (TICK_TRADE_BAR_DTYPE if trade else TICK_BAR_DTYPE) if ticks \
+        else (TRADE_BAR_DTYPE if trade else BAR_DTYPE)
+    out = np.empty(len(bars), dtype=dtype)
+    for name in dtype.names:
+        if name == 'vwap':
+            out[name] = bars[name] * PRICE_SCALE if ticks else bars[name] / PRICE_SCALE
+        elif name in PRICE_FIELDS:
+            out[name] = as_prices(bars[name], ticks)
+        else:
+            out[name] = bars[name]
+    return out
+
+def float_bars(bars):
+    """Bars with float prices, for display."""
+    return as_bars(bars, ticks=False)
+
+def _bucket_starts(buckets):
+    return np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+
+def _buckets(ts, interval, hours=None):
+    """(bucket start ns of each timestamp, mask of those in a bucket or None
+    for all): buckets of the hours ('regular' or 'extended') trading
+    sessions (see utils.trading_calendar), which the bar builders default to
+    regular, or with hours None fixed lengths from the epoch."""
+    ts = np.asarray(ts)
+    if hours is None:
+        length = interval_ns(interval)
+        return ts // length * length, None
+    from utils.trading_calendar import session_buckets
+    buckets = session_buckets(ts, interval, hours)
+    return buckets, buckets >= 0
+
+def stored_hours(interval):
+    """Session hours of the bars stored at interval, None for fixed lengths
+    from the epoch."""
+    return STORED_HOURS if interval in SESSION_INTERVALS else None
+
+def bar_starts(ts, interval, hours=None):
+    """Start (ns) of the bar holding each timestamp, the timestamp itself
+    for those outside the sessions with hours."""
+    buckets, keep = _buckets(ts, interval, hours)
+    return buckets if keep is None else np.where(keep, buckets, ts)
+
+def _reduce(buckets, open_, high, low, close, volume, starts=None):
+    """Bars from per-row values, already in time order, grouped by bucket
+    start; TICK_BAR_DTYPE for prices in ticks."""
+    if starts is None:
+        starts = _bucket_starts(buckets)
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    bars = np.empty(len(starts), dtype=TICK_BAR_DTYPE if is_ticks(close) else BAR_DTYPE)
+    bars['ts'] = buckets[starts]
+    bars['open'] = open_[starts]
+    bars['high'] = np.maximum.reduceat(high, starts)
+    bars['low'] = np.minimum.reduceat(low, starts)
+    bars['close'] = close[ends]
+    bars['volume'] = np.add.reduceat(volume, starts, dtype=np.int64)
+    return bars
+
+def ohlcv_bars(ts, price, size, interval='1min', hours='regular'):
+    """OHLCV bars of time ordered trades, one per session bucket (see
+    _buckets) that traded, leaving out trades outside the sessions; with
+    hours None one per fixed length interval from the epoch."""
+    buckets, keep = _buckets(ts, interval, hours)
+    if keep is not None:
+        buckets, price, size = buckets[keep], np.asarray(price)[keep], np.asarray(size)[keep]
+    if len(buckets) == 0:
+        return np.empty(0, dtype=TICK_BAR_DTYPE if is_ticks(price) else BAR_DTYPE)
+    return _reduce(buckets, price, price, price, price, size)
+
+def roll_up(bars, interval, hours='regular'):
+    """Coarser bars from finer ones: session buckets from 1min bars, or
+    with hours None fixed lengths from bars whose interval divides
+    interval."""
+    buckets, keep = _buckets(bars['ts'], interval, hours)
+    if keep is not None:
+        buckets, bars = buckets[keep], bars[keep]
+    if len(bars) == 0:
+        return np.empty(0, dtype=bars.dtype)
+    return _reduce(buckets, bars['open'], bars['high'], bars['low'], bars['close'], bars['volume'])
+
+def bar_pyramid(ts, price, size):
+    """{interval: bars} for every interval in INTERVAL_NS, session buckets
+    for SESSION_INTERVALS (see stored_hours).
+
+    Only the 1min bars are built from the trades; every interval and
+    session open is a whole number of minutes, so the rest roll up exactly
+    from those."""
+    minutes = ohlcv_bars(ts, price, size, '1min', hours=None)
+    return {interval: minutes if interval == '1min' else
+            roll_up(minutes, interval, stored_hours(interval))
+            for interval in INTERVAL_NS}
+
+def _trade_bars(ts, price, size, interval, hours=None):
+    """(TRADE_BAR_DTYPE bars, notional per bar) of time ordered trades, or
+    with prices in ticks TICK_TRADE_BAR_DTYPE bars and exact int64 notional."""
+    buckets, keep = _buckets(ts, interval, hours)
+    price = np.asarray(price)
+    if keep is not None:
+        buckets, price, size = buckets[keep], price[keep], np.asarray(size)[keep]
+    ticks = is_ticks(price)
+    dtype, notional_dtype = (TICK_TRADE_BAR_DTYPE, np.int64) if ticks \
+        else (TRADE_BAR_DTYPE, np.float64)
+    if len(buckets) == 0:
+        return np.empty(0, dtype=dtype), np.empty(0, dtype=notional_dtype)
+    starts = _bucket_starts(buckets)
+    bars = np.empty(len(starts), dtype=dtype)
+    ohlcv = _reduce(buckets, price, price, price, price, size, starts)
+    for name in BAR_DTYPE.names:
+        bars[name] = ohlcv[name]
+    bars['count'] = np.diff(np.r_[starts, len(buckets)])
+    notional = np.add.reduceat(np.multiply(price, size, dtype=notional_dtype), starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bars['vwap'] = notional / bars['volume']
+    return bars, notional
+
+def trade_bars(ts, price, size, interval='1min', hours='regular'):
+    """OHLCV bars with trade count and VWAP of time ordered trades, one per
+    session bucket that traded (per fixed interval from the epoch with
+    hours None), in one pass of segmented reductions."""
+    return _trade_bars(ts, price, size, interval, hours)[0]
+
+class BarBuilder:
+    """Trade bars of a stream of time ordered trade chunks.
+
+    add() returns the bars completed by a chunk and holds back the last
+    one, which the next chunk may still extend; close() returns it. The
+    bars of all chunks together are trade_bars() of all the trades. With
+    ticks the chunks' prices are int64 ticks and the carried notional is
+    exact."""
+
+    def __init__(self, interval='1min', hours='regular', ticks=False):
+        interval_ns(interval)     # an unknown interval fails here, not on a chunk
+        self.interval, self.hours = interval, hours
+        self.dtype, self.notional_dtype = (TICK_TRADE_BAR_DTYPE, np.int64) if ticks \
+            else (TRADE_BAR_DTYPE, np.float64)
+        self.partial = np.empty(0, dtype=self.dtype)
+        self.notional = np.empty(0, dtype=self.notional_dtype)
+
+    def add(self, ts, price, size):
+        bars, notional = _trade_bars(ts, price, size, self.interval, self.hours)
+        if len(bars) == 0:
+            return bars
+        if len(self.partial):
+            if self.partial['ts'][0] == bars['ts'][0]:
+                first, partial = bars[0], self.partial[0]
+                first['open'] = partial['open']
+                first['high'] = max(first['high'], partial['high'])
+                first['low'] = min(first['low'], partial['low'])
+                first['volume'] += partial['volume']
+                first['count'] += partial['count']
+                notional[0] += self.notional[0]
+                first['vwap'] = notional[0] / first['volume']
+            else:
+                bars = np.concatenate([self.partial, bars])
+                notional = np.concatenate([self.notional, notional])
+        self.partial, self.notional = bars[-1:].copy(), notional[-1:].copy()
+        return bars[:-1]
+
+    def close(self):
+        partial = self.partial
+        self.partial = np.empty(0, dtype=self.dtype)
+        self.notional = np.empty(0, dtype=self.notional_dtype)
+        return partial
+
+def get_ohlc(df, interval='1min', hours='regular'):
+    """Trade bars of a trades DataFrame as a DataFrame indexed by bar start.
+
+    df holds price and, optionally, size (each trade counts 1 without it),
+    with its ts in a 'ts' column or the index, as ns or datetime64. Prices
+    in ticks come out as floats."""
+    ts = np.asarray(df['ts'] if 'ts' in df else df.index)
+    ts = ts.view('i8') if ts.dtype.kind == 'M' else ts.astype('i8', copy=False)
+    size = df['size'].to_numpy() if 'size' in df else np.ones(len(df), dtype=np.int64)
+    bars = float_bars(trade_bars(ts, df['price'].to_numpy(), size, interval, hours))
+    return pandas.DataFrame({name: bars[name] for name in TRADE_BAR_DTYPE.names if name != 'ts'},
+                            index=pandas.DatetimeIndex(bars['ts'].view('M8[ns]'), name='ts'))
 
 if __name__ == '__main__':
     pass
@@ -10,6 +10,7 @@ def terminal_interface():
 
     parser.add_argument('--filepath', type=str)
     parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--buffer-mb', type=int, help="Trade buffer budget for --save-to-hdf5")
     parser.add_argument('--h5-filepath', type=str)
     parser.add_argument('--pcap-filepath', type=str)
 
@@ -29,6 +30,32 @@ def terminal_interface():
     parser.add_argument('--save-to-hdf5', action='store_true')
     parser.add_argument('--save', action='store_true')
 
+    # bulk ingest of a directory or glob of daily captures
+    parser.add_argument('--bulk-ingest', type=str, help="Directory or glob of pcap(.gz) files")
+    parser.add_argument('--h5-template', type=str, default='/srv/b/h5/{}.h5',
+                        help="Day file path with {} replaced by YYYYMMDD")
+    parser.add_argument('--workers', type=int, help="Worker processes, default all CPUs")
+    parser.add_argument('--symbols', type=str, help="Comma separated symbols to keep")
+    parser.add_argument('--ticks', action='store_true',
+                        help="Store prices as int64 ticks (fixed-point day files)")
+    parser.add_argument('--build-gzip-index', action='store_true',
+                        help="Write the seek index sidecar for --pcap-filepath")
+
+    # rewrite a version 1 day file in the columnar layout
+    parser.add_argument('--convert-h5', type=str,
+                        help="Write --h5-filepath to this path in the columnar layout")
+    parser.add_argument('--compact', action='store_true',
+                        help="Merge the day files of --h5-template into per-period stores")
+    parser.add_argument('--compact-months', type=int, default=1, help="Months per store")
+    parser.add_argument('--remove-days', action='store_true',
+                        help="Delete day files once they are compacted")
+    parser.add_argument('--build-catalog', type=str,
+                        help="Catalog new or changed day files in this directory")
+    parser.add_argument('--rebuild-bars', type=str,
+                        help="Glob of day files whose OHLCV bars to rebuild")
+    parser.add_argument('--build-ts-index', action='store_true',
+                        help="Add or update the ts indexes of --h5-filepath")
+
     # TODO needs to be enhanced using pytest
     parser.add_argument('--test-args', action='store_true')
     
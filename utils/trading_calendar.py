@@ -0,0 +1,140 @@
+import functools
+
+import numpy as np
+import pandas as pandas
+
+from utils.ohlc import interval_ns
+
+EXCHANGE_TZ = 'America/New_York'
+
+# Session open and close in exchange local (hour, minute), and the close on
+# early close days (13:00 regular, with after hours ending at 17:00)
+SESSION_HOURS = {
+    'regular': ((9, 30), (16, 0)),
+    'extended': ((4, 0), (20, 0)),
+}
+EARLY_CLOSE = {
+    'regular': (13, 0),
+    'extended': (17, 0),
+}
+
+# Unscheduled closures (national days of mourning and the like)
+SPECIAL_CLOSURES = {'2018-12-05', '2025-01-09'}
+
+ONE_DAY = pandas.Timedelta(days=1)
+
+def _nth_weekday(year, month, weekday, n):
+    """The nth (from 1, or -1 for the last) weekday (Monday 0) of a month."""
+    days = pandas.date_range(f'{year}-{month:02d}-01', periods=31, freq='D')
+    days = days[(days.month == month) & (days.weekday == weekday)]
+    return days[n - 1 if n > 0 else n]
+
+def _easter(year):
+    """Easter Sunday of the Gregorian calendar (anonymous algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    h = (19 * a + b - b // 4 - (8 * b + 13) // 25 + 15) % 30
+    l = (32 + 2 * (b % 4) + 2 * (c // 4) - h - c % 4) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    return pandas.Timestamp(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+def _observed(day):
+    """A fixed holiday moved off the weekend: Saturday to Friday, Sunday to Monday."""
+    day = pandas.Timestamp(day)
+    return day - ONE_DAY if day.weekday() == 5 else day + ONE_DAY if day.weekday() == 6 else day
+
+@functools.lru_cache(maxsize=None)
+def holidays(year):
+    """Full day exchange holidays of a year as YYYY-MM-DD strings."""
+    days = [
+        _nth_weekday(year, 1, 0, 3),        # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),        # Washington's Birthday
+        _easter(year) - 2 * ONE_DAY,        # Good Friday
+        _nth_weekday(year, 5, 0, -1),       # Memorial Day
+        _observed(f'{year}-07-04'),
+        _nth_weekday(year, 9, 0, 1),        # Labor Day
+        _nth_weekday(year, 11, 3, 4),       # Thanksgiving
+        _observed(f'{year}-12-25'),
+    ]
+    # New Year's Day on a Saturday is not made up on the Friday before
+    if pandas.Timestamp(f'{year}-01-01').weekday() != 5:
+        days.append(_observed(f'{year}-01-01'))
+    if year >= 2022:
+        days.append(_observed(f'{year}-06-19'))     # Juneteenth
+    closed = {day.strftime('%Y-%m-%d') for day in days}
+    return frozenset(closed | {day for day in SPECIAL_CLOSURES if day.startswith(f'{year}-')})
+
+@functools.lru_cache(maxsize=None)
+def early_closes(year):
+    """Early close days of a year as YYYY-MM-DD strings: the day after
+    Thanksgiving, and July 3 and Christmas Eve when Monday to Thursday."""
+    days = {(_nth_weekday(year, 11, 3, 4) + ONE_DAY).strftime('%Y-%m-%d')}
+    for day in (f'{year}-07-03', f'{year}-12-24'):
+        if pandas.Timestamp(day).weekday() < 4:
+            days.add(day)
+    return frozenset(days - holidays(year))
+
+def _days_of(years, table):
+    return list(set().union(*(table(year) for year in years)))
+
+def trading_days(start_date, end_date):
+    """datetime64[D] array of the sessions from start_date to end_date
+    inclusive (YYYYMMDD or YYYY-MM-DD)."""
+    start, end = pandas.Timestamp(start_date), pandas.Timestamp(end_date)
+    days = pandas.bdate_range(start, end)
+    closed = days.strftime('%Y-%m-%d').isin(_days_of(range(start.year, end.year + 1), holidays))
+    return days[~closed].values.astype('M8[D]')
+
+def session_dates(start_date, end_date):
+    """YYYYMMDD strings of the sessions from start_date to end_date, as
+    day files are named."""
+    return [str(day).replace('-', '') for day in trading_days(start_date, end_date)]
+
+def _exchange_ns(days, hour, minute):
+    """UTC ns of a local time of day on each of days."""
+    local = days.astype('M8[ns]') + np.timedelta64(hour * 60 + minute, 'm')
+    return pandas.DatetimeIndex(local).tz_localize(EXCHANGE_TZ).asi8
+
+@functools.lru_cache(maxsize=64)
+def session_bounds(start_date, end_date, hours='regular'):
+    """(opens, closes): UTC ns of every session from start_date to end_date,
+    for 'regular' or 'extended' hours, with early closes. Computed once per
+    range and shared, so read-only."""
+    try:
+        (open_hour, open_minute), (close_hour, close_minute) = SESSION_HOURS[hours]
+    except KeyError:
+        raise ValueError(f'Unsupported session hours {hours}') from None
+    days = trading_days(start_date, end_date)
+    opens = _exchange_ns(days, open_hour, open_minute)
+    closes = _exchange_ns(days, close_hour, close_minute)
+    years = range(pandas.Timestamp(start_date).year, pandas.Timestamp(end_date).year + 1)
+    early = np.isin(days.astype(str), _days_of(years, early_closes))
+    closes[early] = _exchange_ns(days[early], *EARLY_CLOSE[hours])
+    opens.flags.writeable = closes.flags.writeable = False
+    return opens, closes
+
+def covering_dates(ts):
+    """(start, end) YYYY-MM-DD dates whose sessions cover ns timestamps."""
+    lo, hi = (np.datetime64(int(t), 'ns').astype('M8[D]') for t in (ts.min(), ts.max()))
+    return str(lo - 1), str(hi + 1)
+
+def session_buckets(ts, interval='1min', hours='regular', bounds=None):
+    """Start (UTC ns) of the session bucket of each timestamp, -1 for those
+    outside every session.
+
+    Buckets run from each session's open in steps of interval, the last cut
+    short by the close, and '1d' is the whole session. A single searchsorted
+    over the interleaved open/close boundaries places every timestamp.
+    bounds are session_bounds() covering ts, computed when not given."""
+    ts = np.asarray(ts).astype('i8', copy=False)
+    if len(ts) == 0:
+        return np.empty(0, dtype=np.int64)
+    opens, closes = session_bounds(*covering_dates(ts), hours) if bounds is None else bounds
+    if len(opens) == 0:
+        return np.full(len(ts), -1, dtype=np.int64)
+    slot = np.searchsorted(np.column_stack([opens, closes]).ravel(), ts, side='right')
+    start = opens[np.minimum(slot // 2, len(opens) - 1)]
+    if interval != '1d':
+        length = interval_ns(interval)
+        start = start + (ts - start) // length * length
+    return np.where(slot % 2 == 1, start, -1)